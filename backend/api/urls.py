@@ -3,12 +3,24 @@ from django.urls import path
 from userauths import views as userauths_views
 from store import views as store_views
 
-from rest_framework_simplejwt.views import TokenRefreshView
-
 urlpatterns = [
     path('user/token/', userauths_views.MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('user/token/refresh', TokenRefreshView.as_view(), name='token_refresh'),
+    path('user/token/refresh', userauths_views.MyTokenRefreshView.as_view(), name='token_refresh'),
     path('user/register/', userauths_views.RegisterView.as_view(), name='register'),
     path('user/password-reset/<str:email>/', userauths_views.PasswordEmailVerify.as_view(), name='password_reset'),
-    path('user/password-change/', userauths_views.PasswordChangeView.as_view(), name='password_change')
+    path('user/password-change/', userauths_views.PasswordChangeView.as_view(), name='password_change'),
+
+    # Store
+    path('products/', store_views.ProductListView.as_view(), name='product_list'),
+    path('products/search/', store_views.ProductSearchView.as_view(), name='product_search'),
+    path('products/facets/', store_views.ProductFacetView.as_view(), name='product_facets'),
+    path('products/<slug:slug>/', store_views.ProductDetailView.as_view(), name='product_detail'),
+    path('categories/', store_views.CategoryListView.as_view(), name='category_list'),
+    path('brands/', store_views.BrandListView.as_view(), name='brand_list'),
+    path('cart/<str:cart_id>/', store_views.CartView.as_view(), name='cart'),
+    path('cart/<str:cart_id>/lines/', store_views.CartLineListView.as_view(), name='cart_lines'),
+    path('coupon/<str:code>/', store_views.CouponView.as_view(), name='coupon'),
+    path('checkout/', store_views.CheckoutView.as_view(), name='checkout'),
+    path('payments/webhook/', store_views.PaymentWebhookView.as_view(), name='payment_webhook'),
+    path('images/<int:width>/<str:image_format>/<path:name>', store_views.ImageVariantView.as_view(), name='image_variant'),
 ]
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Cache settings for the backend project, selected from the environment.
+
+CACHE_URL picks the backend:
+
+    locmem://               Per-process memory (default). Fine for a single worker.
+    file:///var/tmp/shop    Files under the given directory, shared by workers on one host.
+    redis://host:6379/0     Any Redis-protocol server (Redis, Valkey, KeyDB, ...);
+    rediss://...            needs the `redis` package.
+
+Environment:
+    CACHE_URL         Backend URL as above (default locmem://).
+    CACHE_TIMEOUT     Default entry lifetime in seconds (default 300).
+    CACHE_KEY_PREFIX  Prefix for every key, to share one server between deployments.
+"""
+
+import os
+from urllib.parse import urlparse
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def cache_config():
+    url = urlparse(os.environ.get('CACHE_URL', 'locmem://'))
+    config = {
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', ''),
+    }
+
+    if url.scheme == 'locmem':
+        config['BACKEND'] = 'django.core.cache.backends.locmem.LocMemCache'
+        config['LOCATION'] = url.netloc or 'default'
+    elif url.scheme == 'file':
+        config['BACKEND'] = 'django.core.cache.backends.filebased.FileBasedCache'
+        config['LOCATION'] = url.path
+    elif url.scheme in ('redis', 'rediss'):
+        config['BACKEND'] = 'django.core.cache.backends.redis.RedisCache'
+        config['LOCATION'] = url.geturl()
+    else:
+        raise ImproperlyConfigured(f"Unsupported CACHE_URL scheme: {url.scheme!r}")
+
+    return {'default': config}
@@ -0,0 +1,54 @@
+"""
+Leased claiming for work queues kept in database tables (userauths'
+OutboundEmail, store's PaymentEvent and ProductImportJob).
+
+A worker claims due rows with a single UPDATE that stamps a batch token in
+`claim` and pushes `next_attempt_at` forward by a lease, so concurrent
+workers never take the same row, and the rows of a worker that died become
+due again when the lease runs out. Failed rows are retried with exponential
+backoff and jitter until they run out of attempts.
+
+Queue models need `claim` (a 32 character CharField) and `next_attempt_at`
+columns; retry_later() also uses `attempts`, `last_error` and `status`.
+"""
+
+import random
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+def backoff(attempts, base, maximum):
+    delay = min(maximum, base * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_due(queryset, size, lease, **changes):
+    """
+    Claim up to `size` due rows of `queryset`, oldest due first, for `lease`
+    seconds, applying `changes` to them in the same UPDATE. Returns a queryset
+    of the claimed rows.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    available = queryset.filter(next_attempt_at__lte=now)
+    due = available.order_by('next_attempt_at').values('pk')[:size]
+    claimed = available.filter(pk__in=due).update(claim=token, next_attempt_at=now + timedelta(seconds=lease), **changes)
+    if not claimed:
+        return queryset.none()
+    return queryset.model._default_manager.filter(claim=token)
+
+
+def retry_later(row, error, max_attempts, base, maximum):
+    """
+    Record a failed attempt on a claimed row whose `attempts` already counts
+    it: schedule the next one, or mark the row failed once `max_attempts` are
+    used up. Returns False when the row was given up on. The caller saves it.
+    """
+    row.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if row.attempts >= max_attempts:
+        row.status = "failed"
+        return False
+    row.next_attempt_at = timezone.now() + backoff(row.attempts, base, maximum)
+    return True
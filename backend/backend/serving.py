@@ -0,0 +1,218 @@
+"""
+Static and media file serving that also works with DEBUG=False.
+
+`serving_urls()` replaces django.conf.urls.static. Files are served from
+STATIC_ROOT and, when media lives on the local disk, from the media storage
+location. Only static names listed in the collectstatic manifest are served,
+so nothing else that ends up under STATIC_ROOT is reachable:
+
+- Hashed static names from the collectstatic manifest and content-addressed
+  media (blobs/, variants/) never change, so they are sent with
+  "Cache-Control: public, max-age=31536000, immutable". Everything else must
+  be revalidated, which ETag / Last-Modified make a cheap 304.
+- The precompressed `.br` / `.gz` siblings written by collectstatic are
+  picked by Accept-Encoding.
+- Single byte ranges are answered with 206 (media players, resumed downloads).
+
+Application workers should not push file bytes in production. With
+FILE_OFFLOAD set, the view only resolves the path and headers and hands the
+transfer to the front server:
+
+    x-accel-redirect  nginx: X-Accel-Redirect: <FILE_OFFLOAD_PREFIX>static/<path>
+                      (or .../media/<path>), mapped with an `internal` location
+                      aliasing STATIC_ROOT / MEDIA_ROOT. Let nginx's
+                      gzip_static / brotli_static pick the encoding.
+    x-sendfile        Apache mod_xsendfile, lighttpd: X-Sendfile: <absolute path>
+
+Without offload, full responses still go through the WSGI server's
+wsgi.file_wrapper, which gunicorn turns into sendfile().
+
+Environment:
+    SERVE_FILES          "0" when the front server serves STATIC_URL/MEDIA_URL itself.
+    FILE_OFFLOAD         x-accel-redirect, x-sendfile or empty (default).
+    FILE_OFFLOAD_PREFIX  Internal nginx location for X-Accel-Redirect (default /protected/).
+"""
+
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from backend.storage import COMPRESSIBLE_RE, IMMUTABLE_CACHE_CONTROL
+
+
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+IMMUTABLE_MEDIA_PREFIXES = ("blobs/", "variants/")
+
+# Content-Encoding and file suffix, in order of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Files that are themselves compressed are sent as archives, not decoded by the client.
+ARCHIVE_TYPES = {'gzip': 'application/gzip', 'bzip2': 'application/x-bzip', 'xz': 'application/x-xz', 'br': 'application/x-brotli'}
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=1)
+def hashed_static_names():
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+@lru_cache(maxsize=1)
+def manifest_static_names():
+    """
+    Every name the manifest knows, original and hashed.
+    """
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {})) | hashed_static_names()
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def byte_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, None to ignore the header, or
+    False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, root, kind, immutable):
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type, archive = mimetypes.guess_type(full_path)
+    if archive:
+        content_type = ARCHIVE_TYPES.get(archive)
+    content_type = content_type or 'application/octet-stream'
+    compressible = COMPRESSIBLE_RE.search(path) is not None
+
+    offload = settings.FILE_OFFLOAD
+    served_path, encoding = full_path, None
+    if compressible and not offload and 'HTTP_RANGE' not in request.META:
+        accepted = accepted_encodings(request)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(full_path + suffix):
+                served_path, encoding = full_path + suffix, coding
+                break
+
+    stat = os.stat(served_path)
+    etag = quote_etag("%x-%x%s" % (int(stat.st_mtime), stat.st_size, "-" + encoding if encoding else ""))
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        response = not_modified
+    elif offload == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f"{settings.FILE_OFFLOAD_PREFIX}{kind}/{path}")
+    elif offload == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = ranged_response(request, served_path, stat, etag, content_type)
+        if response is None:
+            response = FileResponse(open(served_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'none' if encoding else 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    if compressible:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def ranged_response(request, path, stat, etag, content_type):
+    header = request.META.get('HTTP_RANGE')
+    if not header or request.method not in ('GET', 'HEAD'):
+        return None
+    # If-Range: only honour the range when the client's copy is current.
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(stat.st_mtime):
+        return None
+
+    requested = byte_range(header, stat.st_size)
+    if requested is None:
+        return None
+    if requested is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{stat.st_size}"
+        return response
+
+    start, end = requested
+    response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+def serve_static(request, path):
+    if path not in manifest_static_names():
+        raise Http404
+    return serve_file(request, path, settings.STATIC_ROOT, 'static', path in hashed_static_names())
+
+
+def serve_media(request, path):
+    return serve_file(request, path, default_storage.location, 'media', path.startswith(IMMUTABLE_MEDIA_PREFIXES))
+
+
+def url_pattern(prefix, view):
+    return re_path(r'^%s(?P<path>.+)$' % re.escape(prefix.lstrip('/')), view)
+
+
+def serving_urls():
+    """
+    URL patterns for STATIC_URL and, when media is stored on the local disk,
+    MEDIA_URL. Empty with SERVE_FILES off.
+    """
+    if not settings.SERVE_FILES:
+        return []
+    patterns = [url_pattern(settings.STATIC_URL, serve_static)]
+    if isinstance(default_storage, FileSystemStorage):
+        patterns.append(url_pattern(settings.MEDIA_URL, serve_media))
+    return patterns
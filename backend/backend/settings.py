@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from decimal import Decimal
+
+from backend.cache import cache_config
+from backend.storage import storage_config
+from backend.database import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -94,14 +100,22 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Configured from DATABASE_URL; SQLite (WAL mode) when unset. See backend/database.py.
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
 }
 
 
+# Cache
+# Configured from CACHE_URL; local memory when unset. See backend/cache.py.
+
+CACHES = cache_config()
+
+# Lifetime of cached public catalog responses; signals invalidate them earlier.
+CATALOG_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -138,11 +152,50 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_DIRS = [BASE_DIR, 'static']
+STATICFILES_DIRS = [BASE_DIR / 'static']
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media storage; content-addressed files under MEDIA_ROOT when MEDIA_STORAGE_URL
+# is unset. See backend/storage.py.
+STORAGES = storage_config()
+
+# Email
+# Requests queue messages in the outbox; the send_queued_email worker delivers
+# them. See userauths/mail.py. Without EMAIL_BACKEND messages go to the console.
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '0') == '1'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+FROM_EMAIL = os.environ.get('FROM_EMAIL', 'no-reply@localhost')
+DEFAULT_FROM_EMAIL = FROM_EMAIL
+
+# Payment webhooks. Events are stored by the webhook view and applied by the
+# process_payment_events worker. See store/payments.py.
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+PAYMENT_WEBHOOK_TOLERANCE = int(os.environ.get('PAYMENT_WEBHOOK_TOLERANCE', 300))
+
+# Static/media serving without DEBUG, optionally offloaded to the front server.
+# See backend/serving.py.
+SERVE_FILES = os.environ.get('SERVE_FILES', '1') == '1'
+FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', '')
+FILE_OFFLOAD_PREFIX = os.environ.get('FILE_OFFLOAD_PREFIX', '/protected/')
+
+# Image variants rendered for every product, gallery, category and brand image.
+# See store/images.py. With 0 workers variants are rendered inline on commit.
+IMAGE_VARIANT_WIDTHS = [96, 320, 640, 1280]
+IMAGE_VARIANT_FORMATS = ['avif', 'webp', 'jpeg']
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Cart fees. See store/cart.py. Tax rates are percentages by delivery country.
+CART_SERVICE_FEE_RATE = Decimal('0.10')
+CART_TAX_RATES = {}
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 AUTH_USER_MODEL = 'userauths.User'
@@ -0,0 +1,211 @@
+"""
+Media storage for the backend project, selected from the environment.
+
+Uploads are content addressed: a file is stored as
+`blobs/<aa>/<bb>/<sha256 of the content>.<ext>`, whatever the model's
+upload_to says (only its extension is kept). Identical uploads share one
+stored object, and a URL never changes meaning, so it can be cached by
+browsers and CDNs forever. Changing an image produces a new name instead of
+overwriting the old one.
+
+Derived files (image variants, see store.images) go to the "derivatives"
+storage, on the same disk or bucket with the same caching headers. Their
+names are computed from the original's digest, so they are immutable too.
+
+Static files are collected with hashed names (ManifestStaticFilesStorage),
+and compressible ones get precompressed `.gz` and `.br` siblings for
+backend.serving to hand out.
+
+Because objects are shared, deleting a model's file may remove content that
+other rows still point at; blobs should only be cleaned up by a sweep over
+every file field.
+
+MEDIA_STORAGE_URL picks the backend:
+
+    file://                    MEDIA_ROOT on the local disk (default).
+    s3://bucket/optional/path  An S3-compatible bucket (AWS S3, MinIO,
+                               Ceph, moto_server, ...) via django-storages.
+
+Environment:
+    MEDIA_STORAGE_URL      Backend URL as above (default file://).
+    AWS_S3_ENDPOINT_URL    Endpoint of a non-AWS S3 service, e.g. http://localhost:9000.
+    AWS_S3_REGION_NAME     Bucket region.
+    MEDIA_CUSTOM_DOMAIN    Host (CDN) serving the bucket, used in media URLs.
+    AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY are read by boto3 as usual.
+"""
+
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from urllib.parse import urlparse
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+from storages.backends.s3boto3 import S3Boto3Storage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+EXTENSION_RE = re.compile(r"\.[a-z0-9]{1,8}")
+
+COMPRESSIBLE_RE = re.compile(r"\.(css|js|mjs|map|json|svg|txt|html|xml|ico|ttf|otf|eot|wasm)$", re.IGNORECASE)
+
+
+class ContentAddressedStorageMixin:
+    """
+    Name files by the SHA-256 of their content and skip the upload when an
+    object with that name is already stored.
+    """
+    prefix = "blobs"
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        extension = os.path.splitext(name)[1].lower()
+        if not EXTENSION_RE.fullmatch(extension):
+            extension = ""
+        digest = digest.hexdigest()
+        return posixpath.join(self.prefix, digest[:2], digest[2:4], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if not self.exists(name):
+            name = self._save(name, content)
+        return name
+
+
+class ImmutableFileSystemStorage(FileSystemStorage):
+    """
+    Local storage for files whose name determines their content: an existing
+    file is never in the way of a save, it already holds the same bytes.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        # Written to a temporary file and renamed into place, so a concurrent
+        # upload of the same content can never leave a partial file behind.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                for chunk in content.chunks():
+                    destination.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+
+class ImmutableS3Storage(S3Boto3Storage):
+    # Signed URLs change on every request and would defeat caching.
+    querystring_auth = False
+    file_overwrite = True
+    object_parameters = {'CacheControl': IMMUTABLE_CACHE_CONTROL}
+
+
+class ContentAddressedFileSystemStorage(ContentAddressedStorageMixin, ImmutableFileSystemStorage):
+    pass
+
+
+class ContentAddressedS3Storage(ContentAddressedStorageMixin, ImmutableS3Storage):
+    pass
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes `<name>.gz` and, with the `brotli`
+    package installed, `<name>.br` next to every compressible collected file,
+    when that saves at least 5%.
+    """
+    min_size = 256
+
+    # Vendored admin CSS (jazzmin's bootswatch) points at source maps it does
+    # not ship; leave those comments alone instead of failing collectstatic.
+    patterns = tuple(
+        (extension, tuple(pattern for pattern in patterns if 'sourceMappingURL' not in str(pattern)))
+        for extension, patterns in ManifestStaticFilesStorage.patterns
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files) | set(self.hashed_files.values()):
+            if COMPRESSIBLE_RE.search(name) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < self.min_size:
+            return
+        encoders = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for suffix, encode in encoders:
+            if os.path.exists(path + suffix) and os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+                continue
+            compressed = encode(data)
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as destination:
+                    destination.write(compressed)
+
+
+def storage_config():
+    url = urlparse(os.environ.get('MEDIA_STORAGE_URL', 'file://'))
+
+    if url.scheme == 'file':
+        default = {'BACKEND': 'backend.storage.ContentAddressedFileSystemStorage'}
+        derivatives = {'BACKEND': 'backend.storage.ImmutableFileSystemStorage'}
+    elif url.scheme == 's3':
+        if not url.netloc:
+            raise ImproperlyConfigured("MEDIA_STORAGE_URL must name a bucket: s3://bucket/path")
+        options = {
+            'bucket_name': url.netloc,
+            'location': url.path.strip('/'),
+            'endpoint_url': os.environ.get('AWS_S3_ENDPOINT_URL'),
+            'region_name': os.environ.get('AWS_S3_REGION_NAME'),
+            'custom_domain': os.environ.get('MEDIA_CUSTOM_DOMAIN'),
+        }
+        default = {'BACKEND': 'backend.storage.ContentAddressedS3Storage', 'OPTIONS': options}
+        derivatives = {'BACKEND': 'backend.storage.ImmutableS3Storage', 'OPTIONS': options}
+    else:
+        raise ImproperlyConfigured(f"Unsupported MEDIA_STORAGE_URL scheme: {url.scheme!r}")
+
+    return {
+        'default': default,
+        'derivatives': derivatives,
+        'staticfiles': {'BACKEND': 'backend.storage.CompressedManifestStaticFilesStorage'},
+    }
@@ -1,22 +1,35 @@
-from django.contrib import admin
-from store.models import CartOrderItem, CouponUsers, Notification, Product, Tag ,Category, Cart, DeliveryCouriers, CartOrder, Gallery, Brand, ProductFaq, Review,  Specification, Coupon, Color, Size, Address, Wishlist
+from django.contrib import admin, messages
+from django.db import models
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from store.models import CartOrderItem, CartSession, CouponRedemption, CouponUsers, Notification, Product, Tag ,Category, Cart, DeliveryCouriers, CartOrder, Gallery, Brand, PaymentEvent, ProductFaq, ProductImportJob, Review,  Specification, Coupon, Color, Size, Address, Wishlist
 from import_export.admin import ImportExportModelAdmin
 from django import forms
 from userauths.models import User
 from store.models import Vendor
+from store.facets import refresh_products_on_commit
+from store.search import search_product_ids
+
+
+def update_products(queryset, **fields):
+    # update() sends no post_save, so patch the facet index for the rows here.
+    product_ids = list(queryset.values_list('pk', flat=True))
+    queryset.update(**fields)
+    refresh_products_on_commit(product_ids)
 
 
 @admin.action(description="Mark selected products as published")
 def make_published(modeladmin, request, queryset):
-    queryset.update(status="published")
+    update_products(queryset, status="published")
     
 @admin.action(description="Mark selected products as In Review")
 def make_in_review(modeladmin, request, queryset):
-    queryset.update(status="in_review")
+    update_products(queryset, status="in_review")
     
 @admin.action(description="Mark selected products as Featured")
 def make_featured(modeladmin, request, queryset):
-    queryset.update(featured=True)
+    update_products(queryset, featured=True)
 
 class ProductImagesAdmin(admin.TabularInline):
     model = Gallery
@@ -36,6 +49,10 @@ class CartOrderItemsInlineAdmin(admin.TabularInline):
 class CouponUsersInlineAdmin(admin.TabularInline):
     model = CouponUsers
 
+class CouponRedemptionInlineAdmin(admin.TabularInline):
+    model = CouponRedemption
+    raw_id_fields = ['user', 'order']
+
 
 class ProductAdminForm(forms.ModelForm):
     class Meta:
@@ -44,20 +61,68 @@ class ProductAdminForm(forms.ModelForm):
 
     vendor = forms.ModelChoiceField(queryset=Vendor.objects.filter(user__is_staff=True))
 
+class ProductBulkImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row, or one JSON object per line.")
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')])
+    vendor = forms.ModelChoiceField(queryset=Vendor.objects.all(), required=False)
+
 class ProductAdmin(ImportExportModelAdmin):
     inlines = [ProductImagesAdmin, SpecificationAdmin, ColorAdmin, SizeAdmin]
-    search_fields = ['title', 'price', 'slug']
+    # Matched besides the full-text index (title, tags, brand, description).
+    search_fields = ['price', 'slug']
     list_filter = ['featured', 'status', 'in_stock', 'type', 'vendor']
     list_editable = ['image', 'title', 'price', 'featured', 'status',  'shipping_amount', 'hot_deal', 'special_offer']
-    list_display = ['product_image', 'image', 'title',   'price', 'featured', 'shipping_amount', 'in_stock' ,'stock_qty', 'order_count', 'vendor' ,'status', 'featured', 'special_offer' ,'hot_deal']
+    list_display = ['product_image', 'image', 'title',   'price', 'featured', 'shipping_amount', 'in_stock' ,'stock_qty', 'paid_order_count', 'vendor' ,'status', 'featured', 'special_offer' ,'hot_deal']
     actions = [make_published, make_in_review, make_featured]
     list_per_page = 100
+    readonly_fields = ['rating_avg', 'rating_count', 'paid_order_count']
     prepopulated_fields = {"slug": ("title", )}
     form = ProductAdminForm
+    import_export_change_list_template = "admin/store/product/change_list_bulk_import.html"
+
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index for the text columns instead of icontains scans;
+        # price and slug are still matched as before.
+        if not search_term.strip():
+            return queryset, False
+        fallback, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        matches = models.Q(pk__in=search_product_ids(search_term, limit=1000)) | models.Q(pk__in=fallback.values('pk'))
+        return queryset.filter(matches), False
+
+    def get_urls(self):
+        urls = [
+            path('bulk-import/', self.admin_site.admin_view(self.bulk_import_view), name='store_product_bulk_import'),
+        ]
+        return urls + super().get_urls()
+
+    def bulk_import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:store_product_changelist')
+
+        form = ProductBulkImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            # The process_product_imports worker runs the feed; large ones take longer than a request may.
+            job = ProductImportJob.objects.create(
+                file=form.cleaned_data['file'],
+                format=form.cleaned_data['format'],
+                vendor=form.cleaned_data['vendor'],
+                user=request.user,
+            )
+            self.message_user(request, f"Queued import {job.pk}; its progress is shown below.", messages.SUCCESS)
+            return redirect('admin:store_productimportjob_changelist')
+
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form, title="Bulk import products")
+        return TemplateResponse(request, "admin/store/product/bulk_import.html", context)
 
 class CartAdmin(ImportExportModelAdmin):
     list_display = ['product', 'cart_id', 'qty', 'price', 'sub_total' , 'shipping_amount', 'service_fee', 'tax_fee', 'total', 'country', 'size', 'color', 'date']
 
+class CartSessionAdmin(admin.ModelAdmin):
+    # Totals are maintained by store.cart; run rebuild_cart_sessions after editing lines here.
+    list_display = ['cart_id', 'user', 'line_count', 'item_count', 'total', 'updated']
+    search_fields = ['cart_id']
+    readonly_fields = ['line_count', 'item_count', 'sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'total']
+
     
 class CategoryAdmin(ImportExportModelAdmin):
     list_editable = [ 'active']
@@ -96,7 +161,7 @@ class ProductOfferAdmin(ImportExportModelAdmin):
     list_display = ['user', 'product', 'price','status', 'email']
 
 class CouponAdmin(ImportExportModelAdmin):
-    inlines = [CouponUsersInlineAdmin]
+    inlines = [CouponRedemptionInlineAdmin, CouponUsersInlineAdmin]
     list_editable = ['code', 'active', ]
     list_display = ['vendor' ,'code', 'discount', 'active', 'date']
         
@@ -119,6 +184,22 @@ class NotificationAdmin(ImportExportModelAdmin):
     list_editable = ['seen']
     list_display = ['order', 'seen', 'user', 'vendor', 'date']
 
+class PaymentEventAdmin(admin.ModelAdmin):
+    # Events are applied by the process_payment_events worker; set status back to pending to replay one.
+    list_display = ['event_id', 'type', 'session_id', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'type']
+    search_fields = ['event_id', 'session_id']
+    readonly_fields = ['event_id', 'type', 'session_id', 'payload', 'received_at']
+
+class ProductImportJobAdmin(admin.ModelAdmin):
+    # Jobs are created by the product bulk import view and run by the process_product_imports worker.
+    list_display = ['id', 'format', 'vendor', 'user', 'status', 'imported', 'attempts', 'error', 'created', 'finished_at']
+    list_filter = ['status', 'format']
+    readonly_fields = ['file', 'format', 'vendor', 'user', 'imported', 'attempts', 'claim', 'error', 'created', 'started_at', 'finished_at']
+
+    def has_add_permission(self, request):
+        return False
+
 
 admin.site.register(Review, ProductReviewAdmin)
 admin.site.register(Product, ProductAdmin)
@@ -126,6 +207,7 @@ admin.site.register(Category, CategoryAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(CartOrder, CartOrderAdmin)
 admin.site.register(Cart, CartAdmin)
+admin.site.register(CartSession, CartSessionAdmin)
 admin.site.register(CartOrderItem, CartOrderItemsAdmin)
 admin.site.register(Brand, BrandAdmin)
 admin.site.register(ProductFaq, ProductFaqAdmin)
@@ -133,6 +215,8 @@ admin.site.register(Coupon, CouponAdmin)
 admin.site.register(Address, AddressAdmin)
 admin.site.register(Wishlist)
 admin.site.register(Notification, NotificationAdmin)
+admin.site.register(PaymentEvent, PaymentEventAdmin)
+admin.site.register(ProductImportJob, ProductImportJobAdmin)
 admin.site.register(DeliveryCouriers, DeliveryCouriersAdmin)
 # admin.site.register(Size )
 # admin.site.register(Color )
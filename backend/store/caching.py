@@ -0,0 +1,115 @@
+"""
+Versioned cache keys for store data.
+
+Cached values are stored under keys that embed a namespace version. Signals
+(and ProductQuerySet.update(), for bulk writes) bump the version when the
+underlying rows change, which orphans every entry
+of that namespace at once; orphans simply expire. Nothing has to enumerate or
+delete keys, and readers on the steady-state path only touch the cache.
+
+`cache_response` applies the same scheme to whole public API responses and
+derives ETag / Last-Modified from the namespace versions, so unchanged
+catalog pages cost a 304 and no database work.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+VERSION_KEY = "store:version:%s"
+MODIFIED_KEY = "store:modified:%s"
+
+
+def cache_version(namespace):
+    version = cache.get(VERSION_KEY % namespace)
+    if version is None:
+        # Seed from the clock so a version key that was evicted can never come
+        # back at a number that still has stale entries behind it.
+        cache.add(VERSION_KEY % namespace, time.time_ns(), timeout=None)
+        cache.add(MODIFIED_KEY % namespace, int(time.time()), timeout=None)
+        version = cache.get(VERSION_KEY % namespace, 0)
+    return version
+
+
+def bump_cache_version(namespace):
+    try:
+        cache.incr(VERSION_KEY % namespace)
+    except ValueError:
+        cache.add(VERSION_KEY % namespace, time.time_ns(), timeout=None)
+    cache.set(MODIFIED_KEY % namespace, int(time.time()), timeout=None)
+
+
+def bump_cache_version_on_commit(namespace):
+    # Bumping before the writing transaction commits would let a concurrent
+    # reader cache the old rows under the new version.
+    transaction.on_commit(lambda: bump_cache_version(namespace))
+
+
+def versioned_key(namespace, *parts):
+    return ":".join(["store", namespace, str(cache_version(namespace))] + [str(part) for part in parts])
+
+
+def get_or_set_versioned(namespace, parts, compute, timeout=60 * 60 * 24):
+    key = versioned_key(namespace, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def cache_response(*namespaces, timeout=None):
+    """
+    Cache a public GET view's rendered response under the current versions of
+    `namespaces`, answer conditional requests with 304 and tag responses with
+    ETag / Last-Modified. Any bump of one of the namespaces invalidates it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            versions = ":".join(str(cache_version(namespace)) for namespace in namespaces)
+            modified = cache.get_many([MODIFIED_KEY % namespace for namespace in namespaces])
+            last_modified = max(modified.values(), default=None)
+            # The full URL, not just the path: bodies hold absolute links
+            # (images, cursors) for the scheme and host they were built for.
+            variant = "|".join([versions, request.build_absolute_uri(), request.META.get("HTTP_ACCEPT", "")])
+            digest = hashlib.md5(variant.encode()).hexdigest()
+            etag = quote_etag(digest)
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            key = "store:response:%s" % digest
+            cached = cache.get(key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response.render()
+                if response.status_code != 200:
+                    return response
+                cache.set(key, (response.content, response["Content-Type"]), timeout or settings.CATALOG_CACHE_TIMEOUT)
+            else:
+                response = HttpResponse(cached[0], content_type=cached[1])
+
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, public=True, no_cache=True)
+            patch_vary_headers(response, ["Accept"])
+            return response
+
+        return wrapped
+
+    return decorator
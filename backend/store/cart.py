@@ -0,0 +1,208 @@
+"""
+Server-side carts.
+
+A cart is its line rows (store.Cart, one per product, keyed by the client's
+cart_id) plus a CartSession header holding the totals of all lines. Every
+mutation goes through `upsert_lines()`, which prices only the lines it
+touches and moves the header totals by the difference, in the same
+transaction; nothing ever re-sums the whole cart. Reading a cart's totals is
+one lookup of the header by its unique cart_id.
+
+Line amounts are computed by store.pricing, for all lines of a mutation in
+one batch, with prices taken from the product when a line is written. `rebuild_sessions()`
+recomputes headers from their lines after lines were edited some other way
+(admin, imports).
+"""
+
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models.functions import Now
+
+from store.models import Cart, CartSession, Product
+from store.pricing import price_lines, tax_rate
+
+
+AMOUNTS = ['sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'total']
+ZERO = Decimal('0.00')
+
+
+def line_amounts(line):
+    return {name: getattr(line, name) or ZERO for name in AMOUNTS}
+
+
+def get_cart(cart_id):
+    """
+    The cart's header with its totals, or None for an empty, unknown cart.
+    """
+    return CartSession.objects.filter(cart_id=cart_id).first()
+
+
+def cart_lines(cart_id):
+    return Cart.objects.filter(cart_id=cart_id).select_related('product').order_by('id')
+
+
+@transaction.atomic
+def upsert_lines(cart_id, lines, user=None, country=None):
+    """
+    Set the quantity (and size/color) of several lines of a cart at once and
+    return its updated CartSession. `lines` are mappings with `product` (id),
+    `qty` and optionally `size` and `color`; qty 0 removes the line. Changing
+    the country re-prices every line for the new tax rate; lines the call does
+    not touch whose product is no longer published are dropped then.
+
+    Costs a fixed number of queries whatever the number of lines: the header
+    (locked, so mutations of one cart are serialized), the products, the
+    existing lines, then one bulk insert, update and delete and one header
+    update.
+
+    Raises ValueError for products in `lines` that do not exist or are not
+    published.
+    """
+    wanted = {int(line['product']): line for line in lines}
+    incoming = set(wanted)
+    session, _ = CartSession.objects.select_for_update().get_or_create(
+        cart_id=cart_id, defaults={'user': user, 'country': country}
+    )
+
+    if country is None or country == session.country:
+        country = session.country
+        existing = Cart.objects.filter(cart_id=cart_id, product_id__in=wanted)
+    else:
+        existing = Cart.objects.filter(cart_id=cart_id)
+
+    old = {}
+    for line in existing.order_by('id'):
+        old.setdefault(line.product_id, []).append(line)
+    # Lines that are not being changed keep their quantity (country change).
+    for product_id, rows in old.items():
+        wanted.setdefault(product_id, {'product': product_id, 'qty': rows[0].qty or 0})
+
+    products = Product.objects.filter(status="published", pk__in=[pk for pk, line in wanted.items() if line['qty']])
+    products = {product.pk: product for product in products.only('id', 'price', 'shipping_amount')}
+    missing = [pk for pk, line in wanted.items() if line['qty'] and pk not in products]
+    unknown = sorted(pk for pk in missing if pk in incoming)
+    if unknown:
+        raise ValueError(f"Unknown products: {', '.join(map(str, unknown))}")
+    for product_id in missing:
+        # An untouched line whose product was unpublished can no longer be priced.
+        wanted[product_id] = {'product': product_id, 'qty': 0}
+
+    kept = [product_id for product_id, change in wanted.items() if int(change['qty']) > 0]
+    priced = price_lines(
+        [int(wanted[product_id]['qty']) for product_id in kept],
+        [products[product_id].price for product_id in kept],
+        [products[product_id].shipping_amount for product_id in kept],
+        tax_rate(country),
+    )
+    position = {product_id: index for index, product_id in enumerate(kept)}
+    delta = dict.fromkeys(AMOUNTS, ZERO)
+    line_delta = item_delta = 0
+    created, updated, deleted = [], [], []
+    for product_id, change in wanted.items():
+        rows = old.get(product_id, [])
+        for row in rows:
+            for name, amount in line_amounts(row).items():
+                delta[name] -= amount
+            line_delta -= 1
+            item_delta -= row.qty or 0
+
+        qty = int(change['qty'])
+        if qty <= 0:
+            deleted.extend(row.pk for row in rows)
+            continue
+
+        product = products[product_id]
+        line = rows[0] if rows else Cart(cart_id=cart_id, product_id=product_id)
+        # Duplicate legacy lines of one product are folded into the first.
+        deleted.extend(row.pk for row in rows[1:])
+        line.user = user or line.user
+        line.qty = qty
+        line.price = product.price
+        line.country = country
+        line.size = change.get('size', line.size)
+        line.color = change.get('color', line.color)
+        for name in AMOUNTS:
+            amount = priced.columns[name][position[product_id]]
+            setattr(line, name, amount)
+            delta[name] += amount
+        line_delta += 1
+        item_delta += qty
+        (updated if line.pk else created).append(line)
+
+    if created:
+        Cart.objects.bulk_create(created)
+    if updated:
+        Cart.objects.bulk_update(updated, ['user', 'qty', 'price', 'country', 'size', 'color'] + AMOUNTS)
+    if deleted:
+        Cart.objects.filter(pk__in=deleted).delete()
+
+    changes = {name: models.F(name) + amount for name, amount in delta.items() if amount}
+    if line_delta:
+        changes['line_count'] = models.F('line_count') + line_delta
+    if item_delta:
+        changes['item_count'] = models.F('item_count') + item_delta
+    if user is not None and session.user_id is None:
+        changes['user'] = user
+    if country != session.country:
+        changes['country'] = country
+    if changes:
+        CartSession.objects.filter(pk=session.pk).update(updated=Now(), **changes)
+
+    for name, amount in delta.items():
+        # A header created just now still holds the float field defaults.
+        setattr(session, name, Decimal(str(getattr(session, name))) + amount)
+    session.line_count += line_delta
+    session.item_count += item_delta
+    session.country = country
+    if user is not None and session.user_id is None:
+        session.user = user
+    return session
+
+
+def remove_lines(cart_id, product_ids):
+    return upsert_lines(cart_id, [{'product': product_id, 'qty': 0} for product_id in product_ids])
+
+
+@transaction.atomic
+def clear_cart(cart_id):
+    Cart.objects.filter(cart_id=cart_id).delete()
+    CartSession.objects.filter(cart_id=cart_id).delete()
+
+
+def rebuild_sessions(batch_size=1000):
+    """
+    Recompute every CartSession from its lines, creating missing headers and
+    zeroing headers whose lines are gone. Returns the number of carts.
+    """
+    totals = (
+        Cart.objects.exclude(cart_id=None).order_by('cart_id').values('cart_id')
+        .annotate(
+            lines=models.Count('id'), items=models.Sum('qty'),
+            cart_user=models.Max('user_id'), cart_country=models.Max('country'),
+            **{f'sum_{name}': models.Sum(name) for name in AMOUNTS},
+        )
+    )
+    seen = 0
+    with transaction.atomic():
+        CartSession.objects.update(line_count=0, item_count=0, **dict.fromkeys(AMOUNTS, ZERO))
+        batch = []
+        for row in totals.iterator(chunk_size=batch_size):
+            batch.append(CartSession(
+                cart_id=row['cart_id'], user_id=row['cart_user'], country=row['cart_country'],
+                line_count=row['lines'], item_count=row['items'] or 0,
+                **{name: row[f'sum_{name}'] or ZERO for name in AMOUNTS},
+            ))
+            if len(batch) >= batch_size:
+                seen += save_sessions(batch)
+                batch = []
+        seen += save_sessions(batch)
+    return seen
+
+
+def save_sessions(sessions):
+    CartSession.objects.bulk_create(
+        sessions, update_conflicts=True, unique_fields=['cart_id'],
+        update_fields=['user', 'country', 'line_count', 'item_count'] + AMOUNTS,
+    )
+    return len(sessions)
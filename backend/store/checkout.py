@@ -0,0 +1,131 @@
+"""
+Order placement.
+
+`place_order()` turns a cart into a CartOrder with its CartOrderItems, the
+vendor and coupon links and one Notification per vendor, and reserves the
+ordered stock. Everything is built in memory, priced in one store.pricing
+call and written inside one transaction with a fixed set of statements, plus
+one stock UPDATE per product:
+
+    SELECT   cart lines with their published products
+    INSERT   the order
+    INSERT   coupon redemptions   (only with coupons)
+    INSERT   order items          (bulk_create)
+    SELECT   ordered quantity per product
+    UPDATE   stock                (one conditional UPDATE per product, see CartOrder.reserve_stock)
+    INSERT   order-vendor links   (bulk_create on the through table)
+    INSERT   order-coupon links   (bulk_create, only with coupons)
+    INSERT   item-coupon links    (bulk_create, only with coupons)
+    INSERT   vendor notifications (bulk_create)
+
+On SQLite Django splits bulk inserts into batches of 999 parameters, so
+very large carts take a few more INSERTs there; on PostgreSQL each is one
+statement. Item ids come back from the INSERT (RETURNING) on both.
+
+Bulk inserts do not send post_save signals. Nothing listens for new order
+items or notifications; the order itself is saved normally, so its
+paid-order counters still work.
+
+Coupons come from the cached map in store.coupons, so looking them up costs
+no query; redeeming them is the one INSERT that enforces one use per buyer.
+"""
+
+from django.db import transaction
+
+from store.coupons import find_coupons, redeem
+from store.models import Cart, CartOrder, CartOrderItem, Notification
+from store.pricing import price_lines, tax_rate
+
+
+class EmptyCart(Exception):
+    def __init__(self, cart_id):
+        self.cart_id = cart_id
+        super().__init__(f"Cart {cart_id} has no lines")
+
+
+ORDER_DETAILS = ['full_name', 'email', 'mobile', 'address', 'city', 'state', 'country']
+
+
+def vendor_discounts(coupons):
+    """
+    Best discount (percent) per vendor among `coupons`, and the coupon giving it.
+    """
+    best = {}
+    for coupon in coupons:
+        if coupon.vendor_id not in best or coupon.discount > best[coupon.vendor_id].discount:
+            best[coupon.vendor_id] = coupon
+    return best
+
+
+@transaction.atomic
+def place_order(cart_id, details, buyer=None, coupon_codes=()):
+    """
+    Create an order from the lines of cart `cart_id` and return it.
+
+    `details` holds the buyer's contact and delivery fields (ORDER_DETAILS);
+    the tax rate follows `details['country']`. Lines are priced at the
+    products' current prices; lines of products that are no longer published
+    are left out. Each active coupon in `coupon_codes` discounts
+    the lines of its vendor; with several coupons for one vendor the largest
+    discount applies.
+
+    Raises EmptyCart when the cart has no published lines,
+    store.coupons.AlreadyRedeemed when one of the applied coupons was used
+    before with `details['email']` or by `buyer`, and InsufficientStock when a product is short; nothing is
+    written then.
+    """
+    lines = list(
+        Cart.objects.filter(cart_id=cart_id, product__status="published").order_by('id')
+        .select_related('product').only('qty', 'size', 'color', 'product__id', 'product__price', 'product__shipping_amount', 'product__vendor')
+    )
+    if not lines:
+        raise EmptyCart(cart_id)
+
+    coupons = {}
+    if coupon_codes:
+        vendor_ids = {line.product.vendor_id for line in lines}
+        coupons = vendor_discounts(find_coupons(coupon_codes, vendor_ids))
+
+    priced = price_lines(
+        [line.qty or 0 for line in lines],
+        [line.product.price for line in lines],
+        [line.product.shipping_amount for line in lines],
+        tax_rate(details.get('country')),
+        [coupons[line.product.vendor_id].discount if line.product.vendor_id in coupons else 0 for line in lines],
+    )
+
+    order = CartOrder(buyer=buyer, **{name: details.get(name) for name in ORDER_DETAILS})
+    for name, amount in priced.totals.items():
+        setattr(order, name, amount)
+    order.save()
+    redeem(list(coupons.values()), details.get('email'), buyer, order)
+
+    items = []
+    for index, line in enumerate(lines):
+        product = line.product
+        item = CartOrderItem(
+            order=order, product_id=product.pk, vendor_id=product.vendor_id,
+            qty=line.qty or 0, size=line.size, color=line.color, price=product.price,
+            applied_coupon=product.vendor_id in coupons,
+            **priced.line(index),
+        )
+        items.append(item)
+    CartOrderItem.objects.bulk_create(items)
+    order.reserve_stock()
+
+    vendor_ids = sorted({item.vendor_id for item in items if item.vendor_id})
+    CartOrder.vendor.through.objects.bulk_create(
+        [CartOrder.vendor.through(cartorder_id=order.pk, vendor_id=vendor_id) for vendor_id in vendor_ids]
+    )
+    if coupons:
+        CartOrder.coupons.through.objects.bulk_create(
+            [CartOrder.coupons.through(cartorder_id=order.pk, coupon_id=coupon.pk) for coupon in coupons.values()]
+        )
+        CartOrderItem.coupon.through.objects.bulk_create([
+            CartOrderItem.coupon.through(cartorderitem_id=item.pk, coupon_id=coupons[item.vendor_id].pk)
+            for item in items if item.applied_coupon
+        ])
+    Notification.objects.bulk_create(
+        [Notification(vendor_id=vendor_id, order=order) for vendor_id in vendor_ids]
+    )
+    return order
@@ -0,0 +1,121 @@
+"""
+Coupon lookup and redemption.
+
+Codes are stored normalized (trimmed, upper case) and are unique per vendor,
+so "save10 " and "SAVE10" are the same coupon. `active_coupons()` maps every
+normalized code to the active coupons carrying it, one tuple per vendor, and
+is served from the versioned cache until a Coupon changes; looking codes up
+at checkout costs no query.
+
+Each use is a CouponRedemption row, unique on (coupon, email) and on
+(coupon, user). The email is the order's, so guest checkouts are limited too:
+
+    redeemed()   SELECT on the unique indexes for the buyer's coupons
+    redeem()     one INSERT; a concurrent second use of the same coupon by
+                 the same email or user fails on a constraint and raises
+                 AlreadyRedeemed
+
+There is no read-then-write window, so two simultaneous checkouts cannot both
+use a coupon.
+"""
+
+from collections import namedtuple
+
+from django.db import IntegrityError, models, transaction
+
+from store.caching import get_or_set_versioned
+
+
+ActiveCoupon = namedtuple('ActiveCoupon', ['pk', 'vendor_id', 'code', 'discount'])
+
+
+class AlreadyRedeemed(Exception):
+    def __init__(self, codes):
+        self.codes = sorted(set(codes))
+        super().__init__(f"Coupon already used: {', '.join(self.codes)}")
+
+
+def normalize_code(code):
+    return (code or "").strip().upper()
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def active_coupons():
+    """
+    Active coupons as {normalized code: (ActiveCoupon, ...)}, cached.
+    """
+    return get_or_set_versioned("coupons", ["active"], build_active_coupons)
+
+
+def build_active_coupons():
+    from store.models import Coupon
+
+    coupons = {}
+    rows = Coupon.objects.filter(active=True).order_by('id').values_list('id', 'vendor_id', 'code', 'discount')
+    for row in rows:
+        coupon = ActiveCoupon(*row)
+        coupons.setdefault(coupon.code, ())
+        coupons[coupon.code] += (coupon,)
+    return coupons
+
+
+def find_coupons(codes, vendor_ids=None):
+    """
+    Active coupons for `codes` (any case or padding), optionally only those of
+    `vendor_ids`.
+    """
+    coupons = active_coupons()
+    found = []
+    for code in {normalize_code(code) for code in codes}:
+        for coupon in coupons.get(code, ()):
+            if vendor_ids is None or coupon.vendor_id in vendor_ids:
+                found.append(coupon)
+    return found
+
+
+def redeemed(user, coupons, email=None):
+    """
+    The subset of `coupons` (ids or objects with pk) already used by `user`
+    or with `email`.
+    """
+    from store.models import CouponRedemption
+
+    ids = [getattr(coupon, 'pk', coupon) for coupon in coupons]
+    buyer = models.Q()
+    if user is not None:
+        buyer |= models.Q(user=user)
+    if normalize_email(email):
+        buyer |= models.Q(email=normalize_email(email))
+    if not buyer or not ids:
+        return set()
+    return set(CouponRedemption.objects.filter(buyer, coupon_id__in=ids).values_list('coupon_id', flat=True))
+
+
+def redeem(coupons, email, user=None, order=None):
+    """
+    Record that the buyer with `email` (and `user`, when signed in) used
+    `coupons` (for `order`). Raises AlreadyRedeemed, recording nothing, when
+    any of them was used with that email or by that user before; other
+    integrity errors are raised as they are.
+    """
+    from store.models import CouponRedemption
+
+    if not coupons:
+        return
+    email = normalize_email(email)
+    if not email:
+        raise ValueError("Redeeming a coupon needs the buyer's email")
+    try:
+        with transaction.atomic():
+            CouponRedemption.objects.bulk_create([
+                CouponRedemption(coupon_id=coupon.pk, email=email, user=user, order=order) for coupon in coupons
+            ])
+    except IntegrityError:
+        used = redeemed(user, coupons, email)
+        if not used:
+            # Nothing was used before; the rows broke some other constraint.
+            raise
+        raise AlreadyRedeemed(coupon.code for coupon in coupons if coupon.pk in used)
@@ -0,0 +1,426 @@
+"""
+Faceted filtering over published products.
+
+Instead of running a GROUP BY per facet for every filter combination, the
+catalog is kept as posting lists: for every facet value (a category id, a
+brand, a color name, ...) the set of product ids that carry it, stored as a
+bitmap in a Python int (bit n set = product n). A filter is an AND across
+facets of the OR of the selected values, and each facet's counts are computed
+with every *other* facet's selection applied, so a shopper sees how many
+products each alternative value would give. All of it is integer `&`, `|`
+and bit_count() in memory.
+
+The index lives in the cache under the "facets" namespace, one entry per
+facet's postings plus one for the published set and one for the price arrays,
+and is memoized per process; a small revision key tells a process when its
+copy is stale. Product, Color and Size changes (and the admin's bulk actions)
+patch the affected products after commit (see store.models), rewriting only
+the entries whose postings changed. Stock only matters here when in_stock
+flips, so reservations that leave a product in stock patch nothing. Patches
+and rebuilds publish under a short cache lock, which a patch waits up to
+LOCK_WAIT seconds for; when a patch still cannot be applied safely (the lock
+stays taken, or the index is not cached) the namespace version is bumped and
+the next reader rebuilds the index from the database.
+"""
+
+import bisect
+import time
+from array import array
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import models, transaction
+
+from store.caching import bump_cache_version, versioned_key
+
+
+BOOLEAN_FACETS = ['in_stock', 'featured', 'hot_deal', 'special_offer']
+PRODUCT_FACETS = {
+    'category': 'category_id',
+    'brand': 'brand',
+    'vendor': 'vendor_id',
+    'type': 'type',
+    **{facet: facet for facet in BOOLEAN_FACETS},
+}
+VARIANT_FACETS = ['color', 'size']
+FACETS = list(PRODUCT_FACETS) + VARIANT_FACETS + ['price']
+INTEGER_FACETS = ['category', 'vendor']
+
+# Lower bounds of the price buckets counted under the "price" facet.
+PRICE_BUCKETS = [0, 25, 50, 100, 250, 500, 1000]
+
+# Price filters at or beyond this are refused; prices are max_digits=12.
+MAX_PRICE = Decimal(10) ** 10
+
+LOCK_TIMEOUT = 30
+# How long a patch waits for another process's patch before giving up.
+LOCK_WAIT = 2
+
+# The cache entries an index is stored as.
+PARTS = ['products', 'prices'] + [f"postings:{facet}" for facet in FACETS]
+
+# Up to this many products are moved in the sorted price arrays one by one;
+# larger changes re-sort them.
+PRICE_PATCH_LIMIT = 64
+
+_memo = {}
+
+
+def to_bitmap(ids):
+    if not ids:
+        return 0
+    bits = bytearray((max(ids) >> 3) + 1)
+    for product_id in ids:
+        bits[product_id >> 3] |= 1 << (product_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitmap_ids(bitmap):
+    """
+    The product ids set in `bitmap`, ascending.
+    """
+    ids = []
+    for offset, byte in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, 'little')):
+        while byte:
+            low = byte & -byte
+            ids.append((offset << 3) + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+
+def price_cents(price):
+    return int((price or 0) * 100)
+
+
+def price_bucket(price):
+    index = bisect.bisect_right(PRICE_BUCKETS, price or 0) - 1
+    low = PRICE_BUCKETS[max(index, 0)]
+    if index + 1 < len(PRICE_BUCKETS):
+        return f"{low}-{PRICE_BUCKETS[index + 1]}"
+    return f"{low}+"
+
+
+def parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+class FacetIndex:
+    """
+    Posting lists for every facet value, plus the published products' prices
+    sorted ascending (with the matching ids alongside) for price range filters.
+    """
+
+    def __init__(self):
+        self.revision = time.time_ns()
+        self.products = 0
+        self.postings = {facet: {} for facet in FACETS}
+        self.prices = array('q')
+        self.price_ids = array('q')
+
+    @classmethod
+    def from_parts(cls, parts, revision):
+        """
+        The index stored as `parts` ({part: value}), or None when any part is
+        missing.
+        """
+        if any(part not in parts for part in PARTS):
+            return None
+        index = cls()
+        index.revision = revision
+        index.products = parts['products']
+        index.prices, index.price_ids = parts['prices']
+        index.postings = {facet: parts[f"postings:{facet}"] for facet in FACETS}
+        return index
+
+    def parts(self, names=PARTS):
+        values = {'products': self.products, 'prices': (self.prices, self.price_ids)}
+        values.update((f"postings:{facet}", postings) for facet, postings in self.postings.items())
+        return {name: values[name] for name in names}
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        index.load(rows(), variants())
+        return index
+
+    def load(self, product_rows, variant_rows):
+        """
+        Add products that are not in the index yet. `product_rows` yields
+        (id, price, *PRODUCT_FACETS values) and `variant_rows` (facet, product
+        id, name) for published products.
+        """
+        ids = {}
+        priced = []
+        for product_id, price, *values in product_rows:
+            for facet, value in zip(PRODUCT_FACETS, values):
+                if value not in (None, ''):
+                    ids.setdefault((facet, value), []).append(product_id)
+            ids.setdefault(('price', price_bucket(price)), []).append(product_id)
+            ids.setdefault(('*', None), []).append(product_id)
+            priced.append((price_cents(price), product_id))
+        for facet, product_id, name in variant_rows:
+            if name:
+                ids.setdefault((facet, name), []).append(product_id)
+
+        for (facet, value), product_ids in ids.items():
+            if facet == '*':
+                self.products |= to_bitmap(product_ids)
+            else:
+                postings = self.postings[facet]
+                postings[value] = postings.get(value, 0) | to_bitmap(product_ids)
+
+        if len(priced) <= PRICE_PATCH_LIMIT:
+            for cents, product_id in priced:
+                position = bisect.bisect_right(self.prices, cents)
+                self.prices.insert(position, cents)
+                self.price_ids.insert(position, product_id)
+        else:
+            priced.extend(zip(self.prices, self.price_ids))
+            priced.sort()
+            self.prices = array('q', [cents for cents, _ in priced])
+            self.price_ids = array('q', [product_id for _, product_id in priced])
+
+    def discard(self, product_ids):
+        mask = to_bitmap(product_ids)
+        self.products &= ~mask
+        for postings in self.postings.values():
+            for value, bitmap in list(postings.items()):
+                if bitmap & mask:
+                    bitmap &= ~mask
+                    if bitmap:
+                        postings[value] = bitmap
+                    else:
+                        del postings[value]
+        if len(product_ids) <= PRICE_PATCH_LIMIT:
+            for product_id in product_ids:
+                if product_id in self.price_ids:
+                    position = self.price_ids.index(product_id)
+                    del self.prices[position]
+                    del self.price_ids[position]
+        else:
+            discarded = set(product_ids)
+            kept = [(cents, product_id) for cents, product_id in zip(self.prices, self.price_ids) if product_id not in discarded]
+            self.prices = array('q', [cents for cents, _ in kept])
+            self.price_ids = array('q', [product_id for _, product_id in kept])
+
+    def refresh(self, product_ids):
+        """
+        Re-read the given products from the database; unpublished or deleted
+        ones drop out of the index. Returns the PARTS that changed.
+        """
+        before = {'products': self.products, 'prices': (array('q', self.prices), array('q', self.price_ids))}
+        before.update((f"postings:{facet}", dict(postings)) for facet, postings in self.postings.items())
+        self.discard(product_ids)
+        self.load(rows(product_ids), variants(product_ids))
+        self.revision = time.time_ns()
+        return [part for part, value in self.parts().items() if value != before[part]]
+
+    def price_range(self, low=None, high=None):
+        start = 0 if low is None else bisect.bisect_left(self.prices, price_cents(low))
+        end = len(self.prices) if high is None else bisect.bisect_right(self.prices, price_cents(high))
+        return to_bitmap(self.price_ids[start:end])
+
+    def select(self, facet, values):
+        postings = self.postings[facet]
+        bitmap = 0
+        for value in values:
+            bitmap |= postings.get(value, 0)
+        return bitmap
+
+    def query(self, selection, low_price=None, high_price=None):
+        """
+        Match `selection` ({facet: [values]}, values ORed within a facet and
+        facets ANDed) within an optional price range. Returns the bitmap of
+        matching products and, per facet, {value: count} with the other
+        facets' selections applied.
+        """
+        base = self.products
+        if low_price is not None or high_price is not None:
+            base &= self.price_range(low_price, high_price)
+
+        selected = {facet: self.select(facet, values) for facet, values in selection.items() if values}
+        matching = base
+        for bitmap in selected.values():
+            matching &= bitmap
+
+        counts = {}
+        for facet, postings in self.postings.items():
+            scope = base
+            for other, bitmap in selected.items():
+                if other != facet:
+                    scope &= bitmap
+            counts[facet] = {}
+            for value, bitmap in postings.items():
+                count = (bitmap & scope).bit_count()
+                if count or value in selection.get(facet, ()):
+                    counts[facet][value] = count
+        return matching, counts
+
+
+def rows(product_ids=None):
+    from store.models import Product
+
+    products = Product.objects.filter(status="published")
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products.values_list('pk', 'price', *PRODUCT_FACETS.values()).iterator()
+
+
+def variants(product_ids=None):
+    from store.models import Color, Size
+
+    for facet, model in (('color', Color), ('size', Size)):
+        variants = model.objects.filter(product__status="published")
+        if product_ids is not None:
+            variants = variants.filter(product_id__in=product_ids)
+        for product_id, name in variants.values_list('product_id', 'name').iterator():
+            yield facet, product_id, name
+
+
+def index_keys():
+    key = versioned_key("facets", "index")
+    return key, key + ":revision", key + ":lock"
+
+
+def part_keys(key, parts=PARTS):
+    return {part: f"{key}:{part}" for part in parts}
+
+
+def load_index(key, revision):
+    keys = part_keys(key)
+    cached = cache.get_many(keys.values())
+    return FacetIndex.from_parts({part: cached[name] for part, name in keys.items() if name in cached}, revision)
+
+
+def store_index(key, index, parts=PARTS):
+    _, revision_key, _ = index_keys()
+    keys = part_keys(key, parts)
+    cache.set_many({keys[part]: value for part, value in index.parts(parts).items()}, timeout=None)
+    # Last, so a reader never takes a revision whose parts are not written yet.
+    cache.set(revision_key, index.revision, timeout=None)
+
+
+def facet_index():
+    """
+    The current index, from this process's memo when it is still the cached
+    revision, else from the cache, else rebuilt from the database.
+    """
+    key, revision_key, lock_key = index_keys()
+    revision = cache.get(revision_key)
+    memo = _memo.get('index')
+    if memo is not None and memo[0] == key and revision == memo[1].revision:
+        return memo[1]
+
+    index = load_index(key, revision) if revision is not None else None
+    if index is None:
+        index = FacetIndex.build()
+        # Publish only while no patch is running and none landed since the
+        # revision was read, so this rebuild never overwrites a newer one.
+        if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            try:
+                if cache.get(revision_key) == revision:
+                    store_index(key, index)
+            finally:
+                cache.delete(lock_key)
+    _memo['index'] = (key, index)
+    return index
+
+
+def refresh_products(product_ids):
+    """
+    Patch the cached index for the given products. Call after the change has
+    been committed.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    key, revision_key, lock_key = index_keys()
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            bump_cache_version("facets")
+            return
+        time.sleep(0.02)
+    try:
+        revision = cache.get(revision_key)
+        index = load_index(key, revision) if revision is not None else None
+        if index is None:
+            # A rebuild may be reading rows from before this change.
+            bump_cache_version("facets")
+            return
+        store_index(key, index, index.refresh(product_ids))
+        _memo['index'] = (key, index)
+    finally:
+        cache.delete(lock_key)
+
+
+def refresh_products_on_commit(product_ids):
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: refresh_products(product_ids))
+
+
+def parse_selection(params):
+    """
+    Read a facet selection from query parameters, e.g.
+    `?category=3&color=Red&color=Blue&in_stock=true&min_price=10`. Returns
+    (selection, min_price, max_price); raises ValueError on malformed values.
+    """
+    selection = {}
+    for facet in FACETS:
+        values = [value for value in params.getlist(facet) if value != '']
+        if not values:
+            continue
+        if facet in INTEGER_FACETS:
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                raise ValueError(f"{facet} must be an id: {values!r}")
+        elif facet in BOOLEAN_FACETS:
+            values = [parse_bool(value) for value in values]
+        elif facet == 'price':
+            labels = [price_bucket(low) for low in PRICE_BUCKETS]
+            if any(value not in labels for value in values):
+                raise ValueError(f"price must be one of {', '.join(labels)}")
+        selection[facet] = values
+
+    prices = []
+    for name in ('min_price', 'max_price'):
+        value = params.get(name)
+        try:
+            price = Decimal(value) if value not in (None, '') else None
+        except InvalidOperation:
+            raise ValueError(f"{name} is not a number: {value!r}")
+        # NaN, Infinity and huge exponents would not fit in cents.
+        if price is not None and (not price.is_finite() or abs(price) >= MAX_PRICE):
+            raise ValueError(f"{name} is not a number: {value!r}")
+        prices.append(price)
+    return selection, prices[0], prices[1]
+
+
+def filter_products(queryset, selection, min_price=None, max_price=None):
+    """
+    Apply the same selection to a Product queryset in SQL, for listing the
+    products behind a set of facet counts.
+    """
+    from store.models import Color, Size
+
+    for facet, field in PRODUCT_FACETS.items():
+        if selection.get(facet):
+            queryset = queryset.filter(**{f"{field}__in": selection[facet]})
+    for facet, model in (('color', Color), ('size', Size)):
+        if selection.get(facet):
+            queryset = queryset.filter(pk__in=model.objects.filter(name__in=selection[facet]).values('product_id'))
+    if selection.get('price'):
+        bounds = models.Q()
+        for label in selection['price']:
+            low, _, high = label.rstrip('+').partition('-')
+            bucket = models.Q(price__gte=low or 0)
+            if high:
+                bucket &= models.Q(price__lt=high)
+            bounds |= bucket
+        queryset = queryset.filter(bounds)
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    return queryset
@@ -0,0 +1,164 @@
+"""
+Responsive image variants for product, gallery, category and brand images.
+
+Every uploaded image is rendered at the widths in IMAGE_VARIANT_WIDTHS and in
+the formats in IMAGE_VARIANT_FORMATS (AVIF, WebP and JPEG; formats the
+installed Pillow cannot encode are skipped). Variants are written to the
+"derivatives" storage (see backend.storage) under names derived from the
+original's content digest, so they never change once written and can be
+served with far-future caching.
+
+Generation runs on a thread pool after the upload's transaction commits and
+records the variant URLs in the model's `image_variants` field:
+
+    {"96": {"avif": url, "webp": url, "jpeg": url}, "320": {...}, ...}
+
+Until then (or for rows that predate this), `variant_url()` points at the
+lazy endpoint, which renders a single variant on first request and
+redirects to the stored file from then on.
+"""
+
+import hashlib
+import io
+import logging
+import posixpath
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from PIL import Image, ImageOps, features
+
+from store.caching import bump_cache_version
+
+
+logger = logging.getLogger(__name__)
+
+# Pillow format, file extension, feature name and encoder options per format.
+FORMATS = {
+    'avif': ('AVIF', 'avif', 'avif', {'quality': 55}),
+    'webp': ('WEBP', 'webp', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+_executor = None
+
+
+def variant_widths():
+    return list(settings.IMAGE_VARIANT_WIDTHS)
+
+
+def variant_formats():
+    return [format for format in settings.IMAGE_VARIANT_FORMATS if format in FORMATS and features.check(FORMATS[format][2])]
+
+
+def variant_name(name, width, format):
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    # Content-addressed originals already carry their digest; older names are hashed.
+    key = stem if DIGEST_RE.fullmatch(stem) else hashlib.sha256(name.encode()).hexdigest()
+    return f"variants/{key[:2]}/{key}/{width}.{FORMATS[format][1]}"
+
+
+def render(image, width, format):
+    pillow_format, _, _, options = FORMATS[format]
+    variant = image.copy()
+    variant.thumbnail((width, width * 4), Image.LANCZOS)
+    if pillow_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    output = io.BytesIO()
+    variant.save(output, pillow_format, **options)
+    return output.getvalue()
+
+
+def generate_variants(name, widths=None, formats=None):
+    """
+    Make sure every variant of the stored image `name` exists and return
+    their URLs as {width: {format: url}}. Existing variants are not redone.
+    """
+    widths = widths or variant_widths()
+    formats = formats or variant_formats()
+    derivatives = storages['derivatives']
+
+    missing = [
+        (width, format) for width in widths for format in formats
+        if not derivatives.exists(variant_name(name, width, format))
+    ]
+    if missing:
+        if not default_storage.exists(name):
+            return {}
+        with default_storage.open(name) as original:
+            image = Image.open(original)
+            # JPEG can decode straight at a reduced scale, which is most of the work.
+            image.draft('RGB', (max(widths), max(widths) * 4))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+            for width, format in missing:
+                derivatives.save(variant_name(name, width, format), ContentFile(render(image, width, format)))
+
+    return {
+        str(width): {format: derivatives.url(variant_name(name, width, format)) for format in formats}
+        for width in widths
+    }
+
+
+def variant_url(instance, width=None, format='webp'):
+    """
+    URL of one variant of `instance.image`: the stored one when generation has
+    finished, else the lazy endpoint.
+    """
+    if not instance.image:
+        return None
+    width = width or variant_widths()[0]
+    url = (instance.image_variants or {}).get(str(width), {}).get(format)
+    if url:
+        return url
+    return reverse('image_variant', kwargs={'width': width, 'image_format': format, 'name': instance.image.name})
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix="image-variants")
+    return _executor
+
+
+def update_variants(model, pk, name, namespace):
+    """
+    Generate the variants of `name` and record them on the row, unless its
+    image has been replaced in the meantime.
+    """
+    try:
+        variants = generate_variants(name)
+        if model._default_manager.filter(pk=pk, image=name).update(image_variants=variants):
+            bump_cache_version(namespace)
+    except Exception:
+        logger.exception("Could not generate image variants of %s", name)
+
+
+def run_in_worker(*args):
+    try:
+        update_variants(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance, namespace):
+    """
+    Generate variants for `instance.image` once the current transaction
+    commits, on the worker pool (inline when IMAGE_VARIANT_WORKERS is 0).
+    """
+    args = (type(instance), instance.pk, instance.image.name, namespace)
+
+    def submit():
+        if settings.IMAGE_VARIANT_WORKERS:
+            executor().submit(run_in_worker, *args)
+        else:
+            update_variants(*args)
+
+    transaction.on_commit(submit)
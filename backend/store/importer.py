@@ -0,0 +1,373 @@
+"""
+Streaming bulk import of products from CSV or JSON Lines feeds.
+
+Rows are read lazily and written in chunks, bypassing Product.save(): slugs,
+`sku` and `pid` values are generated in memory, `in_stock` is derived from
+`stock_qty`, and rows whose `sku` already exists are updated in place through
+the database's upsert (INSERT ... ON CONFLICT) support. An update only
+rewrites the columns the row actually gives, so a feed of `sku,stock_qty`
+changes stock and leaves prices, categories and descriptions alone.
+
+Chunks are sent as one prepared statement through executemany rather than
+bulk_create. Column defaults are prepared once per run, so the per-row cost
+is building a tuple instead of compiling a model instance into SQL, which is
+what keeps large feeds at tens of thousands of rows per second.
+
+Feeds uploaded through the admin are stored as ProductImportJob rows and run
+by the `process_product_imports` worker, so a large upload never holds an
+admin request open. A job is claimed with a leased UPDATE (see
+backend.leases) that every finished chunk extends and that records the rows
+written so far; the job of a worker that died becomes due again when the
+lease runs out, and is rerun from the top, which rewrites the same skus.
+"""
+
+import csv
+import io
+import json
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, models, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from backend.leases import claim_due
+from store.caching import bump_cache_version_on_commit
+from store.facets import refresh_products_on_commit
+from store.search import index_products
+from store.models import Category, Product, ProductImportJob
+
+
+BOOLEAN_FIELDS = ['featured', 'hot_deal', 'special_offer', 'digital']
+DECIMAL_FIELDS = ['price', 'old_price', 'shipping_amount']
+TEXT_FIELDS = ['title', 'description', 'tags', 'brand', 'status', 'type']
+
+# Columns an update may rewrite when a feed row matches an existing sku; each
+# row rewrites the ones it gives a value for.
+UPSERT_FIELDS = TEXT_FIELDS + DECIMAL_FIELDS + BOOLEAN_FIELDS + ['category', 'vendor', 'stock_qty', 'in_stock']
+
+COLUMNS = [field for field in Product._meta.concrete_fields if not field.primary_key]
+DECIMAL_COLUMNS = {name: Product._meta.get_field(name) for name in DECIMAL_FIELDS}
+
+# Text columns limited to the model's choices.
+CHOICE_FIELDS = {name: {value for value, _ in Product._meta.get_field(name).choices} for name in ['status', 'type']}
+
+SKU_FIELD = Product._meta.get_field('sku')
+PID_FIELD = Product._meta.get_field('pid')
+SLUG_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+# Import jobs: how long a claim lasts without progress, how long to wait
+# before rerunning a job that hit an unexpected error, and how many runs a
+# job gets.
+JOB_LEASE = 5 * 60
+JOB_RETRY_DELAY = 60
+JOB_MAX_ATTEMPTS = 3
+
+
+class ProductImportError(Exception):
+    def __init__(self, line, message):
+        self.line = line
+        super().__init__(f"Line {line}: {message}")
+
+
+def read_rows(stream, format):
+    """
+    Yield (line number, row dict) from a text stream of CSV or JSON Lines.
+    """
+    if format == 'csv':
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row
+    elif format == 'jsonl':
+        for line, text in enumerate(stream, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as error:
+                    raise ProductImportError(line, f"invalid JSON ({error.msg})")
+    else:
+        raise ValueError(f"Unknown import format: {format!r}")
+
+
+def text_value(line, row, field):
+    """
+    The row's value for a text column, stripped; numbers are taken as their
+    text. None when the row gives no value.
+    """
+    value = row.get(field)
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise ProductImportError(line, f"{field} must be text, not {type(value).__name__}")
+    return value.strip() or None
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+class ProductImporter:
+    """
+    Import products in chunks of `batch_size`. `progress`, when given, is
+    called with (rows imported so far, seconds elapsed) after every chunk.
+    """
+
+    def __init__(self, batch_size=2000, vendor=None, progress=None, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.using = using
+        self.batch_size = batch_size
+        self.vendor = vendor
+        self.progress = progress
+        self.rng = random.Random()
+        self.categories = None
+        self.used_skus = None
+        self.feed_skus = set()
+        self.generated_pids = set()
+        self.imported = 0
+        self.defaults = None
+        self.statements = {}
+
+    def run(self, stream, format):
+        started = time.perf_counter()
+        batch = []
+        for line, row in read_rows(stream, format):
+            batch.append((line, self.build(line, row)))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+                if self.progress:
+                    self.progress(self.imported, time.perf_counter() - started)
+        if batch:
+            self.flush(batch)
+            if self.progress:
+                self.progress(self.imported, time.perf_counter() - started)
+        return self.imported
+
+    def run_file(self, fileobj, format):
+        """
+        Import from a binary file object, e.g. an uploaded file.
+        """
+        return self.run(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''), format)
+
+    def flush(self, batch):
+        # A feed may list the same sku twice; an upsert may only touch a row once
+        # per statement, so the last occurrence wins.
+        lines = {values['sku']: line for line, values in batch}
+        batch = {values['sku']: values for _, values in batch}
+        try:
+            self.write(batch)
+        except IntegrityError as error:
+            # A generated pid can collide with one already stored; draw new
+            # ones and try once more. Anything else is the feed's fault.
+            if not self.replace_taken_pids(batch):
+                raise ProductImportError(min(lines.values()), f"chunk rejected by the database ({error})")
+            try:
+                self.write(batch)
+            except IntegrityError as error:
+                raise ProductImportError(min(lines.values()), f"chunk rejected by the database ({error})")
+        self.imported += len(batch)
+
+    def write(self, batch):
+        groups = {}
+        for values in batch.values():
+            groups.setdefault(values['_updates'], []).append(tuple(values[field.attname] for field in COLUMNS))
+        with transaction.atomic(using=self.using):
+            with self.connection.cursor() as cursor:
+                for updates, rows in groups.items():
+                    cursor.executemany(self.upsert_statement(updates), rows)
+            product_ids = list(Product.objects.using(self.using).filter(sku__in=list(batch)).values_list('pk', flat=True))
+            index_products(product_ids)
+            refresh_products_on_commit(product_ids)
+            bump_cache_version_on_commit("products")
+            bump_cache_version_on_commit("categories")
+
+    def replace_taken_pids(self, batch):
+        generated = {values['pid'] for values in batch.values() if values['pid'] in self.generated_pids}
+        taken = set(Product.objects.using(self.using).filter(pid__in=list(generated)).values_list('pid', flat=True))
+        for values in batch.values():
+            if values['pid'] in taken:
+                values['pid'] = self.new_pid()
+        return bool(taken)
+
+    def upsert_statement(self, updates):
+        """
+        The upsert for rows that give values for `updates` (UPSERT_FIELDS
+        names), prepared once per distinct set.
+        """
+        statement = self.statements.get(updates)
+        if statement is None:
+            quote = self.connection.ops.quote_name
+            columns = [Product._meta.get_field(name).column for name in UPSERT_FIELDS if name in updates]
+            statement = self.statements[updates] = "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO UPDATE SET %s" % (
+                quote(Product._meta.db_table),
+                ", ".join(quote(field.column) for field in COLUMNS),
+                ", ".join(["%s"] * len(COLUMNS)),
+                quote(SKU_FIELD.column),
+                ", ".join("%s = EXCLUDED.%s" % (quote(column), quote(column)) for column in columns),
+            )
+        return statement
+
+    def column_defaults(self):
+        """
+        Database-ready default for every column, computed once per run.
+        """
+        if self.defaults is None:
+            self.defaults = {field.attname: field.get_db_prep_save(field.get_default(), self.connection) for field in COLUMNS}
+            self.defaults['vendor_id'] = self.vendor.pk if self.vendor else None
+        return self.defaults
+
+    def build(self, line, row):
+        if not isinstance(row, dict):
+            raise ProductImportError(line, f"expected an object, not {type(row).__name__}")
+        text = {field: text_value(line, row, field) for field in TEXT_FIELDS + ['sku', 'pid', 'slug', 'category']}
+        title = text['title']
+        if not title:
+            raise ProductImportError(line, "title is required")
+        for field, choices in CHOICE_FIELDS.items():
+            if text[field] is not None and text[field] not in choices:
+                raise ProductImportError(line, f"{field} must be one of {', '.join(sorted(choices))}, not {text[field]!r}")
+
+        if text['sku']:
+            self.feed_skus.add(text['sku'])
+
+        values = dict(self.column_defaults())
+        updates = {'title'}
+        if self.vendor:
+            updates.add('vendor')
+        category = self.category(line, text['category'])
+        values.update(
+            title=title,
+            sku=text['sku'] or self.new_sku(),
+            pid=text['pid'] or self.new_pid(),
+            slug=text['slug'] or self.new_slug(title),
+            category_id=category.pk if category else None,
+        )
+        if category:
+            updates.add('category')
+        for field in TEXT_FIELDS[1:]:
+            if text[field] is not None:
+                updates.add(field)
+                values[field] = text[field]
+        for field in DECIMAL_FIELDS + BOOLEAN_FIELDS + ['stock_qty']:
+            if row.get(field) not in (None, ''):
+                updates.add(field)
+        if 'stock_qty' in updates:
+            updates.add('in_stock')
+        values['_updates'] = frozenset(updates)
+        for field in DECIMAL_FIELDS:
+            if row.get(field) not in (None, ''):
+                try:
+                    values[field] = DECIMAL_COLUMNS[field].get_db_prep_save(Decimal(str(row[field])), self.connection)
+                except (InvalidOperation, TypeError, ValueError):
+                    raise ProductImportError(line, f"{field} is not a number: {row[field]!r}")
+        for field in BOOLEAN_FIELDS:
+            if row.get(field) not in (None, ''):
+                values[field] = parse_bool(row[field])
+        try:
+            values['stock_qty'] = int(row.get('stock_qty') or 0)
+        except (TypeError, ValueError):
+            raise ProductImportError(line, f"stock_qty is not an integer: {row.get('stock_qty')!r}")
+        if values['stock_qty'] < 0:
+            raise ProductImportError(line, "stock_qty cannot be negative")
+        values['in_stock'] = values['stock_qty'] > 0
+        return values
+
+    def category(self, line, value):
+        if not value:
+            return None
+        if self.categories is None:
+            self.categories = {}
+            for category in Category.objects.all():
+                self.categories[category.slug] = category
+                self.categories[category.title.lower()] = category
+        category = self.categories.get(value) or self.categories.get(value.lower())
+        if category is None:
+            raise ProductImportError(line, f"unknown category {value!r}")
+        return category
+
+    def new_slug(self, title):
+        return slugify(title) + "-" + "".join(self.rng.choices(SLUG_ALPHABET, k=4))
+
+    def new_sku(self):
+        if self.used_skus is None:
+            self.used_skus = set(Product.objects.values_list('sku', flat=True).iterator())
+        if len(self.used_skus) >= len(SKU_FIELD.alphabet) ** SKU_FIELD.length:
+            raise ProductImportError(0, "no unused sku values left; give the feed explicit skus")
+        while True:
+            sku = SKU_FIELD.prefix + "".join(self.rng.choices(SKU_FIELD.alphabet, k=SKU_FIELD.length))
+            if sku not in self.used_skus and sku not in self.feed_skus:
+                self.used_skus.add(sku)
+                return sku
+
+    def new_pid(self):
+        # Unique within the run; clashes with stored pids are caught by flush().
+        while True:
+            pid = "".join(self.rng.choices(PID_FIELD.alphabet, k=PID_FIELD.length))
+            if pid not in self.generated_pids:
+                self.generated_pids.add(pid)
+                return pid
+
+
+def claim_job(lease=JOB_LEASE):
+    claimed = claim_due(
+        ProductImportJob.objects.filter(status__in=["queued", "running"]), 1, lease,
+        status="running", attempts=models.F('attempts') + 1,
+    )
+    return claimed.select_related('vendor').first()
+
+
+def run_job(job, batch_size=2000, lease=JOB_LEASE):
+    """
+    Run a claimed import job to the end, recording progress on the row.
+    """
+    def progress(imported, elapsed):
+        ProductImportJob.objects.filter(pk=job.pk, claim=job.claim).update(
+            imported=imported, next_attempt_at=timezone.now() + timedelta(seconds=lease)
+        )
+
+    importer = ProductImporter(batch_size=batch_size, vendor=job.vendor, progress=progress)
+    job.started_at = job.started_at or timezone.now()
+    try:
+        with job.file.open('rb') as fileobj:
+            importer.run_file(fileobj, job.format)
+    except (ProductImportError, UnicodeDecodeError, csv.Error) as error:
+        # The feed itself is bad; running it again would stop at the same row.
+        job.status = "failed"
+        job.error = f"{error} ({importer.imported} rows were imported before the error)"
+    except Exception as error:
+        job.error = f"{type(error).__name__}: {error}"[:2000]
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            job.status = "failed"
+        else:
+            job.status = "queued"
+            job.next_attempt_at = timezone.now() + timedelta(seconds=JOB_RETRY_DELAY)
+    else:
+        job.status = "done"
+        job.error = ""
+    job.imported = importer.imported
+    if job.status != "queued":
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'imported', 'next_attempt_at', 'started_at', 'finished_at'])
+    return job
+
+
+def process_next_job(batch_size=2000):
+    """
+    Run one due import job. Returns the job, or None when nothing is due.
+    """
+    job = claim_job()
+    if job is None:
+        return None
+    if job.attempts > JOB_MAX_ATTEMPTS:
+        # Its worker died on every run so far.
+        job.status = "failed"
+        job.error = job.error or "The worker stopped during every run of this job."
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+    return run_job(job, batch_size)
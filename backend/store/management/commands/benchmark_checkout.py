@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from userauths.models import User
+from vendor.models import Vendor
+from store.caching import bump_cache_version
+from store.checkout import place_order
+from store.models import Cart, Coupon, Product
+
+
+DETAILS = {'full_name': "Bench Buyer", 'email': "buyer@example.com", 'mobile': "0", 'country': "Bench"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Place orders from carts of growing size and print the number of SQL statements and the time each "
+        "takes. Everything runs in a transaction that is rolled back, so the configured database is left "
+        "untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000], help="Cart sizes (lines) to place.")
+        parser.add_argument('--vendors', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            self.run(options)
+        finally:
+            # The coupon map was cached with the seeded coupons, which are rolled back.
+            bump_cache_version("coupons")
+
+    def run(self, options):
+        with transaction.atomic():
+            products = self.seed(max(options['sizes']), options['vendors'])
+            self.stdout.write(f"{'lines':>6} {'statements':>11} {'ms':>9}")
+            for size in options['sizes']:
+                cart_id = f"bench-checkout-{size}"
+                Cart.objects.bulk_create([Cart(cart_id=cart_id, product=product, qty=2) for product in products[:size]])
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    place_order(cart_id, DETAILS, coupon_codes=["BENCH"])
+                    elapsed = (time.perf_counter() - started) * 1000
+                statements = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith(("SAVEPOINT", "RELEASE"))]
+                self.stdout.write(f"{size:>6} {len(statements):>11} {elapsed:>9.1f}")
+            transaction.set_rollback(True)
+
+    def seed(self, count, vendors):
+        users = User.objects.bulk_create([User(email=f"checkoutbench{i}@example.com", username=f"checkoutbench{i}") for i in range(vendors)])
+        users = User.objects.filter(username__startswith="checkoutbench").order_by('pk')
+        Vendor.objects.bulk_create([Vendor(user=user, name=f"Vendor {i}", slug=f"checkoutbench-vendor-{i}") for i, user in enumerate(users)])
+        vendor_ids = list(Vendor.objects.filter(slug__startswith="checkoutbench-vendor-").values_list('id', flat=True))
+        Coupon.objects.bulk_create([Coupon(vendor_id=vendor_id, code="BENCH", discount=10) for vendor_id in vendor_ids[::2]])
+        bump_cache_version("coupons")
+        Product.objects.bulk_create([
+            Product(
+                title=f"Product {i}", slug=f"checkoutbench-product-{i}", sku=f"CB{i:08d}", pid=f"cb{i:010d}",
+                vendor_id=vendor_ids[i % len(vendor_ids)], price=10 + i % 90, shipping_amount=2, stock_qty=100,
+            )
+            for i in range(count)
+        ])
+        return list(Product.objects.filter(slug__startswith="checkoutbench-product-").order_by('pk'))
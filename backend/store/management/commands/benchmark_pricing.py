@@ -0,0 +1,64 @@
+import random
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store import pricing
+
+
+class Command(BaseCommand):
+    help = (
+        "Price a synthetic cart with store.pricing on the NumPy and the pure Python path, compare the "
+        "results with per-line Decimal arithmetic and print timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=1000, help="Distinct unit prices among the lines.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        catalog = [(Decimal(rng.randint(50, 500_000)) / 100, Decimal(rng.randint(0, 2000)) / 100) for _ in range(options['products'])]
+        lines = [rng.choice(catalog) for _ in range(options['lines'])]
+        qty = [rng.randint(1, 200) for _ in lines]
+        price = [line[0] for line in lines]
+        shipping = [line[1] for line in lines]
+        tax = [rng.choice([Decimal(0), Decimal('7.25'), Decimal('12.5'), Decimal(20)]) for _ in lines]
+        discount = [rng.choice([0, 0, 0, 5, 10, 25]) for _ in lines]
+        args = (qty, price, shipping, tax, discount)
+
+        expected = [self.reference(*line) for line in zip(*args)]
+        scenarios = [("per-line Decimal", lambda: [self.reference(*line) for line in zip(*args)])]
+        paths = [False] + ([True] if pricing.numpy is not None else [])
+        for use_numpy in paths:
+            label = "numpy" if use_numpy else "python"
+            priced = pricing.price_lines(*args, use_numpy=use_numpy)
+            if [priced.line(i) for i in range(len(lines))] != expected:
+                raise CommandError(f"The {label} path disagrees with per-line Decimal arithmetic")
+            scenarios.append((f"{label}, totals", lambda use_numpy=use_numpy: pricing.price_lines(*args, use_numpy=use_numpy).totals))
+            scenarios.append((f"{label}, all line amounts", lambda use_numpy=use_numpy: pricing.price_lines(*args, use_numpy=use_numpy).columns))
+        if pricing.numpy is None:
+            self.stdout.write("numpy is not installed; only the pure Python path is timed.")
+
+        self.stdout.write(f"{len(lines)} lines, {options['products']} distinct products, results identical on every path.")
+        for label, run in scenarios:
+            run()
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                run()
+            elapsed = (time.perf_counter() - started) * 1000 / options['repeat']
+            self.stdout.write(f"  {label:<28} {elapsed:>9.2f} ms")
+
+    def reference(self, qty, price, shipping, tax, discount):
+        # The straightforward per-line computation, for checking and comparison.
+        sub_total = price * qty
+        shipping_amount = shipping * qty
+        service_fee = (sub_total * settings.CART_SERVICE_FEE_RATE).quantize(pricing.CENT, ROUND_HALF_UP)
+        tax_fee = ((sub_total + shipping_amount) * tax / 100).quantize(pricing.CENT, ROUND_HALF_UP)
+        initial_total = sub_total + shipping_amount + service_fee + tax_fee
+        saved = (initial_total * discount / 100).quantize(pricing.CENT, ROUND_HALF_UP)
+        values = (sub_total, shipping_amount, service_fee, tax_fee, initial_total, saved, initial_total - saved)
+        return dict(zip(pricing.AMOUNTS, values))
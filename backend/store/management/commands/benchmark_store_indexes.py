@@ -0,0 +1,198 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from userauths.models import User
+from vendor.models import Vendor
+from store.models import Cart, CartOrder, CartOrderItem, Category, Notification, Product, Wishlist
+
+
+INDEXED_MODELS = [Product, Cart, CartOrder, CartOrderItem, Notification, Wishlist]
+# Foreign keys whose single-column index was replaced by a composite one;
+# recreated for the "without" run so it matches the schema before the change.
+FOREIGN_KEY_INDEXES = [(Product, 'vendor'), (CartOrderItem, 'vendor'), (Wishlist, 'user')]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway catalog and order history, then print query plans and timings for the store "
+        "hot-path queries with and without the Meta.indexes of the store models. Everything runs in a "
+        "transaction that is rolled back, so the configured database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Approximate number of rows to seed across all tables.")
+        parser.add_argument('--repeat', type=int, default=20, help="Executions per query when timing.")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.repeat = options['repeat']
+
+        with transaction.atomic():
+            fixtures = self.seed(options['rows'])
+            queries = self.hot_queries(fixtures)
+
+            # Baseline first, so neither run gets a warmer page cache.
+            self.drop_indexes()
+            self.analyze()
+            before = self.run(queries, "without indexes")
+            self.restore_indexes()
+            self.analyze()
+            after = self.run(queries, "with indexes")
+
+            self.stdout.write("\nSummary (ms per query, without -> with):")
+            for label in queries:
+                self.stdout.write(f"  {label:<40} {before[label]:>9.3f} -> {after[label]:>9.3f}")
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        rng = random.Random(42)
+        now = timezone.now()
+        n_products = rows * 4 // 10
+        n_carts = rows * 2 // 10
+        n_orders = rows // 10
+        n_items = rows * 15 // 100
+        n_notifications = rows // 20
+        n_users = max(rows // 1000, 10)
+
+        self.stdout.write(f"Seeding {n_products} products, {n_carts} cart lines, {n_orders} orders, {n_items} order items...")
+
+        User.objects.bulk_create(
+            [User(email=f"bench{i}@example.com", username=f"bench{i}") for i in range(n_users)],
+            batch_size=self.batch_size,
+        )
+        user_ids = list(User.objects.filter(username__startswith="bench").values_list('id', flat=True))
+        Vendor.objects.bulk_create(
+            [Vendor(user_id=user_id, name=f"Vendor {i}", slug=f"bench-vendor-{i}") for i, user_id in enumerate(user_ids[:50])]
+        )
+        vendor_ids = list(Vendor.objects.filter(slug__startswith="bench-vendor-").values_list('id', flat=True))
+        Category.objects.bulk_create([Category(title=f"Category {i}", slug=f"bench-category-{i}") for i in range(40)])
+        category_ids = list(Category.objects.filter(slug__startswith="bench-category-").values_list('id', flat=True))
+
+        statuses = ["published"] * 8 + ["draft", "in_review"]
+        self.bulk(Product, n_products, lambda i: Product(
+            title=f"Product {i}",
+            slug=f"bench-product-{i}",
+            sku=f"SKU{i:08d}",
+            pid=f"bench{i:010d}",
+            category_id=rng.choice(category_ids),
+            vendor_id=rng.choice(vendor_ids),
+            status=rng.choice(statuses),
+            featured=rng.random() < 0.02,
+            hot_deal=rng.random() < 0.02,
+            stock_qty=rng.randint(0, 50),
+            in_stock=rng.random() < 0.9,
+            date=now,
+        ))
+        product_ids = list(Product.objects.filter(slug__startswith="bench-product-").values_list('id', flat=True))
+
+        cart_ids = [f"bench-cart-{i:08d}" for i in range(max(n_carts // 3, 1))]
+        self.bulk(Cart, n_carts, lambda i: Cart(product_id=rng.choice(product_ids), cart_id=rng.choice(cart_ids), qty=1))
+
+        payment_statuses = ["paid"] * 6 + ["initiated", "pending", "cancelled", "refunded"]
+        self.bulk(CartOrder, n_orders, lambda i: CartOrder(
+            buyer_id=rng.choice(user_ids),
+            payment_status=rng.choice(payment_statuses),
+            oid=f"bench{i:010d}",
+            full_name="Bench", email="bench@example.com", mobile="0",
+            date=now,
+        ))
+        order_ids = list(CartOrder.objects.filter(oid__startswith="bench").values_list('id', flat=True))
+
+        self.bulk(CartOrderItem, n_items, lambda i: CartOrderItem(
+            order_id=rng.choice(order_ids),
+            product_id=rng.choice(product_ids),
+            vendor_id=rng.choice(vendor_ids),
+            oid=f"bench{i:010d}",
+            date=now,
+        ))
+        self.bulk(Notification, n_notifications, lambda i: Notification(
+            user_id=rng.choice(user_ids) if i % 2 else None,
+            vendor_id=None if i % 2 else rng.choice(vendor_ids),
+            seen=rng.random() < 0.7,
+        ))
+        self.bulk(Wishlist, n_notifications, lambda i: Wishlist(user_id=rng.choice(user_ids), product_id=rng.choice(product_ids)))
+
+        return {
+            'category': category_ids[0],
+            'vendor': vendor_ids[0],
+            'user': user_ids[0],
+            'product': product_ids[len(product_ids) // 2],
+            'cart_id': cart_ids[len(cart_ids) // 2],
+            'oid': f"bench{n_orders // 2:010d}",
+        }
+
+    def bulk(self, model, count, build):
+        for start in range(0, count, self.batch_size):
+            model.objects.bulk_create([build(i) for i in range(start, min(start + self.batch_size, count))])
+
+    def hot_queries(self, f):
+        published = Product.objects.filter(status="published")
+        return {
+            "product: published by category": published.filter(category_id=f['category'])[:20],
+            "product: published featured": published.filter(featured=True)[:20],
+            "product: published hot deals": published.filter(hot_deal=True)[:20],
+            "product: published in stock": published.filter(in_stock=True)[:20],
+            "product: vendor dashboard": Product.objects.filter(vendor_id=f['vendor'], status="published"),
+            "cart: lines by cart_id": Cart.objects.filter(cart_id=f['cart_id']),
+            "cart: line lookup": Cart.objects.filter(cart_id=f['cart_id'], product_id=f['product']),
+            "order: by oid": CartOrder.objects.filter(oid=f['oid']),
+            "order: buyer paid history": CartOrder.objects.filter(buyer_id=f['user'], payment_status="paid")[:20],
+            "order: recent paid": CartOrder.objects.filter(payment_status="paid")[:20],
+            "order item: by oid": CartOrderItem.objects.filter(oid=f['oid']),
+            "order item: vendor recent": CartOrderItem.objects.filter(vendor_id=f['vendor'])[:20],
+            "notification: user unseen": Notification.objects.filter(user_id=f['user'], seen=False),
+            "notification: vendor unseen": Notification.objects.filter(vendor_id=f['vendor'], seen=False),
+            "wishlist: user has product": Wishlist.objects.filter(user_id=f['user'], product_id=f['product']),
+        }
+
+    def run(self, queries, heading):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {heading} =="))
+        timings = {}
+        for label, queryset in queries.items():
+            # Time the statement alone; building model instances would swamp
+            # the difference an index makes on small result sets.
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                started = time.perf_counter()
+                for _ in range(self.repeat):
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+            timings[label] = (time.perf_counter() - started) * 1000 / self.repeat
+            self.stdout.write(f"\n{label}: {timings[label]:.3f} ms")
+            self.stdout.write(queryset.explain())
+        return timings
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute("DROP INDEX %s" % connection.ops.quote_name(index.name))
+            for model, name in FOREIGN_KEY_INDEXES:
+                column = model._meta.get_field(name).column
+                cursor.execute("CREATE INDEX %s ON %s (%s)" % (
+                    connection.ops.quote_name(f"bench_{model._meta.db_table}_{column}"),
+                    connection.ops.quote_name(model._meta.db_table),
+                    connection.ops.quote_name(column),
+                ))
+
+    def restore_indexes(self):
+        editor = connection.SchemaEditorClass(connection)
+        with connection.cursor() as cursor:
+            for model, name in FOREIGN_KEY_INDEXES:
+                column = model._meta.get_field(name).column
+                cursor.execute("DROP INDEX %s" % connection.ops.quote_name(f"bench_{model._meta.db_table}_{column}"))
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.create_sql(model, editor)))
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
@@ -0,0 +1,81 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import CartOrder
+from store.payments import sign_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Act as a local payment provider: send signed checkout.session webhook events for orders "
+        "that have a stripe_session_id to a running server, with duplicate deliveries and events out of order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default="http://127.0.0.1:8000/api/v1/payments/webhook/")
+        parser.add_argument('--orders', type=int, default=10, help="Number of orders to send events for.")
+        parser.add_argument('--duplicates', type=int, default=3, help="Deliveries of each event.")
+        parser.add_argument('--secret', default=None, help="Signing secret (default STRIPE_WEBHOOK_SECRET).")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        secret = options['secret'] or settings.STRIPE_WEBHOOK_SECRET
+        if not secret:
+            raise CommandError("Set STRIPE_WEBHOOK_SECRET or pass --secret.")
+        rng = random.Random(options['seed'])
+
+        sessions = list(
+            CartOrder.objects.exclude(stripe_session_id=None).exclude(stripe_session_id="")
+            .values_list('stripe_session_id', flat=True)[:options['orders']]
+        )
+        if not sessions:
+            raise CommandError("No orders with a stripe_session_id.")
+
+        events = []
+        for session_id in sessions:
+            events.append(self.event('checkout.session.completed', session_id, payment_status="paid"))
+            # A late expiry, as providers may send after a completed session; it must be ignored.
+            events.append(self.event('checkout.session.expired', session_id, payment_status="unpaid"))
+        deliveries = [event for event in events for _ in range(options['duplicates'])]
+        rng.shuffle(deliveries)
+
+        counts = {}
+        started = time.perf_counter()
+        for event in deliveries:
+            code = self.deliver(options['url'], event, secret)
+            counts[code] = counts.get(code, 0) + 1
+        elapsed = time.perf_counter() - started
+
+        summary = ", ".join(f"{count} x {code}" for code, count in sorted(counts.items()))
+        self.stdout.write(
+            f"Sent {len(deliveries)} deliveries of {len(events)} events for {len(sessions)} sessions "
+            f"in {elapsed:.2f}s: {summary}."
+        )
+        self.stdout.write("Run process_payment_events --once to apply them.")
+
+    def event(self, event_type, session_id, **session):
+        return {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": {"object": {"id": session_id, "object": "checkout.session", **session}},
+        }
+
+    def deliver(self, url, event, secret):
+        payload = json.dumps(event).encode()
+        request = urllib.request.Request(url, data=payload, method="POST", headers={
+            "Content-Type": "application/json",
+            "Stripe-Signature": sign_payload(payload, secret),
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.images import run_in_worker
+from store.models import IMAGE_MODELS
+
+
+class Command(BaseCommand):
+    help = "Render the responsive variants of product, gallery, category and brand images that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Also revisit rows that already list their variants.")
+        parser.add_argument('--workers', type=int, default=max(settings.IMAGE_VARIANT_WORKERS, 1))
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix="image-variants") as pool:
+            for model, namespace in IMAGE_MODELS.items():
+                rows = model._default_manager.exclude(image="").exclude(image=None)
+                if not options['all']:
+                    rows = rows.filter(image_variants={})
+                jobs = [(model, pk, name, namespace) for pk, name in rows.values_list('pk', 'image').iterator()]
+                list(pool.map(lambda job: run_in_worker(*job), jobs))
+                self.stdout.write(f"{model._meta.verbose_name_plural}: {len(jobs)} images processed.")
+
+        self.stdout.write(self.style.SUCCESS("Image variants are up to date."))
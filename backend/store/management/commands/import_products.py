@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import ProductImporter, ProductImportError
+from vendor.models import Vendor
+
+
+class Command(BaseCommand):
+    help = "Bulk import products from a CSV or JSON Lines feed. Rows with an existing sku are updated."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file (.csv or .jsonl).")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--vendor', type=int, help="Vendor id assigned to every imported product.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        format = options['format'] or path.suffix.lstrip('.').lower()
+        if format not in ('csv', 'jsonl'):
+            raise CommandError("Cannot tell the feed format from the file name; pass --format.")
+
+        vendor = None
+        if options['vendor']:
+            try:
+                vendor = Vendor.objects.get(pk=options['vendor'])
+            except Vendor.DoesNotExist:
+                raise CommandError(f"Vendor {options['vendor']} does not exist.")
+
+        def progress(imported, elapsed):
+            rate = imported / elapsed if elapsed else 0
+            self.stdout.write(f"{imported} rows imported ({rate:,.0f} rows/s)")
+
+        importer = ProductImporter(batch_size=options['batch_size'], vendor=vendor, progress=progress)
+        try:
+            with path.open(encoding='utf-8-sig', newline='') as stream:
+                imported = importer.run(stream, format)
+        except ProductImportError as error:
+            raise CommandError(f"{error} ({importer.imported} rows were imported before the error)")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} products."))
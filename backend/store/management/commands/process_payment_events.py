@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.payments import process_batch
+
+
+class Command(BaseCommand):
+    help = "Apply stored payment webhook events to orders. Runs until interrupted unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no event is due.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to wait when nothing is due.")
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                claimed = process_batch(options['batch_size'])
+                processed += claimed
+                if claimed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} payment events."))
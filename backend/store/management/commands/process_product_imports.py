@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.importer import process_next_job
+
+
+class Command(BaseCommand):
+    help = "Run product feeds uploaded through the admin. Runs until interrupted unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no import is due.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to wait when nothing is due.")
+
+    def handle(self, *args, **options):
+        finished = 0
+        try:
+            while True:
+                job = process_next_job(options['batch_size'])
+                if job is not None:
+                    finished += 1
+                    self.stdout.write(f"{job}: {job.imported} rows imported{f' ({job.error})' if job.error else ''}")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {finished} import jobs."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.cart import rebuild_sessions
+
+
+class Command(BaseCommand):
+    help = "Recompute the totals of every cart header (CartSession) from its lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of carts written per statement.")
+
+    def handle(self, *args, **options):
+        carts = rebuild_sessions(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt totals for {carts} carts."))
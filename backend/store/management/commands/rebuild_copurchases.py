@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from store.models import CartOrderItem, ProductCoPurchase
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductCoPurchase pair counts from historical paid CartOrderItem rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of pair rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Self-join order items on their order: one row per (product, other) with
+        # the number of distinct paid orders containing both.
+        pairs = (
+            CartOrderItem.objects
+            .filter(order__payment_status="paid")
+            .exclude(product=F('order__orderitem__product'))
+            .values_list('product', 'order__orderitem__product')
+            .annotate(count=Count('order', distinct=True))
+            .order_by()
+        )
+
+        created = 0
+        with transaction.atomic():
+            ProductCoPurchase.objects.all().delete()
+            batch = []
+            for product_id, other_id, count in pairs.iterator(chunk_size=batch_size):
+                batch.append(ProductCoPurchase(product_id=product_id, other_id=other_id, count=count))
+                if len(batch) >= batch_size:
+                    ProductCoPurchase.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            ProductCoPurchase.objects.bulk_create(batch)
+            created += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} co-purchase pairs."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Floor
+
+from store.models import CartOrderItem, Product, Review
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.rating, rating_avg, rating_count and paid_order_count from reviews and paid orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of products updated per statement.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        paid_items = CartOrderItem.objects.filter(product=OuterRef('pk'), order__payment_status="paid").order_by().values('product')
+        rating_avg = Coalesce(Subquery(reviews.annotate(v=Avg('rating')).values('v')), Value(0.0))
+        counters = {
+            'rating_avg': rating_avg,
+            'rating': Cast(Floor(rating_avg), IntegerField()),
+            'rating_count': Coalesce(Subquery(reviews.annotate(v=Count('id')).values('v'), output_field=IntegerField()), Value(0)),
+            'paid_order_count': Coalesce(Subquery(paid_items.annotate(v=Count('id')).values('v'), output_field=IntegerField()), Value(0)),
+        }
+
+        ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += Product.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).update(**counters)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {updated} products."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from store.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text product search index from the product table."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            raise CommandError(f"Full-text search is not supported on {connection.vendor}; search falls back to icontains.")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.drop(cursor)
+            backend.create(cursor)
+            backend.index(cursor)
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt the product search index."))
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:59
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_product_counters(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Review = apps.get_model("store", "Review")
+    CartOrderItem = apps.get_model("store", "CartOrderItem")
+
+    reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    paid_items = (
+        CartOrderItem.objects.filter(
+            product=OuterRef("pk"), order__payment_status="paid"
+        )
+        .order_by()
+        .values("product")
+    )
+    Product.objects.update(
+        rating_avg=Coalesce(
+            Subquery(reviews.annotate(v=Avg("rating")).values("v")), Value(0.0)
+        ),
+        rating_count=Coalesce(
+            Subquery(
+                reviews.annotate(v=Count("id")).values("v"), output_field=IntegerField()
+            ),
+            Value(0),
+        ),
+        paid_order_count=Coalesce(
+            Subquery(
+                paid_items.annotate(v=Count("id")).values("v"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0004_brand_coupon_deliverycouriers_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="paid_order_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_avg",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_product_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0005_product_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCoPurchase",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="copurchased_with",
+                        to="store.product",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="copurchases",
+                        to="store.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Product Co-Purchases",
+                "indexes": [
+                    models.Index(
+                        fields=["product", "-count"], name="store_copurchase_top_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="productcopurchase",
+            constraint=models.UniqueConstraint(
+                fields=("product", "other"), name="unique_product_copurchase"
+            ),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0006_productcopurchase"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cart",
+            index=models.Index(
+                fields=["cart_id", "product"], name="store_cart_cart_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(fields=["oid"], name="store_order_oid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(
+                fields=["buyer", "payment_status", "-date"],
+                name="store_order_buyer_paid_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(
+                fields=["payment_status", "-date"], name="store_order_paid_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cartorderitem",
+            index=models.Index(fields=["oid"], name="store_orderitem_oid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="cartorderitem",
+            index=models.Index(
+                fields=["vendor", "-date"], name="store_orderitem_vendor_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "seen"], name="store_notif_user_seen_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["vendor", "seen"], name="store_notif_vendor_seen_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("status", "published")),
+                fields=["category", "-id"],
+                name="store_prod_pub_category_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("featured", True), ("status", "published")),
+                fields=["-id"],
+                name="store_prod_pub_featured_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("hot_deal", True), ("status", "published")),
+                fields=["-id"],
+                name="store_prod_pub_hot_deal_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("status", "published")),
+                fields=["in_stock", "-id"],
+                name="store_prod_pub_in_stock_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["vendor", "status"], name="store_prod_vendor_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["status", "featured"], name="store_prod_status_feat_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wishlist",
+            index=models.Index(
+                fields=["user", "product"], name="store_wishlist_user_prod_idx"
+            ),
+        ),
+    ]
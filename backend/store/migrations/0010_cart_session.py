@@ -0,0 +1,101 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+import django.db.models.deletion
+
+
+AMOUNTS = ["sub_total", "shipping_amount", "service_fee", "tax_fee", "total"]
+
+
+def backfill_cart_sessions(apps, schema_editor):
+    Cart = apps.get_model("store", "Cart")
+    CartSession = apps.get_model("store", "CartSession")
+
+    totals = (
+        Cart.objects.exclude(cart_id=None)
+        .order_by("cart_id")
+        .values("cart_id")
+        .annotate(
+            lines=Count("id"),
+            items=Sum("qty"),
+            cart_user=Max("user_id"),
+            cart_country=Max("country"),
+            **{f"sum_{name}": Sum(name) for name in AMOUNTS},
+        )
+    )
+    CartSession.objects.bulk_create(
+        [
+            CartSession(
+                cart_id=row["cart_id"],
+                user_id=row["cart_user"],
+                country=row["cart_country"],
+                line_count=row["lines"],
+                item_count=row["items"] or 0,
+                **{name: row[f"sum_{name}"] or 0 for name in AMOUNTS},
+            )
+            for row in totals.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("store", "0009_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CartSession",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cart_id", models.CharField(max_length=1000, unique=True)),
+                ("country", models.CharField(blank=True, max_length=100, null=True)),
+                ("line_count", models.PositiveIntegerField(default=0)),
+                ("item_count", models.PositiveIntegerField(default=0)),
+                (
+                    "sub_total",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+                ),
+                (
+                    "shipping_amount",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+                ),
+                (
+                    "service_fee",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+                ),
+                (
+                    "tax_fee",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+                ),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=12),
+                ),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_cart_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0010_cart_session"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_id", models.CharField(max_length=255, unique=True)),
+                ("type", models.CharField(max_length=100)),
+                (
+                    "session_id",
+                    models.CharField(blank=True, default="", max_length=200),
+                ),
+                ("payload", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("applied", "Applied"),
+                            ("ignored", "Ignored"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("claim", models.CharField(blank=True, default="", max_length=32)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-received_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="cartorder",
+            index=models.Index(
+                fields=["stripe_session_id"], name="store_order_stripe_session_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymentevent",
+            index=models.Index(
+                condition=models.Q(("status", "pending")),
+                fields=["next_attempt_at"],
+                name="store_payevent_due_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymentevent",
+            index=models.Index(fields=["claim"], name="store_payevent_claim_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="paymentevent",
+            index=models.Index(
+                fields=["session_id"], name="store_payevent_session_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def normalize_coupons(apps, schema_editor):
+    Coupon = apps.get_model("store", "Coupon")
+    CouponRedemption = apps.get_model("store", "CouponRedemption")
+
+    # Normalize codes; where a vendor ends up with one code twice, keep the
+    # newest active coupon under it and retire the others under a suffixed code.
+    kept = set()
+    for coupon in Coupon.objects.order_by("-active", "-id").iterator():
+        code = (coupon.code or "").strip().upper()
+        active = coupon.active
+        if coupon.vendor_id is not None and (coupon.vendor_id, code) in kept:
+            code, active = f"{code}-{coupon.cid.upper()}", False
+        kept.add((coupon.vendor_id, code))
+        if (code, active) != (coupon.code, coupon.active):
+            coupon.code, coupon.active = code, active
+            coupon.save(update_fields=["code", "active"])
+
+    used_by = Coupon.used_by.through.objects.values_list("coupon_id", "user_id")
+    CouponRedemption.objects.bulk_create(
+        [CouponRedemption(coupon_id=coupon_id, user_id=user_id) for coupon_id, user_id in used_by.iterator()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("store", "0011_payment_events"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CouponRedemption",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="couponredemption",
+            name="coupon",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="redemptions",
+                to="store.coupon",
+            ),
+        ),
+        migrations.AddField(
+            model_name="couponredemption",
+            name="order",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="store.cartorder",
+            ),
+        ),
+        migrations.AddField(
+            model_name="couponredemption",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="coupon_redemptions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="couponredemption",
+            constraint=models.UniqueConstraint(
+                fields=("coupon", "user"), name="store_coupon_redemption_uniq"
+            ),
+        ),
+        migrations.RunPython(normalize_coupons, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="coupon",
+            name="used_by",
+        ),
+        migrations.AddConstraint(
+            model_name="coupon",
+            constraint=models.UniqueConstraint(
+                fields=("vendor", "code"), name="store_coupon_vendor_code_uniq"
+            ),
+        ),
+    ]
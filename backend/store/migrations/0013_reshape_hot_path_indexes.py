@@ -0,0 +1,86 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("vendor", "0001_initial"),
+        ("store", "0012_coupon_redemptions"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="notification",
+            name="store_notif_user_seen_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="notification",
+            name="store_notif_vendor_seen_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="store_prod_pub_category_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="store_prod_pub_in_stock_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="store_prod_status_feat_idx",
+        ),
+        migrations.AlterField(
+            model_name="cartorderitem",
+            name="vendor",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="vendor.vendor",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="vendor",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="vendor",
+                to="vendor.vendor",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="wishlist",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("seen", False)),
+                fields=["user"],
+                name="store_notif_user_unseen_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("seen", False)),
+                fields=["vendor"],
+                name="store_notif_vendor_unseen_idx",
+            ),
+        ),
+    ]
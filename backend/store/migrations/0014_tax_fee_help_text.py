@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0013_reshape_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cartorderitem",
+            name="tax_fee",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0.0,
+                help_text="Estimated Vat based on delivery country = tax_rate * (sub_total + shipping)",
+                max_digits=12,
+            ),
+        ),
+    ]
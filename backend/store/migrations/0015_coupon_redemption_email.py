@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Lower
+
+
+def backfill_redemption_emails(apps, schema_editor):
+    CouponRedemption = apps.get_model("store", "CouponRedemption")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    CouponRedemption.objects.update(
+        email=Subquery(User.objects.filter(pk=OuterRef("user_id")).values(email_lower=Lower("email"))[:1])
+    )
+    # Users' emails are unique, but only as typed: two accounts whose emails
+    # differ in case now share one, and may both have used a coupon. Keep the
+    # first use; the shared email still bars the other account from the coupon.
+    clashes = (
+        CouponRedemption.objects.values("coupon_id", "email")
+        .annotate(uses=Count("pk"), first=Min("pk"))
+        .filter(uses__gt=1)
+        .order_by()
+    )
+    for clash in clashes:
+        CouponRedemption.objects.filter(coupon_id=clash["coupon_id"], email=clash["email"]).exclude(pk=clash["first"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("store", "0014_tax_fee_help_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="couponredemption",
+            name="email",
+            field=models.EmailField(default="", help_text="Order email, lower case", max_length=254),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_redemption_emails, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="couponredemption",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="coupon_redemptions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="couponredemption",
+            constraint=models.UniqueConstraint(fields=("coupon", "email"), name="store_coupon_redemption_email_uniq"),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, transaction
 from shortuuid.django_fields import ShortUUIDField
 from django.utils.html import mark_safe
 from django.utils import timezone
@@ -11,12 +11,16 @@ from django.shortcuts import redirect
 from django.dispatch import receiver
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models.signals import post_save
+from django.db.models.functions import Cast, Floor
+from django.db.models.signals import post_save, post_delete, post_init, pre_delete, pre_save
 from django.dispatch import receiver
 
 
 from userauths.models import User, user_directory_path, Profile
 from vendor.models import Vendor
+from store.caching import bump_cache_version_on_commit, get_or_set_versioned
+from store import facets, images, search
+from store.coupons import normalize_code
 
 import shortuuid
 import datetime
@@ -143,6 +147,7 @@ RATING = (
 class Category(models.Model):
     title = models.CharField(max_length=100)
     image = models.ImageField(upload_to=user_directory_path, default="category.jpg", null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     active = models.BooleanField(default=True)
     slug = models.SlugField(null=True, blank=True)
 
@@ -150,14 +155,40 @@ class Category(models.Model):
         verbose_name_plural = "Categories"
 
     def thumbnail(self):
-        return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (self.image.url))
+        return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (images.variant_url(self)))
 
     def __str__(self):
         return self.title
     
+    @classmethod
+    def summary(cls):
+        """
+        Active categories with their slug, thumbnail URL and number of published
+        products, served from the cache until a Product or Category changes.
+        """
+        return get_or_set_versioned("categories", ["summary"], cls._build_summary)
+
+    @classmethod
+    def _build_summary(cls):
+        categories = cls.objects.filter(active=True).annotate(
+            published_count=models.Count('category', filter=models.Q(category__status="published"))
+        ).order_by('title')
+        return [
+            {
+                'id': category.id,
+                'title': category.title,
+                'slug': category.slug,
+                'thumbnail': images.variant_url(category),
+                'product_count': category.published_count,
+            }
+            for category in categories
+        ]
+
     def product_count(self):
-        product_count = Product.objects.filter(category=self).count()
-        return product_count
+        for entry in Category.summary():
+            if entry['id'] == self.id:
+                return entry['product_count']
+        return Product.objects.filter(category=self, status="published").count()
     
     def cat_products(self):
         cat_products = Product.objects.filter(category=self)
@@ -171,6 +202,20 @@ class Category(models.Model):
         super(Category, self).save(*args, **kwargs) 
 
 
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    bump_cache_version_on_commit("categories")
+    bump_cache_version_on_commit("products")
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Vendor)
+def rebuild_facet_index(sender, **kwargs):
+    # Products are detached by SET_NULL in SQL, without signals of their own.
+    bump_cache_version_on_commit("facets")
+
+
 class Tag(models.Model):
     title = models.CharField(max_length=30)
     category = models.ForeignKey(Category, default="", verbose_name="Category", on_delete=models.PROTECT)
@@ -187,20 +232,104 @@ class Tag(models.Model):
 class Brand(models.Model):
     title = models.CharField(max_length=100)
     image = models.ImageField(upload_to=user_directory_path, default="brand.jpg", null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     active = models.BooleanField(default=True)
     
     class Meta:
         verbose_name_plural = "Brands"
 
     def brand_image(self):
-        return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (self.image.url))
+        return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (images.variant_url(self)))
 
     def __str__(self):
         return self.title
 
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_brand_cache(sender, **kwargs):
+    bump_cache_version_on_commit("brands")
+
+
+# Product fields Category.summary() depends on.
+CATEGORY_SUMMARY_FIELDS = {'status', 'category', 'category_id'}
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_detail(self):
+        """
+        Load everything a product card/detail payload touches in a fixed number
+        of queries: category and vendor by join, gallery, specifications,
+        colors and sizes as one prefetch query each.
+        """
+        return self.select_related('category', 'vendor').prefetch_related(
+            models.Prefetch('gallery_set', queryset=Gallery.objects.all()),
+            models.Prefetch('specification_set', queryset=Specification.objects.all()),
+            models.Prefetch('color_set', queryset=Color.objects.all()),
+            models.Prefetch('size_set', queryset=Size.objects.all()),
+        )
+
+    def update(self, **kwargs):
+        # Bulk writes (admin actions, imports) send no post_save, so invalidate
+        # the cached catalog responses here, and the category summary when its
+        # inputs change.
+        bump_cache_version_on_commit("products")
+        if CATEGORY_SUMMARY_FIELDS.intersection(kwargs):
+            bump_cache_version_on_commit("categories")
+        return super().update(**kwargs)
+
+    def update_counters(self, **kwargs):
+        """
+        update() for the columns every order, review and reservation moves
+        (Product.COUNTER_FIELDS, stock), without invalidating cached catalog
+        responses: those may show them up to CATALOG_CACHE_TIMEOUT old. Callers
+        report in_stock flips through stock_changed().
+        """
+        return super().update(**kwargs)
+
+    def reserve_stock(self, qty):
+        """
+        Take `qty` units from every product in the queryset that still has at
+        least that many, in one conditional UPDATE. `in_stock` is derived in the
+        same statement. Returns the number of products reserved.
+        """
+        return self.filter(stock_qty__gte=qty).update_counters(
+            stock_qty=models.F('stock_qty') - qty,
+            in_stock=models.Case(
+                models.When(stock_qty__gt=qty, then=models.Value(True)),
+                default=models.Value(False),
+            ),
+        )
+
+    def release_stock(self, qty):
+        """
+        Give `qty` units back to every product in the queryset.
+        """
+        return self.update_counters(stock_qty=models.F('stock_qty') + qty, in_stock=True)
+
+
+def stock_changed(product_ids):
+    """
+    Products whose in_stock flipped: cached catalog responses and the facet
+    index must show it.
+    """
+    product_ids = list(product_ids)
+    if product_ids:
+        bump_cache_version_on_commit("products")
+        facets.refresh_products_on_commit(product_ids)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, qty):
+        self.product_id = product_id
+        self.qty = qty
+        super().__init__(f"Product {product_id} does not have {qty} units in stock")
+
+
 class Product(models.Model):
     title = models.CharField(max_length=100)
     image = models.FileField(upload_to=user_directory_path, blank=True, null=True, default="product.jpg")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(null=True, blank=True)
     
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="category")
@@ -226,8 +355,15 @@ class Product(models.Model):
     orders = models.PositiveIntegerField(default=0, null=True, blank=True)
     saved = models.PositiveIntegerField(default=0, null=True, blank=True)
     rating = models.IntegerField(default=0, null=True, blank=True)
+
+    # Denormalized counters, maintained incrementally by the Review / CartOrder
+    # signals below and rebuilt in bulk by `manage.py rebuild_product_counters`.
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    paid_order_count = models.PositiveIntegerField(default=0)
     
-    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name="vendor")
+    # Indexed by store_prod_vendor_status_idx.
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name="vendor", db_index=False)
     
     sku = ShortUUIDField(unique=True, length=5, max_length=50, prefix="SKU", alphabet="1234567890")
     pid = ShortUUIDField(unique=True, length=10, max_length=20, alphabet="abcdefghijklmnopqrstuvxyz")
@@ -236,12 +372,27 @@ class Product(models.Model):
     
     date = models.DateTimeField(default=timezone.now)
 
+    objects = ProductQuerySet.as_manager()
+
+    # Owned by the counter signals; a full save() of a stale instance must not write them back.
+    COUNTER_FIELDS = ('rating', 'rating_avg', 'rating_count', 'paid_order_count')
+
     class Meta:
         ordering = ['-id']
         verbose_name_plural = "Products"
+        indexes = [
+            # Storefront listings only ever show published products, newest first.
+            # Category and in-stock listings need no index of their own: most
+            # rows match, so the category foreign key index (or a backwards
+            # scan of the table) finds a page as fast.
+            models.Index(fields=['-id'], condition=models.Q(status="published", featured=True), name="store_prod_pub_featured_idx"),
+            models.Index(fields=['-id'], condition=models.Q(status="published", hot_deal=True), name="store_prod_pub_hot_deal_idx"),
+            # Vendor dashboards; also serves the vendor foreign key.
+            models.Index(fields=['vendor', 'status'], name="store_prod_vendor_status_idx"),
+        ]
 
     def product_image(self):
-        return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (self.image.url))
+        return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (images.variant_url(self)))
 
     def __str__(self):
         return self.title
@@ -254,37 +405,49 @@ class Product(models.Model):
         return round(new_price, 0)
 
     def product_rating(self):
-        product_rating = Review.objects.filter(product=self).aggregate(avg_rating=models.Avg('rating'))
-        return product_rating['avg_rating']
-    
-    def rating_count(self):
-        rating_count = Review.objects.filter(product=self).count()
-        return rating_count
+        return self.rating_avg
     
     def order_count(self):
-        order_count = CartOrderItem.objects.filter(product=self, order__payment_status="paid").count()
-        return order_count
+        return self.paid_order_count
 
+    # The related managers below serve from the prefetch cache filled by
+    # Product.objects.with_detail() and fall back to a query otherwise.
     def gallery(self):
-        gallery = Gallery.objects.filter(product=self)
-        return gallery
-    
-    # def specification(self):
-    #     return Specification.objects.filter(product=self)
+        return self.gallery_set.all()
 
     def specification(self):
-        return Specification.objects.filter(product=self)
-
+        return self.specification_set.all()
 
     def color(self):
-        return Color.objects.filter(product=self)
+        return self.color_set.all()
     
     def size(self):
-        return Size.objects.filter(product=self)
-
-    def frequently_bought_together(self):
-        frequently_bought_together_products = Product.objects.filter(order_item__order__in=CartOrder.objects.filter(orderitem__product=self)).exclude(id=self.id).annotate(count=models.Count('id')).order_by('-id')[:3]
-        return frequently_bought_together_products
+        return self.size_set.all()
+
+    def reserve_stock(self, qty):
+        """
+        Atomically take `qty` units of this product. Returns False, leaving the
+        stock untouched, when fewer than `qty` units are left.
+        """
+        reserved = Product.objects.filter(pk=self.pk).reserve_stock(qty) == 1
+        if reserved:
+            # A later full save() must not write the pre-reservation count back.
+            self.refresh_from_db(fields=['stock_qty', 'in_stock'])
+            if not self.in_stock:
+                stock_changed([self.pk])
+        return reserved
+
+    def release_stock(self, qty):
+        Product.objects.filter(pk=self.pk).release_stock(qty)
+        self.refresh_from_db(fields=['stock_qty', 'in_stock'])
+        if self.stock_qty == qty:
+            stock_changed([self.pk])
+
+    def frequently_bought_together(self, limit=3):
+        # Refunds leave pairs behind at zero; those are no longer bought together.
+        return Product.objects.filter(
+            copurchased_with__product=self, copurchased_with__count__gt=0
+        ).order_by('-copurchased_with__count')[:limit]
     
     def save(self, *args, **kwargs):
         if self.slug == "" or self.slug is None:
@@ -301,15 +464,45 @@ class Product(models.Model):
         else:
             self.stock_qty = 0
             self.in_stock = False
-        
-        self.rating = self.product_rating()
+
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS and f.attname not in deferred
+            ]
             
         super(Product, self).save(*args, **kwargs) 
 
 
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, **kwargs):
+    bump_cache_version_on_commit("products")
+    bump_cache_version_on_commit("categories")
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search_index(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: search.remove_products([product_id]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_product_facets(sender, instance, **kwargs):
+    facets.refresh_products_on_commit([instance.pk])
+
+
 class Gallery(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True)
     image = models.FileField(upload_to=user_directory_path, default="gallery.jpg")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     active = models.BooleanField(default=True)
     date = models.DateTimeField(auto_now_add=True)
     gid = ShortUUIDField(length=10, max_length=25, alphabet="abcdefghijklmnopqrstuvxyz")
@@ -336,6 +529,57 @@ class Color(models.Model):
     name = models.CharField(max_length=100, blank=True, null=True)
     color_code = models.CharField(max_length=100, blank=True, null=True)
 
+def invalidate_product_detail_cache(sender, **kwargs):
+    bump_cache_version_on_commit("products")
+
+for product_detail_model in (Gallery, Specification, Size, Color):
+    post_save.connect(invalidate_product_detail_cache, sender=product_detail_model)
+    post_delete.connect(invalidate_product_detail_cache, sender=product_detail_model)
+
+
+# Cache namespace to bump once an image's variants are recorded.
+IMAGE_MODELS = {Category: "categories", Brand: "brands", Product: "products", Gallery: "products"}
+
+
+def stored_image_name(instance):
+    # None when the image column was deferred and never loaded.
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) if 'image' in instance.__dict__ else None
+
+
+def remember_image(sender, instance, **kwargs):
+    instance._variants_image = stored_image_name(instance)
+
+
+def reset_image_variants(sender, instance, **kwargs):
+    if 'image' in instance.__dict__ and stored_image_name(instance) != instance._variants_image:
+        instance.image_variants = {}
+
+
+def update_image_variants(sender, instance, **kwargs):
+    if 'image' not in instance.__dict__ or 'image_variants' not in instance.__dict__ or not instance.image:
+        return
+    # Also heals rows whose variants a stale full save() wrote back empty.
+    if instance.image.name != instance._variants_image or not instance.image_variants:
+        images.schedule_variants(instance, IMAGE_MODELS[sender])
+    instance._variants_image = instance.image.name
+
+
+for image_model in IMAGE_MODELS:
+    post_init.connect(remember_image, sender=image_model)
+    pre_save.connect(reset_image_variants, sender=image_model)
+    post_save.connect(update_image_variants, sender=image_model)
+
+
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+def update_variant_facets(sender, instance, **kwargs):
+    if instance.product_id:
+        facets.refresh_products_on_commit([instance.product_id])
+
+
 class ProductFaq(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     pid = ShortUUIDField(unique=True, length=10, max_length=20, alphabet="abcdefghijklmnopqrstuvxyz")
@@ -353,6 +597,28 @@ class ProductFaq(models.Model):
     def __str__(self):
         return self.question
     
+class CartSession(models.Model):
+    """
+    Header row of a cart: the lines' totals, kept up to date by store.cart
+    as lines are added, changed and removed, so reading a cart's totals is a
+    single lookup on the unique cart_id.
+    """
+    cart_id = models.CharField(max_length=1000, unique=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    country = models.CharField(max_length=100, null=True, blank=True)
+    line_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    sub_total = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
+    shipping_amount = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
+    service_fee = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
+    tax_fee = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
+    total = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.cart_id
+
+
 class Cart(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
@@ -369,6 +635,11 @@ class Cart(models.Model):
     cart_id = models.CharField(max_length=1000, null=True, blank=True)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cart_id', 'product'], name="store_cart_cart_id_idx"),
+        ]
+
     def __str__(self):
         return f'{self.cart_id} - {self.product.title}'
 
@@ -408,12 +679,80 @@ class CartOrder(models.Model):
     class Meta:
         ordering = ["-date"]
         verbose_name_plural = "Cart Order"
+        indexes = [
+            models.Index(fields=['oid'], name="store_order_oid_idx"),
+            models.Index(fields=['buyer', 'payment_status', '-date'], name="store_order_buyer_paid_idx"),
+            models.Index(fields=['payment_status', '-date'], name="store_order_paid_date_idx"),
+            models.Index(fields=['stripe_session_id'], name="store_order_stripe_session_idx"),
+        ]
 
     def __str__(self):
         return self.oid
 
     def get_order_items(self):
         return CartOrderItem.objects.filter(order=self)
+
+    def stock_quantities(self):
+        rows = CartOrderItem.objects.filter(order=self).values('product').annotate(qty=models.Sum('qty')).order_by('product')
+        return [(row['product'], row['qty']) for row in rows if row['qty'] > 0]
+
+    def reserve_stock(self):
+        """
+        Reserve stock for every line of the order in one transaction, one
+        conditional UPDATE per product. Products are locked in id order so
+        concurrent checkouts cannot deadlock. Raises InsufficientStock and rolls
+        back every reservation if any product is short.
+        """
+        with transaction.atomic():
+            quantities = self.stock_quantities()
+            for product_id, qty in quantities:
+                if not Product.objects.filter(pk=product_id).reserve_stock(qty):
+                    raise InsufficientStock(product_id, qty)
+            if quantities:
+                # Reserved products were in stock before; these just sold out.
+                stock_changed(Product.objects.filter(
+                    pk__in=[product_id for product_id, _ in quantities], in_stock=False
+                ).values_list('pk', flat=True))
+
+    def release_stock(self):
+        with transaction.atomic():
+            quantities = self.stock_quantities()
+            for product_id, qty in quantities:
+                Product.objects.filter(pk=product_id).release_stock(qty)
+            if quantities:
+                # Products holding exactly what was given back were sold out.
+                restocked = models.Q()
+                for product_id, qty in quantities:
+                    restocked |= models.Q(pk=product_id, stock_qty=qty)
+                stock_changed(Product.objects.filter(restocked).values_list('pk', flat=True))
+
+
+@receiver(post_init, sender=CartOrder)
+def remember_counted_payment(sender, instance, **kwargs):
+    # Read __dict__ so a deferred payment_status is not loaded row by row;
+    # None means unknown until the order is saved.
+    if 'payment_status' not in instance.__dict__:
+        instance._counted_paid = None
+    else:
+        instance._counted_paid = bool(instance.pk) and instance.__dict__['payment_status'] == "paid"
+
+
+@receiver(pre_save, sender=CartOrder)
+def load_counted_payment(sender, instance, **kwargs):
+    if instance._counted_paid is None and instance.pk and 'payment_status' in instance.__dict__:
+        instance._counted_paid = CartOrder.objects.filter(pk=instance.pk, payment_status="paid").exists()
+
+
+@receiver(post_save, sender=CartOrder)
+def update_paid_order_counters(sender, instance, **kwargs):
+    if 'payment_status' not in instance.__dict__:
+        # Still deferred, so this save did not write it.
+        return
+    paid = instance.payment_status == "paid"
+    if paid != instance._counted_paid:
+        shift_paid_order_count(instance, 1 if paid else -1)
+        shift_copurchases(instance, 1 if paid else -1)
+        instance._counted_paid = paid
     
 
 class CartOrderItem(models.Model):
@@ -425,7 +764,7 @@ class CartOrderItem(models.Model):
     price = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     sub_total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Total of Product price * Product Qty")
     shipping_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Estimated Shipping Fee = shipping_fee * total")
-    tax_fee = models.DecimalField(default=0.00, max_digits=12, decimal_places=2, help_text="Estimated Vat based on delivery country = tax_rate * (total + shipping)")
+    tax_fee = models.DecimalField(default=0.00, max_digits=12, decimal_places=2, help_text="Estimated Vat based on delivery country = tax_rate * (sub_total + shipping)")
     service_fee = models.DecimalField(default=0.00, max_digits=12, decimal_places=2, help_text="Estimated Service Fee = service_fee * total (paid by buyer to platform)")
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Grand Total of all amount listed above")
     
@@ -450,12 +789,17 @@ class CartOrderItem(models.Model):
     coupon = models.ManyToManyField("store.Coupon", blank=True)
     applied_coupon = models.BooleanField(default=False)
     oid = ShortUUIDField(length=10, max_length=25, alphabet="abcdefghijklmnopqrstuvxyz")
-    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True)
+    # Indexed by store_orderitem_vendor_idx.
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, db_index=False)
     date = models.DateTimeField(default=timezone.now)
     
     class Meta:
         verbose_name_plural = "Cart Order Item"
         ordering = ["-date"]
+        indexes = [
+            models.Index(fields=['oid'], name="store_orderitem_oid_idx"),
+            models.Index(fields=['vendor', '-date'], name="store_orderitem_vendor_idx"),
+        ]
         
     def order_img(self):
         return mark_safe('<img src="%s" width="50" height="50" style="object-fit:cover; border-radius: 6px;" />' % (self.product.image.url))
@@ -466,6 +810,51 @@ class CartOrderItem(models.Model):
     def __str__(self):
         return self.oid
 
+class ProductCoPurchase(models.Model):
+    """
+    Number of paid orders that contained both `product` and `other`. Each pair
+    is stored in both directions so a product's recommendations are a single
+    index range scan on (product, -count).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="copurchases")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="copurchased_with")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Product Co-Purchases"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name="unique_product_copurchase"),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-count'], name="store_copurchase_top_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id} ({self.count})"
+
+
+def shift_copurchases(order, delta):
+    """
+    Add `delta` to the pair count of every two distinct products in `order`.
+    Missing pairs are inserted at zero first so the increment is always a
+    plain UPDATE, which keeps concurrent orders from losing counts.
+    """
+    product_ids = set(CartOrderItem.objects.filter(order=order).values_list('product', flat=True))
+    if len(product_ids) < 2:
+        return
+
+    pairs = ProductCoPurchase.objects.filter(product__in=product_ids, other__in=product_ids)
+    if delta > 0:
+        ProductCoPurchase.objects.bulk_create(
+            [ProductCoPurchase(product_id=a, other_id=b) for a in product_ids for b in product_ids if a != b],
+            ignore_conflicts=True,
+        )
+    pairs.update(count=models.Case(
+        models.When(count__lte=-delta, then=models.Value(0)),
+        default=models.F('count') + delta,
+    ))
+
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True, related_name="reviews")
@@ -493,18 +882,155 @@ class Review(models.Model):
     def profile(self):
         return Profile.objects.get(user=self.user)
     
+def shift_product_rating(product_id, rating_delta, count_delta):
+    """
+    Fold a change of `rating_delta` stars over `count_delta` reviews into the
+    product's running average without re-aggregating its reviews.
+    """
+    new_count = models.F('rating_count') + count_delta
+    new_avg = models.Case(
+        models.When(rating_count__lte=-count_delta, then=models.Value(0.0)),
+        default=models.ExpressionWrapper(
+            (models.F('rating_avg') * models.F('rating_count') + rating_delta) / new_count,
+            output_field=models.FloatField(),
+        ),
+    )
+    # One UPDATE touching only the rating columns: every SET expression reads the
+    # pre-update row, and concurrent writers of stock_qty etc. are left alone.
+    Product.objects.filter(pk=product_id).update_counters(
+        rating_avg=new_avg,
+        rating=Cast(Floor(new_avg), models.IntegerField()),
+        rating_count=models.Case(
+            models.When(rating_count__lte=-count_delta, then=models.Value(0)),
+            default=new_count,
+        ),
+    )
+
+
+def shift_paid_order_count(order, delta):
+    """
+    Add `delta` to `paid_order_count` for every product in `order`, once per
+    order item, matching what `order_count` used to aggregate.
+    """
+    per_product = CartOrderItem.objects.filter(order=order).values('product').annotate(items=models.Count('id'))
+    for row in per_product:
+        shift_product_paid_count(row['product'], delta * row['items'])
+
+
+def shift_product_paid_count(product_id, delta):
+    Product.objects.filter(pk=product_id).update_counters(
+        paid_order_count=models.Case(
+            models.When(paid_order_count__lte=-delta, then=models.Value(0)),
+            default=models.F('paid_order_count') + delta,
+        )
+    )
+
+
+def shift_item_counters(item, delta):
+    """
+    Count an item added to (delta 1) or removed from (delta -1) an order that
+    is already paid; status changes are counted per order by
+    update_paid_order_counters. Co-purchase pairs only change when the item's
+    product was not already in the order through another item.
+    """
+    if not CartOrder.objects.filter(pk=item.order_id, payment_status="paid").exists():
+        return
+    shift_product_paid_count(item.product_id, delta)
+
+    others = set(CartOrderItem.objects.filter(order_id=item.order_id).exclude(pk=item.pk).values_list('product', flat=True))
+    if item.product_id in others or not others:
+        return
+    pairs = ProductCoPurchase.objects.filter(
+        models.Q(product=item.product_id, other__in=others) | models.Q(product__in=others, other=item.product_id)
+    )
+    if delta > 0:
+        ProductCoPurchase.objects.bulk_create(
+            [ProductCoPurchase(product_id=item.product_id, other_id=other) for other in others]
+            + [ProductCoPurchase(product_id=other, other_id=item.product_id) for other in others],
+            ignore_conflicts=True,
+        )
+    pairs.update(count=models.Case(
+        models.When(count__lte=-delta, then=models.Value(0)),
+        default=models.F('count') + delta,
+    ))
+
+
+@receiver(post_save, sender=CartOrderItem)
+def count_paid_order_item(sender, instance, created, **kwargs):
+    if created:
+        shift_item_counters(instance, 1)
+
+
+@receiver(post_delete, sender=CartOrderItem)
+def uncount_paid_order_item(sender, instance, **kwargs):
+    shift_item_counters(instance, -1)
+
+
+@receiver(pre_delete, sender=CartOrder)
+def uncount_deleted_paid_order(sender, instance, **kwargs):
+    # The items go in one DELETE before their post_delete signals run, so
+    # they cannot see each other; take the order's pairs off here instead.
+    if instance.payment_status == "paid":
+        shift_copurchases(instance, -1)
+
+
+# _counted_review of a review loaded without product_id or rating.
+UNKNOWN_REVIEW = object()
+
+
+@receiver(post_init, sender=Review)
+def remember_counted_review(sender, instance, **kwargs):
+    # Read __dict__ so deferred columns are not loaded row by row.
+    if not instance.pk:
+        instance._counted_review = None
+    elif 'product_id' in instance.__dict__ and 'rating' in instance.__dict__:
+        instance._counted_review = (instance.__dict__['product_id'], instance.__dict__['rating'])
+    else:
+        instance._counted_review = UNKNOWN_REVIEW
+
+
+@receiver(pre_save, sender=Review)
+@receiver(pre_delete, sender=Review)
+def load_counted_review(sender, instance, **kwargs):
+    if instance._counted_review is UNKNOWN_REVIEW:
+        instance._counted_review = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
 @receiver(post_save, sender=Review)
 def update_product_rating(sender, instance, **kwargs):
-    if instance.product:
-        instance.product.save()
+    counted = instance._counted_review
+    current = (instance.product_id, instance.rating)
+    if counted == current:
+        return
+
+    if counted and counted[0] == current[0]:
+        shift_product_rating(current[0], current[1] - counted[1], 0)
+    else:
+        if counted and counted[0]:
+            shift_product_rating(counted[0], -counted[1], -1)
+        if current[0]:
+            shift_product_rating(current[0], current[1], 1)
+    instance._counted_review = current
+
+
+@receiver(post_delete, sender=Review)
+def remove_product_rating_counters(sender, instance, **kwargs):
+    counted = instance._counted_review
+    if counted and counted[0]:
+        shift_product_rating(counted[0], -counted[1], -1)
+    instance._counted_review = None
 
 class Wishlist(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Indexed by store_wishlist_user_prod_idx.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="wishlist")
     date = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name_plural = "Wishlist"
+        indexes = [
+            models.Index(fields=['user', 'product'], name="store_wishlist_user_prod_idx"),
+        ]
     
     def __str__(self):
         if self.product.title:
@@ -522,6 +1048,12 @@ class Notification(models.Model):
     
     class Meta:
         verbose_name_plural = "Notification"
+        indexes = [
+            # filter(seen=False) compiles to `NOT seen`, which a (user, seen)
+            # index cannot seek on; partial indexes on the unseen rows match it.
+            models.Index(fields=['user'], condition=models.Q(seen=False), name="store_notif_user_unseen_idx"),
+            models.Index(fields=['vendor'], condition=models.Q(seen=False), name="store_notif_vendor_unseen_idx"),
+        ]
     
     def __str__(self):
         if self.order:
@@ -551,6 +1083,85 @@ class Address(models.Model):
         else:
             return "Address"
 
+class PaymentEvent(models.Model):
+    """
+    A payment provider webhook event, stored as received. The webhook view
+    only inserts these (a retried delivery of the same event id is a no-op);
+    the process_payment_events worker applies them to orders. See
+    store.payments.
+    """
+    STATUS = (
+        ("pending", "Pending"),
+        ("applied", "Applied"),
+        ("ignored", "Ignored"),
+        ("failed", "Failed"),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    session_id = models.CharField(max_length=200, blank=True, default="")
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-received_at"]
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status="pending"), name="store_payevent_due_idx"),
+            models.Index(fields=['claim'], name="store_payevent_claim_idx"),
+            models.Index(fields=['session_id'], name="store_payevent_session_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
+
+
+class ProductImportJob(models.Model):
+    """
+    A product feed uploaded through the admin. The upload view only stores
+    the file and queues the job; the process_product_imports worker runs it
+    and records progress in `imported`. See store.importer.
+    """
+    FORMATS = (
+        ("csv", "CSV"),
+        ("jsonl", "JSON Lines"),
+    )
+    STATUS = (
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    file = models.FileField(upload_to="imports/")
+    format = models.CharField(max_length=10, choices=FORMATS)
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS, default="queued")
+    imported = models.PositiveIntegerField(default=0, help_text="Rows written so far")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created"]
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status__in=["queued", "running"]), name="store_importjob_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_format_display()} import {self.pk} ({self.status})"
+
+
 class CancelledOrder(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     orderitem = models.ForeignKey("store.CartOrderItem", on_delete=models.SET_NULL, null=True)
@@ -568,7 +1179,7 @@ class CancelledOrder(models.Model):
 
 class Coupon(models.Model):
     vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, related_name="coupon_vendor")
-    used_by = models.ManyToManyField(User, blank=True)
+    # Stored normalized (see store.coupons.normalize_code), unique per vendor.
     code = models.CharField(max_length=1000)
     # type = models.CharField(max_length=100, choices=DISCOUNT_TYPE, default="Percentage")
     discount = models.IntegerField(default=1, validators=[MinValueValidator(0), MaxValueValidator(100)])
@@ -583,6 +1194,7 @@ class Coupon(models.Model):
     def save(self, *args, **kwargs):
         new_discount = int(self.discount) / 100
         self.get_percent = new_discount
+        self.code = normalize_code(self.code)
         super(Coupon, self).save(*args, **kwargs) 
     
     def __str__(self):
@@ -590,6 +1202,40 @@ class Coupon(models.Model):
     
     class Meta:
         ordering =['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'code'], name="store_coupon_vendor_code_uniq"),
+        ]
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+@receiver(post_delete, sender=Vendor)
+def invalidate_coupon_cache(sender, **kwargs):
+    bump_cache_version_on_commit("coupons")
+
+
+class CouponRedemption(models.Model):
+    """
+    One use of a coupon, by the order's email address and, for signed-in
+    buyers, their user. The unique (coupon, email) and (coupon, user)
+    constraints are what limit a coupon to one use per buyer, guests
+    included; see store.coupons.redeem.
+    """
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="redemptions")
+    email = models.EmailField(help_text="Order email, lower case")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="coupon_redemptions")
+    order = models.ForeignKey(CartOrder, on_delete=models.SET_NULL, null=True, blank=True)
+    date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['coupon', 'user'], name="store_coupon_redemption_uniq"),
+            models.UniqueConstraint(fields=['coupon', 'email'], name="store_coupon_redemption_email_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon} by {self.user or self.email}"
 
 class CouponUsers(models.Model):
     coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE)
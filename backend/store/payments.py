@@ -0,0 +1,172 @@
+"""
+Payment webhook ingestion.
+
+The webhook view does as little as possible so provider retries during a
+sale never tie up request workers: it checks the signature, inserts the
+event into PaymentEvent (unique on the provider's event id) and answers 200.
+A redelivered event hits the unique constraint and is acknowledged without
+being stored twice.
+
+The `process_payment_events` worker applies stored events to orders. Events
+are claimed in batches with a single leased UPDATE (see backend.leases), so
+several workers can run side by side. Each event moves the order found by its
+session id (indexed CartOrder.stripe_session_id) along TRANSITIONS, under a
+row lock and with a normal save, so paid-order counters follow. A transition
+that is not allowed from the order's current status, such as a duplicate
+"completed" for a paid order or an "expired" arriving after payment, is
+recorded as ignored; applying an event twice therefore never pays twice.
+Events for sessions that have no order yet are retried with backoff.
+
+Signatures follow Stripe's scheme: the `Stripe-Signature` header carries
+`t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>" keyed with the endpoint
+secret>`. `sign_payload()` produces such headers for the local fake
+provider (the `fake_payment_provider` command).
+"""
+
+import hashlib
+import hmac
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from backend.leases import claim_due, retry_later
+from store.models import CartOrder, PaymentEvent
+
+
+MAX_ATTEMPTS = 10
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 60
+LEASE = 60
+
+# A confirmed payment wins over an earlier failure or expiry, whatever order
+# the events arrive in; nothing moves an order out of "paid" here.
+PAYABLE = {"initiated", "pending", "processing", "failed", "cancelled"}
+
+# Event type -> (target payment_status, statuses it may be reached from).
+TRANSITIONS = {
+    'checkout.session.async_payment_succeeded': ("paid", PAYABLE),
+    'checkout.session.async_payment_failed': ("failed", {"initiated", "pending", "processing"}),
+    'checkout.session.expired': ("cancelled", {"initiated", "pending"}),
+}
+COMPLETED = 'checkout.session.completed'
+
+
+class InvalidSignature(Exception):
+    pass
+
+
+class OrderNotFound(Exception):
+    pass
+
+
+def sign_payload(payload, secret, timestamp=None):
+    timestamp = int(time.time() if timestamp is None else timestamp)
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def verify_signature(payload, header, secret, tolerance=None):
+    """
+    Check a `Stripe-Signature` header against the raw request body. Raises
+    InvalidSignature.
+    """
+    if not secret:
+        raise InvalidSignature("Webhook secret is not configured")
+    tolerance = settings.PAYMENT_WEBHOOK_TOLERANCE if tolerance is None else tolerance
+    parts = [part.split('=', 1) for part in (header or '').split(',') if '=' in part]
+    timestamps = [value for key, value in parts if key == 't']
+    signatures = [value for key, value in parts if key == 'v1']
+    if not timestamps or not signatures or not timestamps[0].isdigit():
+        raise InvalidSignature("Malformed signature header")
+    timestamp = int(timestamps[0])
+    if abs(time.time() - timestamp) > tolerance:
+        raise InvalidSignature("Signature timestamp outside the tolerance")
+    expected = sign_payload(payload, secret, timestamp).split('v1=', 1)[1]
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise InvalidSignature("No matching signature")
+
+
+def record_event(payload):
+    """
+    Store a verified raw event body. Returns False when it was already stored.
+    Raises ValueError for bodies that are not events.
+    """
+    try:
+        event = json.loads(payload)
+        event_id = event['id']
+        event_type = event['type']
+        data = event.get('data') or {}
+        session = (data.get('object') or {}) if isinstance(data, dict) else None
+        if not isinstance(event_id, str) or not isinstance(event_type, str) or not isinstance(session, dict):
+            raise TypeError("Unexpected value types")
+        session_id = (session.get('id') or '') if event_type.startswith('checkout.session.') else ''
+        if not isinstance(session_id, str):
+            raise TypeError("Unexpected session id")
+        for field, value in (('event_id', event_id), ('type', event_type), ('session_id', session_id)):
+            if len(value) > PaymentEvent._meta.get_field(field).max_length:
+                raise ValueError(f"{field} is too long")
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Not a webhook event")
+
+    try:
+        # A savepoint keeps a duplicate insert from breaking the caller's transaction.
+        with transaction.atomic():
+            PaymentEvent.objects.create(event_id=event_id, type=event_type, session_id=session_id, payload=event)
+    except IntegrityError:
+        return False
+    return True
+
+
+def target_status(event):
+    if event.type == COMPLETED:
+        session = event.payload['data']['object']
+        # Delayed payment methods complete the session before the money arrives.
+        if session.get('payment_status') in ("paid", "no_payment_required"):
+            return "paid", PAYABLE
+        return "processing", {"initiated", "pending"}
+    return TRANSITIONS.get(event.type, (None, set()))
+
+
+def apply_event(event):
+    """
+    Apply one event to its order. Returns "applied" or "ignored"; raises
+    OrderNotFound when the session has no order yet.
+    """
+    status, allowed = target_status(event)
+    if status is None or not event.session_id:
+        return "ignored"
+    with transaction.atomic():
+        order = CartOrder.objects.select_for_update().filter(stripe_session_id=event.session_id).first()
+        if order is None:
+            raise OrderNotFound(event.session_id)
+        if order.payment_status not in allowed:
+            return "ignored"
+        order.payment_status = status
+        order.save(update_fields=['payment_status'])
+    return "applied"
+
+
+def claim_events(size, lease=LEASE):
+    claimed = claim_due(PaymentEvent.objects.filter(status="pending"), size, lease)
+    # Oldest first, so the events of one session are applied in arrival order.
+    return list(claimed.order_by('received_at', 'pk'))
+
+
+def process_batch(size=100):
+    """
+    Apply one batch of due events. Returns the number of events claimed.
+    """
+    events = claim_events(size)
+    for event in events:
+        event.attempts += 1
+        try:
+            event.status = apply_event(event)
+            event.processed_at = timezone.now()
+            event.last_error = ""
+        except Exception as error:
+            retry_later(event, error, MAX_ATTEMPTS, BACKOFF_BASE, BACKOFF_MAX)
+        event.save(update_fields=['status', 'attempts', 'processed_at', 'last_error', 'next_attempt_at'])
+    return len(events)
@@ -0,0 +1,186 @@
+"""
+Line and order pricing for carts and orders.
+
+`price_lines()` takes a cart or an order as columns (quantities, unit prices,
+unit shipping, tax rate and coupon discount per line) and returns every line
+amount and the order totals in one pass:
+
+    sub_total        price * qty
+    shipping_amount  shipping * qty
+    service_fee      sub_total * service_fee_rate     (CART_SERVICE_FEE_RATE)
+    tax_fee          (sub_total + shipping_amount) * tax_rate / 100
+                                                      (CART_TAX_RATES, percent)
+    initial_total    sub_total + shipping_amount + service_fee + tax_fee
+    saved            initial_total * discount / 100   (coupon, percent)
+    total            initial_total - saved
+
+Each fee is rounded to the cent, half away from zero, per line; order totals
+are the exact sums of the line amounts. Unit prices are taken to the cent and
+rates to six decimal places of a fraction.
+
+All arithmetic is done on integer cents and integer parts-per-million rates,
+so results are exact and identical on both code paths: NumPy int64 vectors
+when numpy is installed and the products fit in 63 bits, else plain Python
+integers (no overflow, a little slower). Each distinct input value is
+converted from Decimal once, and results are turned back into Decimal only
+when read, so pricing a cart for its totals costs a handful of Decimal
+operations however many lines it has.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from functools import cached_property
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+AMOUNTS = ['sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'initial_total', 'saved', 'total']
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal(100)
+PPM = 1_000_000
+# Largest intermediate product the int64 path accepts.
+INT64_LIMIT = 2 ** 62
+
+
+class PricedLines:
+    """
+    Result of price_lines(). `cents` maps each name in AMOUNTS to the line
+    amounts in integer cents; `columns` (the same as Decimal), `totals`
+    (their sums) and `line()` convert on access.
+    """
+
+    def __init__(self, cents):
+        self.cents = cents
+
+    def __len__(self):
+        return len(self.cents['total'])
+
+    @cached_property
+    def columns(self):
+        return {name: [from_cents(value) for value in values] for name, values in self.cents.items()}
+
+    @cached_property
+    def totals(self):
+        return {name: from_cents(sum(values)) for name, values in self.cents.items()}
+
+    def line(self, index):
+        return {name: from_cents(values[index]) for name, values in self.cents.items()}
+
+
+def to_cents(amount):
+    scaled = Decimal(amount or 0) * HUNDRED
+    cents = int(scaled)
+    if cents != scaled:
+        cents = int(scaled.to_integral_value(ROUND_HALF_UP))
+    return cents
+
+
+def percent_to_ppm(percent):
+    return int((Decimal(percent or 0) * (PPM // 100)).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return Decimal(cents) * CENT
+
+
+def convert_column(values, convert):
+    memo = {}
+    column = []
+    for value in values:
+        converted = memo.get(value)
+        if converted is None:
+            converted = memo[value] = convert(value)
+        column.append(converted)
+    return column
+
+
+def broadcast(values, size):
+    if isinstance(values, (list, tuple)):
+        if len(values) != size:
+            raise ValueError(f"Expected {size} values, got {len(values)}")
+        return list(values)
+    return [values] * size
+
+
+def price_lines(qty, price, shipping, tax_rate=0, discount=0, service_fee_rate=None, use_numpy=None):
+    """
+    Price a cart or order given as equally long columns: `qty`, `price`
+    (unit) and `shipping` (unit) per line, and `tax_rate` and `discount` in
+    percent, either per line or one value for all lines. `use_numpy` forces
+    a code path (for benchmarks); by default NumPy is used when available.
+    """
+    size = len(qty)
+    if service_fee_rate is None:
+        service_fee_rate = settings.CART_SERVICE_FEE_RATE
+
+    qty = [int(q) for q in qty]
+    price = convert_column(broadcast(price, size), to_cents)
+    shipping = convert_column(broadcast(shipping, size), to_cents)
+    tax = convert_column(broadcast(tax_rate, size), percent_to_ppm)
+    off = convert_column(broadcast(discount, size), percent_to_ppm)
+    service = percent_to_ppm(Decimal(service_fee_rate) * 100)
+
+    if use_numpy is None:
+        use_numpy = numpy is not None and fits_int64(qty, price, shipping, tax, off, service)
+    compute = price_cents_numpy if use_numpy else price_cents
+    return PricedLines(compute(qty, price, shipping, tax, off, service))
+
+
+def tax_rate(country):
+    """
+    Tax rate in percent for a delivery country (CART_TAX_RATES, default 0).
+    """
+    return Decimal(str(settings.CART_TAX_RATES.get(country, 0)))
+
+
+def fits_int64(qty, price, shipping, tax, off, service):
+    if not qty:
+        return True
+    most = max(map(abs, qty)) * (max(map(abs, price)) + max(map(abs, shipping)))
+    rate = max(max(map(abs, tax)), max(map(abs, off)), abs(service), 1)
+    # Bound on |initial_total|: the amounts plus two fees of at most `rate`.
+    initial = most + 2 * most * rate // PPM + 2
+    return max(most, initial) * rate < INT64_LIMIT
+
+
+def round_ppm(value):
+    """
+    Round value / PPM to an integer, half away from zero.
+    """
+    quotient = (abs(value) + PPM // 2) // PPM
+    return quotient if value >= 0 else -quotient
+
+
+def price_cents(qty, price, shipping, tax, off, service):
+    columns = {name: [] for name in AMOUNTS}
+    for q, p, s, t, d in zip(qty, price, shipping, tax, off):
+        sub_total = p * q
+        shipping_amount = s * q
+        service_fee = round_ppm(sub_total * service)
+        tax_fee = round_ppm((sub_total + shipping_amount) * t)
+        initial_total = sub_total + shipping_amount + service_fee + tax_fee
+        saved = round_ppm(initial_total * d)
+        for name, value in zip(AMOUNTS, (sub_total, shipping_amount, service_fee, tax_fee, initial_total, saved, initial_total - saved)):
+            columns[name].append(value)
+    return columns
+
+
+def round_ppm_array(values):
+    return numpy.sign(values) * ((numpy.abs(values) + PPM // 2) // PPM)
+
+
+def price_cents_numpy(qty, price, shipping, tax, off, service):
+    qty = numpy.array(qty, dtype=numpy.int64)
+    sub_total = numpy.array(price, dtype=numpy.int64) * qty
+    shipping_amount = numpy.array(shipping, dtype=numpy.int64) * qty
+    service_fee = round_ppm_array(sub_total * service)
+    tax_fee = round_ppm_array((sub_total + shipping_amount) * numpy.array(tax, dtype=numpy.int64))
+    initial_total = sub_total + shipping_amount + service_fee + tax_fee
+    saved = round_ppm_array(initial_total * numpy.array(off, dtype=numpy.int64))
+    values = (sub_total, shipping_amount, service_fee, tax_fee, initial_total, saved, initial_total - saved)
+    return {name: column.tolist() for name, column in zip(AMOUNTS, values)}
@@ -0,0 +1,220 @@
+"""
+Full-text product search.
+
+Products are indexed on title, tags, brand and description in a side table
+that is kept in sync by the Product save/delete signals (see store.models)
+and can be rebuilt with `manage.py rebuild_search_index`:
+
+- SQLite: an FTS5 virtual table `store_product_fts` keyed by product id,
+  ranked with bm25() and with prefix indexes for 2 and 3 character prefixes.
+- PostgreSQL: `store_product_search` holding a weighted tsvector per product
+  behind a GIN index, ranked with ts_rank().
+
+Other databases fall back to icontains filtering. Every query term is
+matched as a prefix, so "mon del" finds "Monstera deliciosa". Tags are a
+comma separated CharField; commas are turned into token breaks before
+indexing so each tag is tokenized on its own.
+"""
+
+import re
+
+from django.db import connection, models
+
+
+FTS_TABLE = "store_product_fts"
+TSVECTOR_TABLE = "store_product_search"
+TSVECTOR_CONFIG = "simple"
+
+# Relative weight of title, description, tags and brand matches.
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Ids per statement when (re)indexing a list of products.
+INDEX_CHUNK_SIZE = 500
+
+
+def search_terms(query):
+    return TERM_RE.findall(query.lower())[:10]
+
+
+def id_filter(column, ids):
+    if ids is None:
+        return "", []
+    return " WHERE %s IN (%s)" % (column, ", ".join(["%s"] * len(ids))), list(ids)
+
+
+class SQLiteSearchBackend:
+
+    def create(self, cursor):
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+            "title, description, tags, brand, tokenize='unicode61 remove_diacritics 2', prefix='2 3')" % FTS_TABLE
+        )
+
+    def drop(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS %s" % FTS_TABLE)
+
+    def index(self, cursor, ids=None):
+        """
+        Reindex the given product ids (all products when None). Ids that no
+        longer exist are dropped from the index.
+        """
+        where, params = id_filter("rowid", ids)
+        cursor.execute("DELETE FROM %s%s" % (FTS_TABLE, where), params)
+        where, params = id_filter("id", ids)
+        cursor.execute(
+            "INSERT INTO %s (rowid, title, description, tags, brand) "
+            "SELECT id, title, coalesce(description, ''), replace(coalesce(tags, ''), ',', ' '), coalesce(brand, '') "
+            "FROM store_product%s" % (FTS_TABLE, where),
+            params,
+        )
+
+    def remove(self, cursor, ids):
+        where, params = id_filter("rowid", ids)
+        cursor.execute("DELETE FROM %s%s" % (FTS_TABLE, where), params)
+
+    def search(self, cursor, terms, limit, offset=0, status=None):
+        match = " ".join('"%s"*' % term for term in terms)
+        rank = "bm25(%s, %s)" % (FTS_TABLE, ", ".join(str(weight) for weight in SQLITE_WEIGHTS))
+        join, where, params = "", "", [match]
+        if status is not None:
+            join, where = " JOIN store_product ON store_product.id = %s.rowid" % FTS_TABLE, " AND store_product.status = %s"
+            params.append(status)
+        cursor.execute(
+            "SELECT %s.rowid FROM %s%s WHERE %s MATCH %%s%s ORDER BY %s LIMIT %%s OFFSET %%s" % (
+                FTS_TABLE, FTS_TABLE, join, FTS_TABLE, where, rank
+            ),
+            params + [limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+
+    def create(self, cursor):
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS %s ("
+            "product_id bigint PRIMARY KEY REFERENCES store_product (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)" % TSVECTOR_TABLE
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS %s_document_idx ON %s USING GIN (document)" % (TSVECTOR_TABLE, TSVECTOR_TABLE))
+
+    def drop(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS %s" % TSVECTOR_TABLE)
+
+    def index(self, cursor, ids=None):
+        if ids is not None:
+            self.remove(cursor, ids)
+        where, params = ("", []) if ids is None else (" WHERE id = ANY(%s)", [list(ids)])
+        cursor.execute(
+            "INSERT INTO {table} (product_id, document) "
+            "SELECT id, "
+            "setweight(to_tsvector('{config}', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('{config}', replace(coalesce(tags, ''), ',', ' ')), 'B') || "
+            "setweight(to_tsvector('{config}', coalesce(brand, '')), 'B') || "
+            "setweight(to_tsvector('{config}', coalesce(description, '')), 'C') "
+            "FROM store_product{where} "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document".format(
+                table=TSVECTOR_TABLE, config=TSVECTOR_CONFIG, where=where
+            ),
+            params,
+        )
+
+    def remove(self, cursor, ids):
+        cursor.execute("DELETE FROM %s WHERE product_id = ANY(%%s)" % TSVECTOR_TABLE, [list(ids)])
+
+    def search(self, cursor, terms, limit, offset=0, status=None):
+        query = " & ".join("%s:*" % term for term in terms)
+        join, where, params = "", "", [query]
+        if status is not None:
+            join, where = " JOIN store_product ON store_product.id = product_id", " AND store_product.status = %s"
+            params.append(status)
+        cursor.execute(
+            "SELECT product_id FROM {table}{join}, to_tsquery('{config}', %s) query "
+            "WHERE document @@ query{where} ORDER BY ts_rank(document, query) DESC, product_id DESC LIMIT %s OFFSET %s".format(
+                table=TSVECTOR_TABLE, config=TSVECTOR_CONFIG, join=join, where=where
+            ),
+            params + [limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(conn=None):
+    backend = BACKENDS.get((conn or connection).vendor)
+    return backend() if backend else None
+
+
+def index_products(ids=None):
+    """
+    Reindex the products with the given ids, or every product when None.
+    """
+    backend = get_backend()
+    if backend is None or ids is not None and not ids:
+        return
+    with connection.cursor() as cursor:
+        if ids is None:
+            backend.index(cursor)
+            return
+        ids = list(ids)
+        for start in range(0, len(ids), INDEX_CHUNK_SIZE):
+            backend.index(cursor, ids[start:start + INDEX_CHUNK_SIZE])
+
+
+def remove_products(ids):
+    backend = get_backend()
+    if backend is None or not ids:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, list(ids))
+
+
+def search_product_ids(query, limit=50, offset=0, status=None):
+    """
+    Ids of the products best matching `query`, best match first, optionally
+    only those with `status`. The status is filtered in the search query
+    itself, so a page is never cut short by non-matching products.
+    """
+    from store.models import Product
+
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    backend = get_backend()
+    if backend is None:
+        condition = models.Q()
+        for term in terms:
+            condition &= models.Q(title__icontains=term) | models.Q(tags__icontains=term) | models.Q(brand__icontains=term)
+        products = Product.objects.filter(condition)
+        if status is not None:
+            products = products.filter(status=status)
+        return list(products.values_list('id', flat=True)[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        return backend.search(cursor, terms, limit, offset, status)
+
+
+def search_products(queryset, query, limit=50, status=None):
+    """
+    Up to `limit` products from `queryset` matching `query`, in rank order.
+    Pass the status the queryset filters on so the search applies it too;
+    for any other filter, further pages of hits are fetched until `limit`
+    products are found or the hits run out.
+    """
+    results = []
+    offset = 0
+    while len(results) < limit:
+        ids = search_product_ids(query, limit, offset, status)
+        products = queryset.in_bulk(ids)
+        results.extend(products[pk] for pk in ids if pk in products)
+        if len(ids) < limit:
+            break
+        offset += limit
+    return results[:limit]
@@ -0,0 +1,136 @@
+from rest_framework import serializers
+
+from store.models import Brand, Cart, CartOrder, CartSession, Category, Color, Gallery, Product, Size, Specification
+
+
+class CategorySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Category
+        fields = ['id', 'title', 'image', 'image_variants', 'slug']
+
+
+class BrandSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Brand
+        fields = ['id', 'title', 'image', 'image_variants']
+
+
+class GallerySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Gallery
+        fields = ['id', 'image', 'image_variants', 'active', 'gid']
+
+
+class SpecificationSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Specification
+        fields = ['id', 'title', 'content']
+
+
+class SizeSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Size
+        fields = ['id', 'name', 'price']
+
+
+class ColorSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Color
+        fields = ['id', 'name', 'color_code']
+
+
+class ProductSerializer(serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    gallery = GallerySerializer(many=True, read_only=True)
+    specification = SpecificationSerializer(many=True, read_only=True)
+    size = SizeSerializer(many=True, read_only=True)
+    color = ColorSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'title', 'image', 'image_variants', 'description', 'category', 'tags', 'brand',
+            'price', 'old_price', 'shipping_amount', 'stock_qty', 'in_stock',
+            'type', 'featured', 'hot_deal', 'special_offer', 'digital',
+            'rating_avg', 'rating_count', 'paid_order_count', 'vendor',
+            'sku', 'pid', 'slug', 'date',
+            'gallery', 'specification', 'size', 'color',
+        ]
+
+
+class ProductCardSerializer(serializers.ModelSerializer):
+    """
+    The columns a catalog card shows; list views load only these.
+    """
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'title', 'image', 'image_variants', 'price', 'old_price', 'in_stock',
+            'featured', 'hot_deal', 'special_offer',
+            'rating_avg', 'rating_count', 'slug', 'pid',
+        ]
+
+
+class CartSessionSerializer(serializers.ModelSerializer):
+    """
+    A cart's totals, from its header row.
+    """
+
+    class Meta:
+        model = CartSession
+        fields = [
+            'cart_id', 'country', 'line_count', 'item_count',
+            'sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'total', 'updated',
+        ]
+
+
+class CartLineSerializer(serializers.ModelSerializer):
+    product = ProductCardSerializer(read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = [
+            'id', 'product', 'qty', 'price', 'size', 'color',
+            'sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'total', 'date',
+        ]
+
+
+class CartLineInputSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    qty = serializers.IntegerField(min_value=0, max_value=1000)
+    size = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    color = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+
+
+class CartUpdateSerializer(serializers.Serializer):
+    lines = CartLineInputSerializer(many=True, allow_empty=False, max_length=200)
+    country = serializers.CharField(max_length=100, required=False, allow_null=True)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    cart_id = serializers.CharField(max_length=1000)
+    full_name = serializers.CharField(max_length=1000)
+    email = serializers.EmailField(max_length=1000)
+    mobile = serializers.CharField(max_length=1000)
+    address = serializers.CharField(max_length=1000, required=False, allow_blank=True)
+    city = serializers.CharField(max_length=1000, required=False, allow_blank=True)
+    state = serializers.CharField(max_length=1000, required=False, allow_blank=True)
+    country = serializers.CharField(max_length=1000, required=False, allow_blank=True)
+    coupons = serializers.ListField(child=serializers.CharField(max_length=1000), required=False, max_length=20)
+
+
+class CartOrderSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = CartOrder
+        fields = [
+            'oid', 'payment_status', 'order_status',
+            'sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'initial_total', 'saved', 'total', 'date',
+        ]
@@ -1,3 +1,740 @@
-from django.test import TestCase
+import io
+import json
+import random
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
 
-# Create your tests here.
+from unittest import mock
+
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.core.files.storage import storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, models
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from store import facets, images, pricing
+from store.admin import make_featured, make_in_review
+from store.caching import bump_cache_version
+from store.cart import get_cart, rebuild_sessions, upsert_lines
+from store.checkout import EmptyCart, place_order
+from store.coupons import AlreadyRedeemed, redeem
+from store.importer import ProductImporter, ProductImportError, process_next_job
+from store.payments import process_batch, sign_payload
+from store.search import search_products
+from store.models import Cart, CartOrder, CartSession, CartOrderItem, Category, Color, Coupon, CouponRedemption, InsufficientStock, PaymentEvent, Product, ProductCoPurchase, ProductImportJob, Review, Size, Specification
+from userauths.models import User
+from vendor.models import Vendor
+
+
+# Image variants render inline instead of on a worker thread, which would race
+# the test transaction for the SQLite database.
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class StoreTestCase(TestCase):
+    pass
+
+
+def make_vendor(name="vendor"):
+    user = User.objects.create_user(username=name, email=f"{name}@example.com", password="password")
+    return Vendor.objects.create(user=user, name=name)
+
+
+def make_product(vendor, title="Product", **fields):
+    fields.setdefault('price', 10)
+    fields.setdefault('stock_qty', 10)
+    fields.setdefault('status', "published")
+    return Product.objects.create(title=title, vendor=vendor, **fields)
+
+
+@override_settings(CART_SERVICE_FEE_RATE=Decimal('0.05'))
+class PricingTests(SimpleTestCase):
+    def reference(self, qty, price, shipping, tax, discount):
+        # Per-line Decimal arithmetic, as documented on CartOrderItem.
+        def cents(amount):
+            return amount.quantize(pricing.CENT, ROUND_HALF_UP)
+
+        sub_total = price * qty
+        shipping_amount = shipping * qty
+        service_fee = cents(sub_total * Decimal('0.05'))
+        tax_fee = cents((sub_total + shipping_amount) * tax / 100)
+        initial_total = sub_total + shipping_amount + service_fee + tax_fee
+        saved = cents(initial_total * discount / 100)
+        return dict(zip(pricing.AMOUNTS, (sub_total, shipping_amount, service_fee, tax_fee, initial_total, saved, initial_total - saved)))
+
+    def test_tax_is_charged_on_items_and_shipping(self):
+        priced = pricing.price_lines([2], [Decimal('10.00')], [Decimal('2.50')], tax_rate=Decimal(20))
+        self.assertEqual(priced.line(0)['tax_fee'], Decimal('5.00'))
+
+    def test_both_paths_match_decimal_arithmetic(self):
+        rng = random.Random(7)
+        lines = [
+            (rng.randint(1, 9), Decimal(rng.randint(1, 99999)) / 100, Decimal(rng.randint(0, 2000)) / 100,
+             rng.choice([Decimal(0), Decimal('7.25'), Decimal('12.5')]), rng.choice([Decimal(0), Decimal(15)]))
+            for _ in range(200)
+        ]
+        columns = [list(column) for column in zip(*lines)]
+        expected = [self.reference(*line) for line in lines]
+        for use_numpy in ([False, True] if pricing.numpy is not None else [False]):
+            priced = pricing.price_lines(*columns, use_numpy=use_numpy)
+            self.assertEqual([priced.line(index) for index in range(len(lines))], expected)
+            self.assertEqual(priced.totals['total'], sum(line['total'] for line in expected))
+
+
+class PaidOrderCounterTests(StoreTestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.first = make_product(self.vendor, "First")
+        self.second = make_product(self.vendor, "Second")
+
+    def counts(self):
+        return list(Product.objects.order_by('id').values_list('paid_order_count', flat=True))
+
+    def pair_counts(self):
+        return dict(((row[0], row[1]), row[2]) for row in ProductCoPurchase.objects.values_list('product', 'other', 'count'))
+
+    def add_item(self, order, product):
+        return CartOrderItem.objects.create(order=order, product=product, vendor=self.vendor, qty=1)
+
+    def test_counts_items_when_the_order_is_paid(self):
+        order = CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1")
+        self.add_item(order, self.first)
+        self.add_item(order, self.second)
+        self.assertEqual(self.counts(), [0, 0])
+
+        order.payment_status = "paid"
+        order.save()
+        self.assertEqual(self.counts(), [1, 1])
+        self.assertEqual(self.pair_counts(), {(self.first.pk, self.second.pk): 1, (self.second.pk, self.first.pk): 1})
+
+        order.payment_status = "refunded"
+        order.save()
+        self.assertEqual(self.counts(), [0, 0])
+        self.assertEqual(set(self.pair_counts().values()), {0})
+
+    def test_counts_items_added_to_an_order_created_paid(self):
+        order = CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1", payment_status="paid")
+        self.add_item(order, self.first)
+        self.add_item(order, self.first)
+        self.add_item(order, self.second)
+        self.assertEqual(self.counts(), [2, 1])
+        self.assertEqual(set(self.pair_counts().values()), {1})
+
+    def test_deleting_a_paid_order_uncounts_it(self):
+        order = CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1", payment_status="paid")
+        self.add_item(order, self.first)
+        self.add_item(order, self.second)
+        order.delete()
+        self.assertEqual(self.counts(), [0, 0])
+        self.assertEqual(set(self.pair_counts().values()), {0})
+
+    def test_deferred_loads_do_not_query_per_row(self):
+        for _ in range(6):
+            CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1")
+        for _ in range(3):
+            Review.objects.create(product=self.first, review="ok", rating=4)
+        with self.assertNumQueries(2):
+            list(CartOrder.objects.only('oid'))
+            list(Review.objects.only('review'))
+
+    def test_deferred_instances_still_count_on_save(self):
+        order = CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1")
+        self.add_item(order, self.first)
+        order = CartOrder.objects.only('oid').get(pk=order.pk)
+        order.payment_status = "paid"
+        order.save()
+        self.assertEqual(self.counts(), [1, 0])
+
+        review = Review.objects.create(product=self.first, review="ok", rating=2)
+        review = Review.objects.only('review').get(pk=review.pk)
+        review.rating = 4
+        review.save()
+        self.assertEqual(Product.objects.filter(pk=self.first.pk).values_list('rating_count', 'rating_avg').get(), (1, 4.0))
+        review = Review.objects.only('review').get(pk=review.pk)
+        review.delete()
+        self.assertEqual(Product.objects.filter(pk=self.first.pk).values_list('rating_count', 'rating_avg').get(), (0, 0.0))
+
+    def test_reviews_update_the_rating_in_place(self):
+        Review.objects.create(product=self.first, review="ok", rating=5)
+        # A checkout changes stock after the product was loaded for the review.
+        Product.objects.filter(pk=self.first.pk).update(stock_qty=3)
+        with self.assertNumQueries(2):
+            # The review INSERT and one UPDATE of the rating columns; no aggregate over the reviews.
+            Review.objects.create(product=self.first, review="ok", rating=2)
+        product = Product.objects.get(pk=self.first.pk)
+        self.assertEqual((product.rating_count, product.rating_avg, product.rating), (2, 3.5, 3))
+        self.assertEqual(product.stock_qty, 3)
+
+    def test_refunded_pairs_are_not_recommended(self):
+        order = CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1", payment_status="paid")
+        self.add_item(order, self.first)
+        self.add_item(order, self.second)
+        self.assertEqual(list(self.first.frequently_bought_together()), [self.second])
+
+        order.payment_status = "refunded"
+        order.save()
+        self.assertEqual(list(self.first.frequently_bought_together()), [])
+
+
+class CatalogQueryTests(StoreTestCase):
+    """
+    Query budgets of the catalog endpoints: fixed, whatever the page size or
+    the number of related rows.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        vendor = make_vendor()
+        self.products = [make_product(vendor, f"Product {number}") for number in range(6)]
+        for product in self.products:
+            for number in range(product.pk % 3 + 1):
+                Specification.objects.create(product=product, title=f"Spec {number}", content="x")
+                Color.objects.create(product=product, name=f"Color {number}", color_code="#000")
+                Size.objects.create(product=product, name=f"Size {number}", price=1)
+
+    def test_list_queries_do_not_grow_with_the_page_size(self):
+        for page_size in (2, 6):
+            with self.subTest(page_size=page_size), self.assertNumQueries(1):
+                response = self.client.get("/api/v1/products/", {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_detail_queries_do_not_grow_with_related_rows(self):
+        for product in self.products[:3]:
+            with self.subTest(product=product.pk), self.assertNumQueries(5):
+                response = self.client.get(f"/api/v1/products/{product.slug}/")
+            self.assertEqual(len(response.data['specification']), product.pk % 3 + 1)
+
+
+class CatalogPaginationTests(StoreTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.vendor = make_vendor()
+        self.products = [make_product(self.vendor, f"Product {number}") for number in range(7)]
+
+    def test_cursor_pages_survive_inserts(self):
+        response = self.client.get("/api/v1/products/", {'page_size': 3})
+        seen = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            # New products sort before the cursor, so they neither shift nor repeat later pages.
+            make_product(self.vendor, "Newer")
+            response = self.client.get(response.data['next'])
+            seen += [row['id'] for row in response.data['results']]
+        self.assertEqual(seen, sorted((product.pk for product in self.products), reverse=True))
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=[16, 32], IMAGE_VARIANT_FORMATS=['webp', 'jpeg'])
+class ImageVariantTests(StoreTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def upload(self, color):
+        output = io.BytesIO()
+        PILImage.new('RGB', (64, 48), color).save(output, 'PNG')
+        return SimpleUploadedFile(f"{color}.png", output.getvalue())
+
+    def variant_files(self, category):
+        return [images.variant_name(category.image.name, width, format) for width in (16, 32) for format in ('webp', 'jpeg')]
+
+    def test_variants_are_generated_and_replaced_with_the_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(title="Shoes", image=self.upload("red"))
+        category.refresh_from_db()
+        self.assertEqual(set(category.image_variants), {"16", "32"})
+        self.assertEqual(set(category.image_variants["32"]), {"webp", "jpeg"})
+        old_files = self.variant_files(category)
+        for name in old_files:
+            with storages['derivatives'].open(name) as variant:
+                self.assertLessEqual(PILImage.open(variant).width, 32)
+        self.assertEqual(images.variant_url(category, 32, 'jpeg'), storages['derivatives'].url(old_files[3]))
+
+        category.image = self.upload("blue")
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        category.refresh_from_db()
+        new_files = self.variant_files(category)
+        self.assertTrue(set(new_files).isdisjoint(old_files))
+        self.assertTrue(all(storages['derivatives'].exists(name) for name in new_files))
+        self.assertEqual(images.variant_url(category, 32, 'jpeg'), storages['derivatives'].url(new_files[3]))
+
+
+class CatalogCacheTests(StoreTestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.category = Category.objects.create(title="Shoes")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(self.vendor, category=self.category)
+
+    def test_admin_actions_refresh_the_category_summary(self):
+        self.assertEqual(self.category.product_count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_in_review(None, None, Product.objects.filter(pk=self.product.pk))
+        self.assertEqual(self.category.product_count(), 0)
+
+    def test_bulk_writes_refresh_cached_product_responses(self):
+        client = APIClient()
+        url = f"/api/v1/products/{self.product.slug}/"
+        self.assertFalse(client.get(url).json()['featured'])
+        with self.captureOnCommitCallbacks(execute=True):
+            make_featured(None, None, Product.objects.filter(pk=self.product.pk))
+        self.assertTrue(client.get(url).json()['featured'])
+
+    def test_only_selling_out_refreshes_cached_product_responses(self):
+        client = APIClient()
+        url = f"/api/v1/products/{self.product.slug}/"
+        self.assertEqual(client.get(url).json()['stock_qty'], 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.reserve_stock(4)
+        self.assertEqual(client.get(url).json()['stock_qty'], 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.reserve_stock(6)
+        self.assertEqual(client.get(url).json()['in_stock'], False)
+
+    @override_settings(ALLOWED_HOSTS=["a.example.com", "b.example.com"])
+    def test_responses_are_cached_per_host(self):
+        client = APIClient()
+        url = f"/api/v1/products/{self.product.slug}/"
+        self.assertIn("//a.example.com/", client.get(url, HTTP_HOST="a.example.com").json()['image'])
+        self.assertIn("//b.example.com/", client.get(url, HTTP_HOST="b.example.com").json()['image'])
+
+
+class FacetIndexTests(StoreTestCase):
+    def setUp(self):
+        bump_cache_version("facets")
+        facets._memo.clear()
+        vendor = make_vendor()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [make_product(vendor, f"Product {n}", brand="Acme") for n in range(3)]
+        self.assertEqual(facets.facet_index().products.bit_count(), 3)
+
+    def test_admin_actions_patch_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_in_review(None, None, Product.objects.filter(pk=self.products[0].pk))
+            make_featured(None, None, Product.objects.filter(pk=self.products[1].pk))
+        facets._memo.clear()
+        matching, counts = facets.facet_index().query({'featured': [True]})
+        self.assertEqual(facets.bitmap_ids(matching), [self.products[1].pk])
+        self.assertEqual(counts['brand'], {"Acme": 1})
+
+    def test_reservations_patch_only_when_in_stock_flips(self):
+        product = self.products[0]
+        with mock.patch('store.facets.refresh_products') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.reserve_stock(4)
+            refresh.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                product.reserve_stock(6)
+            refresh.assert_called_once_with([product.pk])
+
+    def test_patches_wait_for_the_lock(self):
+        key, _, lock_key = facets.index_keys()
+        cache.add(lock_key, 1)
+        threading.Timer(0.1, cache.delete, [lock_key]).start()
+        Product.objects.filter(pk=self.products[0].pk).update(featured=True)
+        facets.refresh_products([self.products[0].pk])
+        self.assertEqual(facets.index_keys()[0], key)
+        facets._memo.clear()
+        matching, _ = facets.facet_index().query({'featured': [True]})
+        self.assertEqual(facets.bitmap_ids(matching), [self.products[0].pk])
+
+    def test_non_finite_prices_are_refused(self):
+        client = APIClient()
+        for value in ("NaN", "Infinity", "-inf", "1e999999", "abc"):
+            for url in ("/api/v1/products/facets/", "/api/v1/products/"):
+                self.assertEqual(client.get(url, {'min_price': value}).status_code, 400, (url, value))
+
+    def test_patches_rewrite_only_the_postings_they_change(self):
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                make_featured(None, None, Product.objects.filter(pk=self.products[0].pk))
+        key, _, _ = facets.index_keys()
+        written = set(set_many.call_args.args[0])
+        self.assertIn(f"{key}:postings:featured", written)
+        self.assertNotIn(f"{key}:postings:brand", written)
+
+
+@override_settings(CART_TAX_RATES={'US': 10})
+class CartTests(StoreTestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        self.lamp = make_product(vendor, "Lamp", price=Decimal('12.50'), shipping_amount=2)
+        self.desk = make_product(vendor, "Desk", price=Decimal('99.99'), shipping_amount=10)
+
+    def assert_header_matches_lines(self, cart_id="cart"):
+        lines = Cart.objects.filter(cart_id=cart_id)
+        sums = lines.aggregate(
+            line_count=models.Count('id'), item_count=models.Sum('qty'),
+            **{name: models.Sum(name) for name in ('sub_total', 'shipping_amount', 'service_fee', 'tax_fee', 'total')},
+        )
+        session = CartSession.objects.get(cart_id=cart_id)
+        for name, value in sums.items():
+            self.assertEqual(getattr(session, name), value or 0, name)
+        return session
+
+    def test_header_follows_adds_updates_and_removals(self):
+        returned = upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 2}])
+        session = self.assert_header_matches_lines()
+        self.assertEqual((returned.total, returned.item_count), (session.total, 2))
+
+        upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 3}, {'product': self.desk.pk, 'qty': 1}])
+        session = self.assert_header_matches_lines()
+        self.assertEqual((session.line_count, session.item_count), (2, 4))
+
+        upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 0}])
+        session = self.assert_header_matches_lines()
+        self.assertEqual((session.line_count, session.item_count), (1, 1))
+
+    def test_country_change_reprices_every_line(self):
+        upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 2}, {'product': self.desk.pk, 'qty': 1}])
+        self.assertEqual(get_cart("cart").tax_fee, 0)
+        session = upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 1}], country='US')
+        self.assertEqual(set(Cart.objects.values_list('country', flat=True)), {'US'})
+        # 10% of items plus shipping: (12.50 + 2) + (99.99 + 10).
+        self.assertEqual(session.tax_fee, Decimal('12.45'))
+        self.assert_header_matches_lines()
+
+    def test_rebuild_sessions_recomputes_headers(self):
+        upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 2}])
+        upsert_lines("other", [{'product': self.desk.pk, 'qty': 1}])
+        Cart.objects.filter(cart_id="cart").update(qty=5, total=Decimal('70.00'))
+        Cart.objects.filter(cart_id="other").delete()
+        self.assertEqual(rebuild_sessions(), 1)
+        self.assertEqual(self.assert_header_matches_lines().item_count, 5)
+        self.assert_header_matches_lines("other")
+
+    def test_country_change_drops_unpublished_lines_it_does_not_touch(self):
+        upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 1}, {'product': self.desk.pk, 'qty': 1}])
+        Product.objects.filter(pk=self.desk.pk).update(status="draft")
+        session = upsert_lines("cart", [{'product': self.lamp.pk, 'qty': 2}], country='US')
+        self.assertEqual(list(Cart.objects.values_list('product', flat=True)), [self.lamp.pk])
+        self.assertEqual((session.line_count, session.item_count), (1, 2))
+
+    def test_unpublished_products_in_the_lines_are_refused(self):
+        Product.objects.filter(pk=self.desk.pk).update(status="draft")
+        with self.assertRaisesMessage(ValueError, f"Unknown products: {self.desk.pk}"):
+            upsert_lines("cart", [{'product': self.desk.pk, 'qty': 1}])
+
+
+DETAILS = {'full_name': "Ama", 'email': "ama@example.com", 'mobile': "0"}
+
+
+class CheckoutTests(StoreTestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.lamp = make_product(self.vendor, "Lamp", stock_qty=3)
+        self.desk = make_product(self.vendor, "Desk", stock_qty=1)
+
+    def add_line(self, product, qty, cart_id="cart"):
+        Cart.objects.create(cart_id=cart_id, product=product, qty=qty)
+
+    def stock(self):
+        return list(Product.objects.order_by('id').values_list('stock_qty', flat=True))
+
+    def test_reserves_the_ordered_stock(self):
+        self.add_line(self.lamp, 2)
+        self.add_line(self.desk, 1)
+        order = place_order("cart", DETAILS)
+        self.assertEqual(CartOrderItem.objects.filter(order=order).count(), 2)
+        self.assertEqual(self.stock(), [1, 0])
+        self.assertFalse(Product.objects.get(pk=self.desk.pk).in_stock)
+
+    def test_short_stock_places_nothing(self):
+        self.add_line(self.lamp, 2)
+        self.add_line(self.desk, 2)
+        with self.assertRaises(InsufficientStock):
+            place_order("cart", DETAILS)
+        self.assertFalse(CartOrder.objects.exists())
+        self.assertEqual(self.stock(), [3, 1])
+
+    def test_short_stock_is_a_validation_error(self):
+        self.add_line(self.desk, 2)
+        response = APIClient().post("/api/v1/checkout/", {'cart_id': "cart", **DETAILS}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unpublished_products_are_left_out(self):
+        self.add_line(self.lamp, 1)
+        self.add_line(self.desk, 1)
+        Product.objects.filter(pk=self.desk.pk).update(status="disabled")
+        order = place_order("cart", DETAILS)
+        self.assertEqual(list(CartOrderItem.objects.filter(order=order).values_list('product', flat=True)), [self.lamp.pk])
+        self.assertEqual(self.stock(), [2, 1])
+
+        self.add_line(self.desk, 1, cart_id="other")
+        with self.assertRaises(EmptyCart):
+            place_order("other", DETAILS)
+
+
+class CouponTests(StoreTestCase):
+    def setUp(self):
+        bump_cache_version("coupons")
+        self.vendor = make_vendor()
+        self.product = make_product(self.vendor, stock_qty=100)
+        self.coupon = Coupon.objects.create(vendor=self.vendor, code="SAVE10", discount=10)
+        self.buyer = User.objects.create_user(username="ama", email="ama@example.com", password="password")
+        bump_cache_version("coupons")
+
+    def checkout(self, email="ama@example.com", buyer=None, cart_id="cart"):
+        Cart.objects.create(cart_id=cart_id, product=self.product, qty=1)
+        return place_order(cart_id, {**DETAILS, 'email': email}, buyer=buyer, coupon_codes=["save10"])
+
+    def test_guest_use_is_recorded(self):
+        order = self.checkout()
+        self.assertEqual(order.saved, (order.initial_total / 10).quantize(Decimal('0.01')))
+        redemption = CouponRedemption.objects.get()
+        self.assertEqual((redemption.email, redemption.user, redemption.order), ("ama@example.com", None, order))
+
+    def test_guest_cannot_use_a_coupon_twice(self):
+        self.checkout()
+        with self.assertRaises(AlreadyRedeemed):
+            self.checkout(email=" AMA@example.com", cart_id="again")
+        self.assertEqual(CartOrder.objects.count(), 1)
+
+    def test_signed_in_buyer_is_limited_by_account_and_email(self):
+        self.checkout(buyer=self.buyer)
+        with self.assertRaises(AlreadyRedeemed):
+            self.checkout(email="other@example.com", buyer=self.buyer, cart_id="again")
+        with self.assertRaises(AlreadyRedeemed):
+            self.checkout(cart_id="guest")
+
+    def test_other_integrity_errors_are_not_reported_as_a_second_use(self):
+        with mock.patch.object(CouponRedemption.objects, 'bulk_create', side_effect=IntegrityError("NOT NULL constraint failed")):
+            with self.assertRaisesMessage(IntegrityError, "NOT NULL"):
+                redeem([self.coupon], "ama@example.com")
+
+
+class CouponRedemptionMigrationTests(TransactionTestCase):
+    before = [("store", "0014_tax_fee_help_text")]
+    after = [("store", "0015_coupon_redemption_email")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_emails_differing_in_case_keep_one_use(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model("userauths", "User")
+        Vendor = apps.get_model("vendor", "Vendor")
+        Coupon = apps.get_model("store", "Coupon")
+        CouponRedemption = apps.get_model("store", "CouponRedemption")
+        first = User.objects.create(username="ama", email="Ama@example.com")
+        second = User.objects.create(username="ama2", email="ama@example.com")
+        coupon = Coupon.objects.create(vendor=Vendor.objects.create(user=first, name="v"), code="SAVE10", discount=10)
+        kept = CouponRedemption.objects.create(coupon=coupon, user=first)
+        CouponRedemption.objects.create(coupon=coupon, user=second)
+
+        apps = self.migrate(self.after)
+        redemptions = apps.get_model("store", "CouponRedemption").objects.values_list('pk', 'email')
+        self.assertEqual(list(redemptions), [(kept.pk, "ama@example.com")])
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class PaymentWebhookTests(StoreTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        vendor = make_vendor()
+        self.product = make_product(vendor)
+        self.order = CartOrder.objects.create(full_name="a", email="a@example.com", mobile="1", stripe_session_id="cs_1")
+        CartOrderItem.objects.create(order=self.order, product=self.product, vendor=vendor, qty=1)
+
+    def deliver(self, event_id, event_type, signature=None, **session):
+        payload = json.dumps({'id': event_id, 'type': event_type, 'data': {'object': {'id': "cs_1", **session}}}).encode()
+        return self.client.post(
+            "/api/v1/payments/webhook/", payload, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature or sign_payload(payload, "whsec_test"),
+        )
+
+    def order_status(self):
+        return CartOrder.objects.get(pk=self.order.pk).payment_status
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver("evt_1", "checkout.session.completed", signature="t=1,v1=00")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_malformed_events_are_rejected(self):
+        bodies = [
+            [1],
+            {'id': "evt_1", 'type': 5},
+            {'id': ["evt_1"], 'type': "checkout.session.completed"},
+            {'id': "evt_1", 'type': "checkout.session.completed", 'data': "cs_1"},
+            {'id': "evt_1", 'type': "checkout.session.completed", 'data': {'object': ["cs_1"]}},
+            {'id': "evt_1", 'type': "checkout.session.completed", 'data': {'object': {'id': 1}}},
+        ]
+        for body in bodies:
+            with self.subTest(body):
+                payload = json.dumps(body).encode()
+                response = self.client.post(
+                    "/api/v1/payments/webhook/", payload, content_type="application/json",
+                    HTTP_STRIPE_SIGNATURE=sign_payload(payload, "whsec_test"),
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_redelivered_events_are_stored_once(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver("evt_1", "checkout.session.completed", payment_status="paid").status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+    def test_payment_is_applied_once(self):
+        self.deliver("evt_1", "checkout.session.completed", payment_status="paid")
+        self.deliver("evt_2", "checkout.session.async_payment_succeeded")
+        self.assertEqual(process_batch(), 2)
+        self.assertEqual(self.order_status(), "paid")
+        self.assertEqual(list(PaymentEvent.objects.order_by('event_id').values_list('status', flat=True)), ["applied", "ignored"])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).paid_order_count, 1)
+
+    def test_expiry_after_payment_is_ignored(self):
+        self.deliver("evt_1", "checkout.session.async_payment_succeeded")
+        process_batch()
+        self.deliver("evt_2", "checkout.session.expired")
+        process_batch()
+        self.assertEqual(self.order_status(), "paid")
+
+    def test_events_before_the_order_are_retried(self):
+        self.order.stripe_session_id = "cs_2"
+        self.order.save()
+        self.deliver("evt_1", "checkout.session.completed", payment_status="paid")
+        process_batch()
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ("pending", 1))
+        self.assertIn("OrderNotFound", event.last_error)
+
+
+class ProductImporterTests(StoreTestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.category = Category.objects.create(title="Shoes", slug="shoes")
+
+    def run_import(self, text, format='csv', **options):
+        return ProductImporter(**options).run(io.StringIO(text), format)
+
+    def test_creates_and_updates_by_sku(self):
+        feed = "sku,title,price,category,stock_qty,featured\nSKU1,Runner,49.90,shoes,3,yes\n"
+        self.assertEqual(self.run_import(feed, vendor=self.vendor), 1)
+        product = Product.objects.get(sku="SKU1")
+        self.assertEqual((product.price, product.category, product.vendor, product.in_stock), (Decimal("49.90"), self.category, self.vendor, True))
+        self.assertTrue(product.featured)
+
+        self.run_import("sku,title,price\nSKU1,Runner 2,59.90\n")
+        product.refresh_from_db()
+        self.assertEqual((product.title, product.price), ("Runner 2", Decimal("59.90")))
+
+    def test_partial_rows_leave_other_columns_alone(self):
+        self.run_import(
+            "sku,title,price,category,brand,description,featured,stock_qty\nSKU1,Runner,49.90,shoes,Acme,Light,yes,3\n",
+            vendor=self.vendor,
+        )
+        self.run_import("sku,title,stock_qty\nSKU1,Runner,0\n")
+        product = Product.objects.get(sku="SKU1")
+        self.assertEqual((product.stock_qty, product.in_stock), (0, False))
+        self.assertEqual(product.price, Decimal("49.90"))
+        self.assertEqual((product.category, product.vendor), (self.category, self.vendor))
+        self.assertEqual((product.brand, product.description, product.featured), ("Acme", "Light", True))
+
+    def test_generated_pid_clashing_with_a_stored_one_is_replaced(self):
+        existing = make_product(self.vendor)
+        importer = ProductImporter()
+        pids = iter([existing.pid, "freshpidxx"])
+        importer.rng.choices = lambda alphabet, k: list(next(pids)) if k == 10 else ["x"] * k
+        self.assertEqual(importer.run(io.StringIO("sku,title\nSKU9,Boot\n"), 'csv'), 1)
+        self.assertEqual(Product.objects.get(sku="SKU9").pid, "freshpidxx")
+
+    def test_malformed_rows_are_row_errors(self):
+        rows = [
+            ('[1]', "Line 1: expected an object"),
+            ('{"title": 5.5}', None),
+            ('{"title": ["Boot"]}', "Line 1: title must be text"),
+            ('{"title": "Boot", "status": "sold"}', "Line 1: status must be one of"),
+            ('{"title": "Boot", "type": {"kind": "regular"}}', "Line 1: type must be text"),
+            ('{"title": "Boot", "type": "raffle"}', "Line 1: type must be one of"),
+            ('{"title": "Boot", "price": [1]}', "Line 1: price is not a number"),
+        ]
+        for text, message in rows:
+            with self.subTest(text):
+                if message is None:
+                    self.assertEqual(self.run_import(text + "\n", 'jsonl'), 1)
+                    continue
+                with self.assertRaisesMessage(ProductImportError, message):
+                    self.run_import(text + "\n", 'jsonl')
+        self.assertEqual(Product.objects.get(title="5.5").status, Product._meta.get_field('status').default)
+
+
+class ProductImportJobTests(StoreTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.vendor = make_vendor()
+
+    def queue(self, text, format='csv'):
+        return ProductImportJob.objects.create(file=SimpleUploadedFile(f"feed.{format}", text.encode()), format=format, vendor=self.vendor)
+
+    def test_admin_upload_only_queues_the_feed(self):
+        admin_user = User.objects.create_superuser(username="admin", email="admin@example.com", password="password")
+        self.client.force_login(admin_user)
+        feed = SimpleUploadedFile("feed.csv", b"sku,title\nSKU1,Runner\n")
+        response = self.client.post("/admin/store/product/bulk-import/", {'file': feed, 'format': 'csv', 'vendor': self.vendor.pk})
+        self.assertRedirects(response, "/admin/store/productimportjob/", fetch_redirect_response=False)
+        job = ProductImportJob.objects.get()
+        self.assertEqual((job.status, job.user, job.vendor), ("queued", admin_user, self.vendor))
+        self.assertFalse(Product.objects.filter(sku="SKU1").exists())
+
+    def test_worker_runs_the_job_and_records_progress(self):
+        job = self.queue("sku,title,stock_qty\nSKU1,Runner,3\nSKU2,Boot,0\n")
+        self.assertEqual(process_next_job(batch_size=1).pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.imported, job.attempts, job.error), ("done", 2, 1, ""))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(set(Product.objects.filter(vendor=self.vendor).values_list('sku', flat=True)), {"SKU1", "SKU2"})
+        self.assertIsNone(process_next_job())
+
+    def test_bad_feed_fails_the_job_with_the_row_error(self):
+        job = self.queue('{"title": "Runner", "sku": "SKU1"}\n[1]\n', 'jsonl')
+        process_next_job(batch_size=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.imported), ("failed", 1))
+        self.assertIn("Line 2: expected an object", job.error)
+
+    def test_job_of_a_dead_worker_is_rerun_after_its_lease(self):
+        job = self.queue("sku,title\nSKU1,Runner\n")
+        ProductImportJob.objects.filter(pk=job.pk).update(status="running", attempts=1, next_attempt_at=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(process_next_job())
+        ProductImportJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(process_next_job().status, "done")
+
+
+class ProductSearchTests(StoreTestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.published = [make_product(vendor, "Desk lamp", slug="desk-lamp-1"), make_product(vendor, "Floor lamp")]
+            for _ in range(5):
+                make_product(vendor, "Lamp lamp lamp", status="draft")
+
+    def test_status_is_applied_before_the_limit(self):
+        published = Product.objects.filter(status="published")
+        results = search_products(published, "lamp", limit=2, status="published")
+        self.assertCountEqual(results, self.published)
+
+    def test_other_filters_fetch_further_pages(self):
+        results = search_products(Product.objects.filter(status="published"), "lamp", limit=2)
+        self.assertCountEqual(results, self.published)
+
+    def test_admin_search_still_matches_slugs(self):
+        model_admin = site._registry[Product]
+        results, _ = model_admin.get_search_results(RequestFactory().get("/"), Product.objects.all(), "desk-lamp-1")
+        self.assertEqual(list(results), [self.published[0]])
@@ -1,3 +1,261 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.utils import validate_file_name
+from django.shortcuts import redirect
+from django.utils.decorators import method_decorator
 
-# Create your views here.
+# Rest Framework imports
+from rest_framework import generics, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# Serializers
+from store.serializer import (
+    BrandSerializer, CartLineSerializer, CartOrderSerializer, CartSessionSerializer, CartUpdateSerializer, CheckoutSerializer,
+    ProductCardSerializer, ProductSerializer,
+)
+
+# Models
+from store.models import Brand, CartSession, Category, InsufficientStock, Product
+
+from store.caching import cache_response
+from store.cart import cart_lines, get_cart, upsert_lines
+from store.checkout import ORDER_DETAILS, EmptyCart, place_order
+from store.coupons import AlreadyRedeemed, find_coupons, redeemed
+from store.facets import facet_index, filter_products, parse_selection
+from store.images import generate_variants, variant_formats, variant_widths
+from store.payments import InvalidSignature, record_event, verify_signature
+from store.search import search_products
+
+
+class CatalogPagination(CursorPagination):
+    """
+    Keyset pagination on the product id: each page is `WHERE id < <last id>
+    ORDER BY id DESC LIMIT n` behind an opaque cursor, so deep pages cost the
+    same as the first one.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+
+@method_decorator(cache_response("products"), name="dispatch")
+class ProductListView(generics.ListAPIView):
+    """
+    Public listing of published products as catalog cards, narrowed by the
+    same filters as ProductFacetView.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = ProductCardSerializer
+    pagination_class = CatalogPagination
+
+    def get_queryset(self):
+        try:
+            selection, min_price, max_price = parse_selection(self.request.query_params)
+        except ValueError as error:
+            raise ValidationError(str(error))
+        products = Product.objects.filter(status="published").only(*ProductCardSerializer.Meta.fields)
+        return filter_products(products, selection, min_price, max_price)
+
+
+class ProductFacetView(APIView):
+    """
+    Facet counts for a filter selection, e.g.
+    `?category=3&color=Red&color=Blue&in_stock=true&min_price=10`. Values of
+    one facet are alternatives, different facets all apply. Each facet's counts
+    ignore that facet's own selection, so they show what picking another value
+    would give. Answered from the in-memory facet index, not SQL aggregates.
+    """
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            selection, min_price, max_price = parse_selection(request.query_params)
+        except ValueError as error:
+            raise ValidationError(str(error))
+        matching, counts = facet_index().query(selection, min_price, max_price)
+        return Response({
+            'count': matching.bit_count(),
+            'facets': {
+                facet: [{'value': value, 'count': count} for value, count in sorted(values.items(), key=lambda item: -item[1])]
+                for facet, values in counts.items()
+            },
+        })
+
+
+@method_decorator(cache_response("products"), name="dispatch")
+class ProductSearchView(APIView):
+    """
+    Full-text search over published products, best match first. Every term
+    in `q` is matched as a prefix of a word in the title, tags, brand or
+    description.
+    """
+    permission_classes = (AllowAny,)
+    max_results = 50
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        products = Product.objects.filter(status="published").only(*ProductCardSerializer.Meta.fields)
+        results = search_products(products, query, limit=self.max_results, status="published")
+        return Response(ProductCardSerializer(results, many=True, context={'request': request}).data)
+
+
+@method_decorator(cache_response("products"), name="dispatch")
+class ProductDetailView(generics.RetrieveAPIView):
+    """
+    Public detail of a single published product, looked up by slug.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = ProductSerializer
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        return Product.objects.filter(status="published").with_detail()
+
+
+@method_decorator(cache_response("categories"), name="dispatch")
+class CategoryListView(APIView):
+    """
+    Active categories with their published product counts.
+    """
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(Category.summary())
+
+
+@method_decorator(cache_response("brands"), name="dispatch")
+class BrandListView(generics.ListAPIView):
+    """
+    Active brands.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = BrandSerializer
+    queryset = Brand.objects.filter(active=True)
+
+
+class ImageVariantView(APIView):
+    """
+    Lazy image variants: renders one width/format of a stored image on first
+    request, then redirects to the stored file.
+    """
+    permission_classes = (AllowAny,)
+
+    def get(self, request, width, image_format, name, *args, **kwargs):
+        # Not `format`: DRF reserves that URL kwarg for renderer selection.
+        if width not in variant_widths() or image_format not in variant_formats():
+            raise NotFound()
+        try:
+            validate_file_name(name, allow_relative_path=True)
+            variants = generate_variants(name, [width], [image_format])
+        except (SuspiciousFileOperation, OSError):
+            raise NotFound()
+        if not variants:
+            raise NotFound()
+        response = redirect(variants[str(width)][image_format])
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+
+class CartView(APIView):
+    """
+    A cart's totals (GET), and batched changes to its lines (POST):
+
+        {"lines": [{"product": 12, "qty": 2, "size": "M"}, {"product": 7, "qty": 0}], "country": "Ghana"}
+
+    qty 0 removes a line. Both answer with the cart's totals.
+    """
+    permission_classes = (AllowAny,)
+
+    def get(self, request, cart_id, *args, **kwargs):
+        session = get_cart(cart_id)
+        if session is None:
+            session = CartSession(cart_id=cart_id)
+        return Response(CartSessionSerializer(session).data)
+
+    def post(self, request, cart_id, *args, **kwargs):
+        serializer = CartUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user if request.user.is_authenticated else None
+        try:
+            session = upsert_lines(
+                cart_id, serializer.validated_data['lines'], user=user,
+                country=serializer.validated_data.get('country'),
+            )
+        except ValueError as error:
+            raise ValidationError(str(error))
+        return Response(CartSessionSerializer(session).data)
+
+
+class CartLineListView(generics.ListAPIView):
+    """
+    The lines of a cart with their products, oldest first.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = CartLineSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return cart_lines(self.kwargs['cart_id'])
+
+
+class CheckoutView(APIView):
+    """
+    Place an order for a cart. Answers with the new order's oid and totals.
+    """
+    permission_classes = (AllowAny,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        buyer = request.user if request.user.is_authenticated else None
+        try:
+            order = place_order(
+                data['cart_id'], {name: data.get(name) for name in ORDER_DETAILS},
+                buyer=buyer, coupon_codes=data.get('coupons', ()),
+            )
+        except (EmptyCart, AlreadyRedeemed, InsufficientStock) as error:
+            raise ValidationError(str(error))
+        return Response(CartOrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class CouponView(APIView):
+    """
+    Active coupons carrying `code`, one per vendor, with whether the current
+    user has already used each.
+    """
+    permission_classes = (AllowAny,)
+
+    def get(self, request, code, *args, **kwargs):
+        coupons = find_coupons([code])
+        if not coupons:
+            raise NotFound("Coupon not found")
+        user = request.user if request.user.is_authenticated else None
+        used = redeemed(user, coupons)
+        return Response([
+            {"code": coupon.code, "vendor": coupon.vendor_id, "discount": coupon.discount, "redeemed": coupon.pk in used}
+            for coupon in sorted(coupons, key=lambda coupon: coupon.pk)
+        ])
+
+
+class PaymentWebhookView(APIView):
+    """
+    Payment provider webhook. Verifies the signature, stores the event and
+    acknowledges it; the process_payment_events worker applies it to the order.
+    """
+    permission_classes = (AllowAny,)
+    authentication_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        payload = request.body
+        try:
+            verify_signature(payload, request.headers.get('Stripe-Signature'), settings.STRIPE_WEBHOOK_SECRET)
+            record_event(payload)
+        except (InvalidSignature, ValueError) as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"received": True})
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from userauths.models import Profile, User
+from userauths.models import OneTimeCode, OutboundEmail, Profile, User
 
 class UserAdmin(admin.ModelAdmin):
     """
@@ -25,6 +25,37 @@ class ProfileAdmin(admin.ModelAdmin):
     search_fields = ['full_name', 'country', 'date']
     list_filter = ['date']
 
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """
+    Admin view for the email outbox.
+
+    Attributes:
+        list_display (list): Fields to display in the admin list view.
+        search_fields (list): Fields to include in the search functionality.
+        list_filter (list): Fields to include in the filter functionality.
+    """
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    search_fields = ['to', 'subject']
+    list_filter = ['status', 'template']
+    readonly_fields = ['claim', 'attempts', 'last_error', 'created', 'sent_at']
+
+class OneTimeCodeAdmin(admin.ModelAdmin):
+    """
+    Admin view for one-time codes. Only digests are stored, never the codes.
+
+    Attributes:
+        list_display (list): Fields to display in the admin list view.
+        search_fields (list): Fields to include in the search functionality.
+        list_filter (list): Fields to include in the filter functionality.
+    """
+    list_display = ['user', 'purpose', 'attempts', 'expires_at']
+    search_fields = ['user__email']
+    list_filter = ['purpose']
+    readonly_fields = ['digest']
+    raw_id_fields = ['user']
+
 # Register your models here.
 admin.site.register(User, UserAdmin)
-admin.site.register(Profile, ProfileAdmin)
\ No newline at end of file
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
+admin.site.register(OneTimeCode, OneTimeCodeAdmin)
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Custom JWT claims (full_name, email, username, vendor_id), cached per user.
+
+Login builds the claims from the user it has just authenticated (loaded with
+its vendor in the same query, see UserManager), and refresh brings a token's
+claims up to date from the cache, so a user who became a vendor or changed
+their name gets current claims on the next refresh without a database hit.
+Saving a user's claim fields, or creating or deleting their vendor, drops the
+cached entry once the transaction commits.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+
+CLAIMS_KEY = "userauths:claims:%s"
+CLAIMS_TIMEOUT = 60 * 60
+CLAIM_FIELDS = frozenset(['full_name', 'email', 'username'])
+
+
+def build_claims(user):
+    # select_related('vendor') caches a missing vendor as None, so this does
+    # not query either way.
+    vendor = getattr(user, 'vendor', None)
+    return {
+        'full_name': user.full_name,
+        'email': user.email,
+        'username': user.username,
+        'vendor_id': vendor.id if vendor else 0,
+    }
+
+
+def user_claims(user_or_id):
+    """
+    Claims of a user, given the user (with its vendor loaded) or its id.
+    None when no such user exists.
+    """
+    user_id = getattr(user_or_id, 'pk', user_or_id)
+    claims = cache.get(CLAIMS_KEY % user_id)
+    if claims is None:
+        if hasattr(user_or_id, 'pk'):
+            user = user_or_id
+        else:
+            user = get_user_model().objects.select_related('vendor').filter(pk=user_id).first()
+            if user is None:
+                return None
+        claims = build_claims(user)
+        cache.set(CLAIMS_KEY % user_id, claims, CLAIMS_TIMEOUT)
+    return claims
+
+
+def invalidate_claims(user_id):
+    transaction.on_commit(lambda: cache.delete(CLAIMS_KEY % user_id))
@@ -0,0 +1,120 @@
+"""
+Transactional email outbox.
+
+`queue_email()` only inserts an OutboundEmail row, so a request never waits
+on the mail server and the message is committed or rolled back together
+with the change that caused it. The `send_queued_email` worker claims due
+messages in batches, renders their templates and sends them over one SMTP
+connection that stays open between batches.
+
+Messages are claimed with a leased UPDATE (see backend.leases), so concurrent
+workers never take the same message, and messages of a worker that died
+mid-batch become due again when the lease runs out. Failed sends are retried
+with exponential backoff and jitter, up to MAX_ATTEMPTS.
+
+The context can hold secrets (password reset links carry the one-time code),
+so it is cleared as soon as a message is sent or given up on, and
+`purge_finished()` (run by `purge_one_time_codes`) deletes finished rows after
+RETENTION.
+"""
+
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import models
+from django.template import TemplateDoesNotExist
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from backend.leases import claim_due, retry_later
+from userauths.models import OutboundEmail
+
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30
+BACKOFF_MAX = 6 * 60 * 60
+LEASE = 5 * 60
+RETENTION = timedelta(days=7)
+
+
+def queue_email(template, to, subject, context):
+    return OutboundEmail.objects.create(template=template, to=to, subject=subject, context=context)
+
+
+def purge_finished(retention=RETENTION):
+    """
+    Delete sent and failed messages older than `retention`. Returns the number
+    deleted.
+    """
+    cutoff = timezone.now() - retention
+    deleted, _ = OutboundEmail.objects.filter(status__in=["sent", "failed"], created__lte=cutoff).delete()
+    return deleted
+
+
+def claim_batch(size, lease=LEASE):
+    return list(claim_due(OutboundEmail.objects.filter(status="queued"), size, lease))
+
+
+def render_message(email, connection):
+    text = render_to_string(f"{email.template}.txt", email.context)
+    message = EmailMultiAlternatives(
+        subject=email.subject, body=text, from_email=settings.FROM_EMAIL, to=[email.to], connection=connection
+    )
+    try:
+        message.attach_alternative(render_to_string(f"{email.template}.html", email.context), "text/html")
+    except TemplateDoesNotExist:
+        pass
+    return message
+
+
+class OutboxWorker:
+    """
+    Delivers due messages in batches of `batch_size` over one mail connection
+    (EMAIL_BACKEND unless given), opened on first use and kept open.
+    """
+
+    def __init__(self, batch_size=50, connection=None):
+        self.batch_size = batch_size
+        self.connection = connection or get_connection(fail_silently=False)
+
+    def run_once(self):
+        """
+        Deliver one batch. Returns the number of messages claimed.
+        """
+        batch = claim_batch(self.batch_size)
+        if not batch:
+            return 0
+
+        sent, failed = [], []
+        for email in batch:
+            try:
+                self.send(render_message(email, self.connection))
+                sent.append(email.pk)
+            except Exception as error:
+                failed.append((email, error))
+
+        now = timezone.now()
+        OutboundEmail.objects.filter(pk__in=sent).update(
+            status="sent", sent_at=now, attempts=models.F('attempts') + 1, last_error="", context={}
+        )
+        for email, error in failed:
+            email.attempts += 1
+            if not retry_later(email, error, MAX_ATTEMPTS, BACKOFF_BASE, BACKOFF_MAX):
+                email.context = {}
+            email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'context'])
+        return len(batch)
+
+    def send(self, message):
+        self.connection.open()
+        try:
+            self.connection.send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            # Idle connections get dropped by the server; reconnect once.
+            self.close()
+            self.connection.open()
+            self.connection.send_messages([message])
+
+    def close(self):
+        self.connection.close()
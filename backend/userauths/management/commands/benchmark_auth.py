@@ -0,0 +1,98 @@
+import time
+from contextlib import nullcontext
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from userauths.claims import CLAIMS_KEY
+from userauths.models import User
+from userauths.views import MyTokenObtainPairView, MyTokenRefreshView
+from vendor.models import Vendor
+
+
+PASSWORD = "bench-password-1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time login (token obtain) and token refresh requests and count their queries, for vendor and "
+        "non-vendor users, with cold and warm claim caches. Users are created in a transaction that is "
+        "rolled back, so the configured database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per scenario.")
+        parser.add_argument(
+            '--real-hasher', action='store_true',
+            help="Keep the configured password hasher. By default a fast one is used, so the timings show "
+                 "the token path rather than PBKDF2.",
+        )
+
+    def handle(self, *args, **options):
+        fast_hasher = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+        with nullcontext() if options['real_hasher'] else fast_hasher:
+            with transaction.atomic():
+                users = self.seed(options['users'])
+                self.benchmark(users, options['requests'])
+                transaction.set_rollback(True)
+
+    def seed(self, count):
+        users = [User(email=f"authbench{i}@example.com", username=f"authbench{i}") for i in range(count)]
+        for user in users:
+            user.set_password(PASSWORD)
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(username__startswith="authbench").order_by('pk'))
+        Vendor.objects.bulk_create(
+            [Vendor(user=user, name=f"Bench vendor {i}", slug=f"authbench-vendor-{i}") for i, user in enumerate(users[::2])]
+        )
+        return users
+
+    def benchmark(self, users, count):
+        factory = APIRequestFactory()
+        login = MyTokenObtainPairView.as_view()
+        refresh = MyTokenRefreshView.as_view()
+        tokens = {}
+
+        def do_login(user):
+            response = login(factory.post('/api/v1/user/token/', {'email': user.email, 'password': PASSWORD}, format='json'))
+            tokens[user.pk] = response.data['refresh']
+            return response
+
+        def do_refresh(user):
+            response = refresh(factory.post('/api/v1/user/token/refresh', {'refresh': tokens[user.pk]}, format='json'))
+            tokens[user.pk] = response.data['refresh']
+            return response
+
+        vendors = users[::2]
+        customers = users[1::2]
+        for label, action, group, warm in [
+            ("login, customer, cold claims", do_login, customers, False),
+            ("login, vendor, cold claims", do_login, vendors, False),
+            ("login, customer, warm claims", do_login, customers, True),
+            ("refresh, customer, cold claims", do_refresh, customers, False),
+            ("refresh, vendor, warm claims", do_refresh, vendors, True),
+        ]:
+            self.scenario(label, action, group, count, warm)
+
+    def scenario(self, label, action, users, count, warm):
+        if not warm:
+            cache.delete_many([CLAIMS_KEY % user.pk for user in users])
+        with CaptureQueriesContext(connection) as queries:
+            response = action(users[0])
+        if response.status_code != 200:
+            self.stderr.write(f"{label}: HTTP {response.status_code} {response.data}")
+            return
+
+        started = time.perf_counter()
+        for i in range(count):
+            if not warm and i % len(users) == 0:
+                cache.delete_many([CLAIMS_KEY % user.pk for user in users])
+            action(users[i % len(users)])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<34} {count / elapsed:>8.1f} req/s  {elapsed * 1000 / count:>7.2f} ms/req  {len(queries)} queries"
+        )
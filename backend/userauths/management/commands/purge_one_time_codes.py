@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from userauths.mail import purge_finished
+from userauths.otp import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired one-time codes, and sent or failed email older than userauths.mail.RETENTION."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired one-time codes."))
+        deleted = purge_finished()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} finished outbox emails."))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from userauths.mail import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Deliver queued transactional email. Runs until interrupted unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once no message is due.")
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to wait when nothing is due.")
+        parser.add_argument('--idle-close', type=float, default=60.0, help="Close the mail connection after this many idle seconds.")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'])
+        delivered = 0
+        idle_since = None
+        try:
+            while True:
+                claimed = worker.run_once()
+                delivered += claimed
+                if claimed:
+                    idle_since = None
+                    continue
+                if options['once']:
+                    break
+                if idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > options['idle_close']:
+                    worker.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {delivered} queued emails."))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:35
+
+from django.db import migrations
+import userauths.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userauths", "0005_one_time_codes"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", userauths.models.UserManager()),
+            ],
+        ),
+    ]
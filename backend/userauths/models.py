@@ -1,10 +1,20 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+from django.utils import timezone
+from django.db.models.signals import post_delete, post_save
 
 from shortuuid.django_fields import ShortUUIDField
 
+from userauths.claims import CLAIM_FIELDS, invalidate_claims
+
 # Create your models here.
+class UserManager(BaseUserManager):
+
+    def get_by_natural_key(self, username):
+        # Authentication loads the vendor too; the JWT claims need it.
+        return self.select_related('vendor').get(**{self.model.USERNAME_FIELD: username})
+
+
 class User(AbstractUser):
     """
     Custom User model that extends AbstractUser.
@@ -14,12 +24,15 @@ class User(AbstractUser):
         email (EmailField): Unique email address for the user.
         full_name (CharField): Full name of the user.
         phone (CharField): Phone number of the user.
+
+    One-time codes (password reset OTPs) live in OneTimeCode, not on the user.
     """
     username = models.CharField(unique=True, max_length=100)
     email = models.EmailField(unique=True)
     full_name = models.CharField(max_length=100, null=True, blank=True)
     phone = models.CharField(max_length=15, null=True, blank=True)
-    otp = models.CharField(max_length=15, null=True, blank=True)
+
+    objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -185,25 +198,127 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
     
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
     """
-    Signal handler to save the Profile instance when the associated User instance
-    is saved.
+    Signal handler to keep the Profile in step when the associated User
+    instance is saved.
 
-    Listens for the post_save signal from the User model and saves the associated
-    Profile instance.
+    The only profile state derived from the user is the default full_name
+    (see Profile.save), so the profile is written only when the user's
+    full_name may have changed and the profile has none of its own, with a
+    single UPDATE instead of loading and re-saving the profile. Saves with
+    `update_fields` that leave full_name out (OTP, password, last_login)
+    touch no profile at all.
 
     Args:
 
         sender: The User model class.
         instance: The User instance that triggered the signal.
+        created: A boolean indicating whether the User instance was newly created.
+        update_fields: The fields passed to save(), or None for a full save.
         **kwargs: Additional keyword arguments.
 
     Returns:
         None
     """
-    instance.profile.save()
+    if created or (update_fields is not None and 'full_name' not in update_fields):
+        return
+    Profile.objects.filter(user=instance).filter(
+        models.Q(full_name='') | models.Q(full_name__isnull=True)
+    ).update(full_name=instance.full_name)
+
+def invalidate_user_claims(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Signal handler to drop the cached JWT claims of a saved or deleted user,
+    unless a save only touched fields that are not claims (password,
+    last_login).
+    """
+    if not created and (update_fields is None or CLAIM_FIELDS.intersection(update_fields)):
+        invalidate_claims(instance.pk)
 
 post_save.connect(create_user_profile, sender=User)
 post_save.connect(save_user_profile, sender=User)
+post_save.connect(invalidate_user_claims, sender=User)
+post_delete.connect(invalidate_user_claims, sender=User)
+
+
+class OutboundEmail(models.Model):
+    """
+    Transactional email waiting in the outbox.
+
+    Requests only insert a row, in the same transaction as the change that
+    triggers the email; the `send_queued_email` worker renders the templates
+    and delivers it (see userauths.mail).
 
+    Attributes:
+        template (CharField): Template name without extension; `<template>.txt`
+            and, if it exists, `<template>.html` are rendered.
+        subject (CharField): Subject line.
+        to (EmailField): Recipient address.
+        context (JSONField): Template context, cleared once the message is sent
+            or given up on.
+        status (CharField): queued, sent or failed (gave up after MAX_ATTEMPTS).
+        attempts (PositiveSmallIntegerField): Delivery attempts so far.
+        next_attempt_at (DateTimeField): When the message is next due. A worker
+            claiming a message pushes this forward by its lease, so messages of a
+            crashed worker become due again.
+        claim (CharField): Token of the worker batch that last claimed the message.
+        last_error (TextField): Error of the last failed attempt.
+        created (DateTimeField): When the message was queued.
+        sent_at (DateTimeField): When the message was delivered.
+    """
+    STATUS = (
+        ("queued", "Queued"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    )
+
+    template = models.CharField(max_length=100)
+    subject = models.CharField(max_length=255)
+    to = models.EmailField()
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status="queued"), name="userauths_email_due_idx"),
+            models.Index(fields=['claim'], name="userauths_email_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to}"
+
+
+class OneTimeCode(models.Model):
+    """
+    Short-lived code sent to a user, e.g. the password reset OTP.
+
+    There is at most one live code per user and purpose; issuing a new one
+    replaces it. Only an HMAC of the code is stored (see userauths.otp).
+
+    Attributes:
+        user (ForeignKey): The user the code was issued to.
+        purpose (CharField): What the code is for, e.g. "password_reset".
+        digest (CharField): HMAC-SHA256 of the code, hex encoded.
+        attempts (PositiveSmallIntegerField): Failed verification attempts.
+        expires_at (DateTimeField): When the code stops being accepted.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="one_time_codes")
+    purpose = models.CharField(max_length=30)
+    digest = models.CharField(max_length=64)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'purpose'], name="userauths_code_user_purpose_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.purpose} code for user {self.user_id}"
@@ -0,0 +1,91 @@
+"""
+One-time codes (password reset OTPs) with expiry and attempt limits.
+
+Codes are kept in their own OneTimeCode table instead of on the User row,
+one row per (user, purpose), so issuing or checking a code never writes the
+user and verification is a single lookup on that unique key.
+
+Only an HMAC of the code, keyed with SECRET_KEY and bound to the user and
+purpose, is stored, and codes are compared in constant time. A code is
+rejected once it has expired or MAX_ATTEMPTS wrong guesses were made, and
+is deleted when it is used, so it works exactly once. Expired rows are
+removed when they are next looked at, or in bulk by `purge_expired()` (the
+`purge_one_time_codes` command).
+"""
+
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from userauths.models import OneTimeCode
+
+
+PASSWORD_RESET = "password_reset"
+
+CODE_LENGTH = 7
+TTL = 15 * 60
+MAX_ATTEMPTS = 5
+
+
+def generate_code(length=CODE_LENGTH):
+    return ''.join(secrets.choice('0123456789') for _ in range(length))
+
+
+def code_digest(user_id, purpose, code):
+    message = f"{user_id}:{purpose}:{code}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def issue_code(user, purpose, ttl=TTL):
+    """
+    Create a new code for `user` and `purpose`, replacing any earlier one,
+    and return it. One INSERT ... ON CONFLICT statement.
+    """
+    code = generate_code()
+    OneTimeCode.objects.bulk_create(
+        [OneTimeCode(
+            user=user, purpose=purpose, digest=code_digest(user.pk, purpose, code),
+            attempts=0, expires_at=timezone.now() + timedelta(seconds=ttl),
+        )],
+        update_conflicts=True,
+        unique_fields=['user', 'purpose'],
+        update_fields=['digest', 'attempts', 'expires_at'],
+    )
+    return code
+
+
+def use_code(user_id, purpose, code):
+    """
+    Check `code` and consume it. Returns the user on success, else None.
+    """
+    try:
+        stored = OneTimeCode.objects.select_related('user').get(user_id=user_id, purpose=purpose)
+    except (OneTimeCode.DoesNotExist, ValueError):
+        return None
+
+    if stored.expires_at <= timezone.now():
+        stored.delete()
+        return None
+
+    # Take an attempt before comparing, so concurrent guesses cannot get
+    # past the limit.
+    attempt = OneTimeCode.objects.filter(pk=stored.pk, attempts__lt=MAX_ATTEMPTS)
+    if not attempt.update(attempts=models.F('attempts') + 1):
+        return None
+    if not hmac.compare_digest(stored.digest, code_digest(stored.user_id, purpose, str(code))):
+        return None
+
+    # Deleting is what redeems the code: of two concurrent requests with the
+    # right code only the one that removes the row succeeds.
+    deleted, _ = OneTimeCode.objects.filter(pk=stored.pk, digest=stored.digest).delete()
+    return stored.user if deleted else None
+
+
+def purge_expired():
+    deleted, _ = OneTimeCode.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,9 +1,14 @@
 from userauths.models import Profile, User
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from userauths.claims import user_claims
 
 # Define a custom serializer that inherits from TokenObtainPairSerializer
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -11,17 +16,28 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
+        token.payload.update(user_claims(user))
+        return token
 
-        token['full_name'] = user.full_name
-        token['email'] = user.email
-        token['username'] = user.username
-        try:
-            token['vendor_id'] = user.vendor.id
-        except:
-            token['vendor_id'] = 0
 
+class CurrentClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token whose custom claims are brought up to date when it is read,
+    so the access and rotated refresh tokens issued from it carry the user's
+    current claims.
+    """
 
-        return token
+    def __init__(self, token=None, verify=True):
+        super().__init__(token, verify)
+        if token is not None:
+            claims = user_claims(self.payload[api_settings.USER_ID_CLAIM])
+            if claims is None:
+                raise TokenError(_("User not found"))
+            self.payload.update(claims)
+
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CurrentClaimsRefreshToken
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -38,7 +54,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create(
+        user = User(
             full_name=validated_data['full_name'],
             email=validated_data['email'],
             phone=validated_data['phone']
@@ -46,6 +62,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         email_username, mobile = user.email.split('@')
         user.username = email_username
 
+        # One INSERT (plus the profile's) instead of an INSERT and a full UPDATE.
         user.set_password(validated_data['password'])
         user.save()
 
@@ -1,3 +1,126 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from userauths.mail import MAX_ATTEMPTS, OutboxWorker, claim_batch, purge_finished
+from userauths.models import OutboundEmail, User
+from vendor.models import Vendor
+
+
+class AuthQueryTests(TestCase):
+    """
+    Query budgets of the auth endpoints, so a change that adds a lookup per
+    request shows up here.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="ama", email="ama@example.com", password="password", full_name="Ama")
+
+    def login(self):
+        return self.client.post("/api/v1/user/token/", {"email": "ama@example.com", "password": "password"})
+
+    def test_login(self):
+        # The user with its vendor, and the outstanding refresh token.
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        claims = AccessToken(response.data['access'])
+        self.assertEqual((claims['full_name'], claims['vendor_id']), ("Ama", 0))
+
+    def test_refresh_uses_cached_claims(self):
+        refresh = self.login().data['refresh']
+        # Blacklist check and rotation; the claims come from the cache.
+        with self.assertNumQueries(6):
+            response = self.client.post("/api/v1/user/token/refresh", {"refresh": refresh})
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_picks_up_new_claims(self):
+        refresh = self.login().data['refresh']
+        with self.captureOnCommitCallbacks(execute=True):
+            vendor = Vendor.objects.create(user=self.user, name="Ama's")
+        # One more query to load the user, since the cached claims were dropped.
+        with self.assertNumQueries(7):
+            response = self.client.post("/api/v1/user/token/refresh", {"refresh": refresh})
+        self.assertEqual(AccessToken(response.data['access'])['vendor_id'], vendor.pk)
+
+    def test_register(self):
+        data = {"full_name": "Kofi", "email": "kofi@example.com", "phone": "1", "password": "Str0ng-pass!", "password2": "Str0ng-pass!"}
+        # Unique email check, the user and its profile.
+        with self.assertNumQueries(3):
+            response = self.client.post("/api/v1/user/register/", data)
+        self.assertEqual(response.status_code, 201)
+
+    def test_password_reset_and_change(self):
+        with mock.patch('userauths.otp.generate_code', return_value="1234567"):
+            with self.assertNumQueries(7):
+                response = self.client.get("/api/v1/user/password-reset/ama@example.com/")
+        self.assertEqual(response.status_code, 200)
+
+        data = {"otp": "1234567", "uidb64": self.user.pk, "password": "n3w-password"}
+        # Code lookup, attempt count, using the code up, and the password.
+        with self.assertNumQueries(4):
+            response = self.client.post("/api/v1/user/password-change/", data)
+        self.assertEqual(response.status_code, 201)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("n3w-password"))
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username="ama", email="ama@example.com", password="password")
+        with mock.patch('userauths.otp.generate_code', return_value="1234567"):
+            APIClient().get("/api/v1/user/password-reset/ama@example.com/")
+        self.worker = OutboxWorker(connection=get_connection())
+
+    def test_sent_messages_keep_no_reset_link(self):
+        self.assertIn("1234567", OutboundEmail.objects.get().context['link'])
+        self.assertEqual(self.worker.run_once(), 1)
+        self.assertIn("1234567", mail.outbox[0].body)
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.context), ("sent", {}))
+
+    def test_claimed_messages_are_leased(self):
+        self.assertEqual(len(claim_batch(10, lease=60)), 1)
+        self.assertEqual(claim_batch(10), [])
+        # The worker holding the claim died; the message is due again once the lease runs out.
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(claim_batch(10)), 1)
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        with mock.patch.object(OutboxWorker, 'send', side_effect=OSError("refused")):
+            self.assertEqual(self.worker.run_once(), 1)
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ("queued", 1))
+        self.assertIn("OSError: refused", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(self.worker.run_once(), 0)
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.worker.run_once(), 1)
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts, email.last_error), ("sent", 2, ""))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_messages_given_up_on_keep_no_reset_link(self):
+        OutboundEmail.objects.update(attempts=MAX_ATTEMPTS - 1)
+        with mock.patch.object(OutboxWorker, 'send', side_effect=OSError("refused")):
+            self.worker.run_once()
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.context), ("failed", {}))
+
+    def test_purge_deletes_old_finished_messages(self):
+        self.worker.run_once()
+        self.assertEqual(purge_finished(), 0)
+        OutboundEmail.objects.update(created=timezone.now() - timedelta(days=8))
+        self.assertEqual(purge_finished(), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
@@ -1,38 +1,41 @@
 from django.shortcuts import render
 from django.http import JsonResponse
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.conf import settings
-from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode
-from django.utils.encoding import force_bytes
+from django.db import transaction
 
 # Rest Framework imports
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework import generics
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework_simplejwt.tokens import RefreshToken
 
 # Others
 import json
-import random
 
 # Serializers
-from userauths.serializer import MyTokenObtainPairSerializer, ProfileSerializer, RegisterSerializer, UserSerializer
+from userauths.serializer import MyTokenObtainPairSerializer, MyTokenRefreshSerializer, ProfileSerializer, RegisterSerializer, UserSerializer
 
 # Models
 from userauths.models import Profile, User
 
+from userauths.mail import queue_email
+from userauths.otp import PASSWORD_RESET, issue_code, use_code
+
 class MyTokenObtainPairView(TokenObtainPairView):
     """
     Custom view to handle JWT token retrieval using a custom serializer.
     """
     serializer_class = MyTokenObtainPairSerializer
 
+class MyTokenRefreshView(TokenRefreshView):
+    """
+    Token refresh that re-issues tokens with the user's current claims.
+    """
+    serializer_class = MyTokenRefreshSerializer
+
 class RegisterView(generics.CreateAPIView):
     """
     View to handle user registration.
@@ -89,13 +92,6 @@ class ProfileView(generics.RetrieveAPIView):
         profile = Profile.objects.get(user=user)
         return profile
 
-def generate_numeric_otp(length=7):
-    """
-    Generates a numeric OTP of the specified length.
-    """
-    otp = ''.join([str(random.randint(0, 9)) for _ in range(length)])
-    return otp
-
 class PasswordEmailVerify(generics.RetrieveAPIView):
     """
     View to handle password reset email verification.
@@ -108,36 +104,16 @@ class PasswordEmailVerify(generics.RetrieveAPIView):
         email = self.kwargs['email']
         user = User.objects.get(email=email)
         if user:
-            user.otp = generate_numeric_otp()
-            user.save()
-            uidb64 = user.pk
-
-            # Generate reset token
-            refresh = RefreshToken.for_user(user)
-            reset_token = str(refresh.access_token)
-
-            # Store token in the user model
-            user.reset_token = reset_token
-            user.save()
-
-            link = f"http://localhost:5173/create-new-password?otp={user.otp}&uidb64={uidb64}"
-            # merge_data = {
-            #     'link': link,
-            #     'username': user.username,
-            # }
-            # subject = "Password Reset Request"
-            # text_body = render_to_string("email/password_reset.txt", merge_data)
-            # html_body = render_to_string("email/password_reset.html", merge_data)
-
-            # # Send email
-            # msg = EmailMultiAlternatives(
-            #     subject=subject, from_email=settings.FROM_EMAIL,
-            #     to=[user.email], body=text_body
-            # )
-            # msg.attach_alternative(html_body, "text/html")
-            # msg.send()
-
-            print(f"Reset Link: {link}")
+            with transaction.atomic():
+                otp = issue_code(user, PASSWORD_RESET)
+                uidb64 = user.pk
+
+                link = f"http://localhost:5173/create-new-password?otp={otp}&uidb64={uidb64}"
+                # Rendered and sent by the send_queued_email worker.
+                queue_email(
+                    "email/password_reset", user.email, "Password Reset Request",
+                    {'link': link, 'username': user.username},
+                )
         return user
 
 class PasswordChangeView(generics.CreateAPIView):
@@ -155,8 +131,9 @@ class PasswordChangeView(generics.CreateAPIView):
 
         - otp: The one time password sent to the user's email.
         - uidb64: The base64 encoded user ID.
-        - reset_token: The reset token used to verify the request.
         - password: The new password to be set.
+        The OTP is used up by a successful change and expires after
+        userauths.otp.TTL seconds or MAX_ATTEMPTS wrong guesses.
         Returns a successful response if the password change is successful,
         otherwise returns a 500 error response with an error message.
         """
@@ -164,15 +141,12 @@ class PasswordChangeView(generics.CreateAPIView):
         payload = request.data
         otp = payload['otp']
         uidb64 = payload['uidb64']
-        reset_token = payload['reset_token']
         password = payload['password']
 
-        user = User.objects.get(id=uidb64, otp=otp)
+        user = use_code(uidb64, PASSWORD_RESET, otp)
         if user:
             user.set_password(password)
-            user.otp = ""
-            user.reset_token = ""
-            user.save()
+            user.save(update_fields=['password'])
             return Response({"message": "Password Changed Successfully"}, status=status.HTTP_201_CREATED)
         else:
             return Response({"message": "An Error Occurred"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)